@@ -1,9 +1,19 @@
 """
 Analyze the transcription results CSV for benchmarking
+
+If a columnar copy made by results_table.py (transcription_path.parquet or
+.arrow) is newer than the CSV, it is used instead, reading only the columns
+the statistics need: no text parsing, and the transcripts themselves are
+only read for the sample rows.
+
+Usage:
+    python analyze_results.py                           # columnar copy if up to date, else the CSV
+    python analyze_results.py results.parquet           # a specific CSV, Parquet or Arrow file
 """
 
 import pandas as pd
 import os
+import sys
 from pathlib import Path
 
 try:
@@ -11,31 +21,73 @@ try:
 except ImportError:
     CSV_OUTPUT_PATH = r"D:\cv_eval_bn\transcription_path.csv"
 
+try:
+    from results_table import read_results, read_head, table_path_for
+except ImportError:
+    read_results = None  # pyarrow not installed: CSV only
+
+# Columns the statistics use; everything else in a columnar file is left unread
+ANALYSIS_COLUMNS = ['success', 'audio_length_seconds', 'api_response_time_seconds', 'transcript_chars',
+                    'error_code']
+SAMPLE_COLUMNS = ['audio_file_path', 'success', 'transcript']
+
+
+def find_results_file():
+    """The CSV, or its columnar copy if that exists and is newer"""
+    if read_results is not None:
+        for file_format in ('parquet', 'arrow'):
+            table_path = table_path_for(CSV_OUTPUT_PATH, file_format)
+            if table_path.exists() and (not os.path.exists(CSV_OUTPUT_PATH)
+                                        or table_path.stat().st_mtime >= os.path.getmtime(CSV_OUTPUT_PATH)):
+                return str(table_path)
+    return CSV_OUTPUT_PATH
 
-def analyze_results():
+
+def load_results(results_path):
+    """Statistics columns as a DataFrame, plus up to 5 successful rows for the samples"""
+    if Path(results_path).suffix in ('.parquet', '.arrow', '.feather'):
+        df = read_results(results_path, ANALYSIS_COLUMNS).to_pandas()
+        head = read_head(results_path, SAMPLE_COLUMNS, 100).to_pandas()
+        return df, head[head['success']].head(5)
+    
+    df = pd.read_csv(results_path)
+    df['success'] = df['transcription_file_path'] != 'ERROR'
+    # Convert to numeric (handle 'N/A' values)
+    df['audio_length_seconds'] = pd.to_numeric(df['audio_length_seconds'], errors='coerce')
+    df['api_response_time_seconds'] = pd.to_numeric(df['api_response_time_seconds'], errors='coerce')
+    df['transcript_chars'] = df['transcript'].str.len()
+    return df, df[df['success']].head(5)
+
+
+def analyze_results(results_path=None):
     """Analyze the transcription results"""
+    results_path = results_path or find_results_file()
     
-    if not os.path.exists(CSV_OUTPUT_PATH):
-        print(f"ERROR: CSV file not found: {CSV_OUTPUT_PATH}")
+    if not os.path.exists(results_path):
+        print(f"ERROR: CSV file not found: {results_path}")
         print("Run batch_transcribe_v2.py first to generate results.")
         return
     
     print("=" * 80)
     print("TRANSCRIPTION RESULTS ANALYSIS")
     print("=" * 80)
-    print(f"CSV file: {CSV_OUTPUT_PATH}\n")
+    print(f"Results file: {results_path}\n")
     
-    # Load CSV
-    df = pd.read_csv(CSV_OUTPUT_PATH)
+    # Load CSV or columnar copy
+    df, samples = load_results(results_path)
     
     # Basic statistics
     total_files = len(df)
-    successful = (df['transcription_file_path'] != 'ERROR').sum()
+    successful = df['success'].sum()
     failed = total_files - successful
     
     print(f"Total files processed: {total_files}")
     print(f"Successful: {successful} ({successful/total_files*100:.1f}%)")
     print(f"Failed: {failed} ({failed/total_files*100:.1f}%)")
+    if failed and 'error_code' in df:
+        for code, count in df['error_code'].value_counts().items():
+            if count:
+                print(f"  {code:>12}: {count}")
     print()
     
     if successful == 0:
@@ -43,11 +95,7 @@ def analyze_results():
         return
     
     # Filter successful transcriptions
-    df_success = df[df['transcription_file_path'] != 'ERROR'].copy()
-    
-    # Convert to numeric (handle 'N/A' values)
-    df_success['audio_length_seconds'] = pd.to_numeric(df_success['audio_length_seconds'], errors='coerce')
-    df_success['api_response_time_seconds'] = pd.to_numeric(df_success['api_response_time_seconds'], errors='coerce')
+    df_success = df[df['success']].copy()
     
     # Calculate RTF (Real-Time Factor)
     df_success['rtf'] = df_success['api_response_time_seconds'] / df_success['audio_length_seconds']
@@ -109,9 +157,8 @@ def analyze_results():
     # Transcript statistics
     print("TRANSCRIPT STATISTICS")
     print("-" * 80)
-    df_success['transcript_length'] = df_success['transcript'].str.len()
-    avg_transcript_length = df_success['transcript_length'].mean()
-    median_transcript_length = df_success['transcript_length'].median()
+    avg_transcript_length = df_success['transcript_chars'].mean()
+    median_transcript_length = df_success['transcript_chars'].median()
     
     print(f"Average transcript length: {avg_transcript_length:.0f} characters")
     print(f"Median transcript length: {median_transcript_length:.0f} characters")
@@ -143,7 +190,7 @@ def analyze_results():
     # Show sample transcripts
     print("SAMPLE TRANSCRIPTS (first 5)")
     print("-" * 80)
-    for idx, row in df_success.head(5).iterrows():
+    for idx, row in samples.iterrows():
         filename = Path(row['audio_file_path']).name
         transcript = row['transcript'][:100] + '...' if len(row['transcript']) > 100 else row['transcript']
         print(f"{filename}: {transcript}")
@@ -153,7 +200,7 @@ def analyze_results():
 
 if __name__ == "__main__":
     try:
-        analyze_results()
+        analyze_results(sys.argv[1] if len(sys.argv) > 1 else None)
     except Exception as e:
         print(f"\nError analyzing results: {e}")
         import traceback
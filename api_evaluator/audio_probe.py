@@ -0,0 +1,271 @@
+"""
+Header-only audio duration probe
+
+Reads container headers (and, for MP3 and Ogg, a frame header or the last
+page) instead of decoding audio, so probing a whole corpus costs a few KB
+of I/O per file:
+
+- WAV:  fmt and data chunk sizes (RIFF chunks are walked, not assumed)
+- FLAC: total samples and sample rate from STREAMINFO
+- MP3:  frame count from a Xing/Info or VBRI header, else constant bitrate
+        from the first frame header over the audio bytes (ID3 tags skipped)
+- Ogg:  granule position of the last page over the sample rate from the
+        Vorbis, Opus or FLAC identification header
+
+The format is detected from the file's first bytes, not its extension.
+probe_duration() returns None for anything it cannot read; callers fall
+back to their own estimate.
+
+Usage:
+    python audio_probe.py D:\\cv_eval_bn\\validated       # probe every audio file under a folder
+    python audio_probe.py clip1.mp3 clip2.wav            # probe single files
+"""
+
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    from config import AUDIO_EXTENSIONS
+except ImportError:
+    AUDIO_EXTENSIONS = ['.wav', '.flac']
+
+# Threads used by probe_durations(); probing is I/O-bound
+PROBE_WORKERS = 16
+
+# Bytes read from the end of an Ogg file to find its last page
+OGG_TAIL_BYTES = 65536
+
+# MPEG audio header tables, indexed by version (1, 2, 2.5) and layer (1-3)
+MPEG_VERSIONS = {0: 2.5, 2: 2, 3: 1}
+MPEG_SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 2.5: [11025, 12000, 8000]}
+MPEG_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MPEG_BITRATES[(2, 3)] = MPEG_BITRATES[(2, 2)]
+
+
+def probe_duration(audio_path):
+    """Duration in seconds from the file's headers, or None if it cannot be determined"""
+    try:
+        with open(audio_path, 'rb') as f:
+            head = f.read(12)
+            f.seek(0)
+            if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+                return _wav_duration(f)
+            if head[:4] == b'fLaC':
+                return _flac_duration(f)
+            if head[:4] == b'OggS':
+                return _ogg_duration(f)
+            if head[:3] == b'ID3' or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+                return _mp3_duration(f)
+    except (OSError, struct.error, ValueError, IndexError, ZeroDivisionError):
+        pass
+    return None
+
+
+def probe_durations(files, workers=PROBE_WORKERS):
+    """probe_duration() over many files in a thread pool
+
+    Returns:
+        {file: duration in seconds or None}, in the order of files
+    """
+    files = list(files)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(files, executor.map(probe_duration, files)))
+
+
+def _wav_duration(f):
+    f.seek(12)
+    byte_rate = None
+    block_align = None
+    file_size = os.fstat(f.fileno()).st_size
+
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        chunk_id, size = struct.unpack('<4sI', header)
+        if chunk_id == b'fmt ':
+            fmt = f.read(16)
+            _, _, _, byte_rate, block_align = struct.unpack('<HHIIH', fmt[:14])
+            f.seek(size - 16 + (size & 1), 1)
+        elif chunk_id == b'data':
+            if not byte_rate:
+                return None
+            # Streamed WAVs may leave the data size at 0 or 0xFFFFFFFF
+            available = file_size - f.tell()
+            if size == 0 or size > available:
+                size = available
+            if block_align:
+                size -= size % block_align
+            return size / float(byte_rate)
+        else:
+            f.seek(size + (size & 1), 1)
+
+
+def _flac_duration(f):
+    f.seek(4)
+    header = f.read(4)
+    if len(header) < 4 or header[0] & 0x7F != 0:
+        return None  # STREAMINFO is always the first metadata block
+    return _streaminfo_duration(f.read(34))
+
+
+def _streaminfo_duration(streaminfo):
+    """Duration from a 34-byte FLAC STREAMINFO block; None if the encoder left the sample count out"""
+    packed = int.from_bytes(streaminfo[10:18], 'big')
+    sample_rate = packed >> 44
+    total_samples = packed & 0xFFFFFFFFF
+    if not sample_rate or not total_samples:
+        return None
+    return total_samples / float(sample_rate)
+
+
+def _mp3_duration(f):
+    file_size = os.fstat(f.fileno()).st_size
+    start = 0
+    header = f.read(10)
+    while header[:3] == b'ID3':
+        # Syncsafe tag size, plus a 10-byte footer if the footer flag is set
+        size = ((header[6] & 0x7F) << 21) | ((header[7] & 0x7F) << 14) | ((header[8] & 0x7F) << 7) | (header[9] & 0x7F)
+        start += 10 + size + (10 if header[5] & 0x10 else 0)
+        f.seek(start)
+        header = f.read(10)
+
+    # First frame sync within the next 64 KB (encoders sometimes pad after the tag)
+    f.seek(start)
+    data = f.read(65536)
+    frame = _find_mpeg_frame(data)
+    if frame is None:
+        return None
+    offset, version, layer, bitrate, sample_rate, mono = frame
+    samples_per_frame = 384 if layer == 1 else 1152 if layer == 2 or version == 1 else 576
+
+    # Xing/Info header sits after the side information of the first frame
+    side_info = (17 if mono else 32) if version == 1 else (9 if mono else 17)
+    xing = offset + 4 + side_info
+    if data[xing:xing + 4] in (b'Xing', b'Info'):
+        flags = struct.unpack('>I', data[xing + 4:xing + 8])[0]
+        if flags & 1:
+            samples = struct.unpack('>I', data[xing + 8:xing + 12])[0] * samples_per_frame
+            # Optional byte count, TOC and quality fields come before the LAME tag
+            lame = xing + 12 + (4 if flags & 2 else 0) + (100 if flags & 4 else 0) + (4 if flags & 8 else 0)
+            if data[lame:lame + 4] == b'LAME':
+                # 12-bit encoder delay and padding, in samples
+                packed = int.from_bytes(data[lame + 21:lame + 24], 'big')
+                samples = max(0, samples - (packed >> 12) - (packed & 0xFFF))
+            return samples / float(sample_rate)
+    vbri = data[offset + 36:offset + 36 + 18]
+    if vbri[:4] == b'VBRI':
+        frames = struct.unpack('>I', vbri[14:18])[0]
+        return frames * samples_per_frame / float(sample_rate)
+
+    if not bitrate:
+        return None
+    audio_bytes = file_size - start - offset
+    f.seek(-128, 2)
+    if f.read(3) == b'TAG':
+        audio_bytes -= 128
+    return audio_bytes * 8 / float(bitrate * 1000)
+
+
+def _find_mpeg_frame(data):
+    """(offset, version, layer, kbps, sample rate, mono) of the first valid frame header in data"""
+    position = data.find(b'\xff')
+    while 0 <= position < len(data) - 4:
+        b1, b2, b3 = data[position + 1], data[position + 2], data[position + 3]
+        version = MPEG_VERSIONS.get((b1 >> 3) & 3)
+        layer = 4 - ((b1 >> 1) & 3)
+        bitrate_index = b2 >> 4
+        rate_index = (b2 >> 2) & 3
+        if b1 & 0xE0 == 0xE0 and version and layer != 4 and bitrate_index != 15 and rate_index != 3:
+            bitrate = MPEG_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index]
+            return position, version, layer, bitrate, MPEG_SAMPLE_RATES[version][rate_index], b3 >> 6 == 3
+        position = data.find(b'\xff', position + 1)
+    return None
+
+
+def _ogg_duration(f):
+    # The first page carries the codec's identification header
+    first_page = f.read(4096)
+    segments = first_page[26]
+    packet = first_page[27 + segments:]
+    pre_skip = 0
+    if packet[:7] == b'\x01vorbis':
+        sample_rate = struct.unpack('<I', packet[12:16])[0]
+    elif packet[:8] == b'OpusHead':
+        # Opus granule positions always count 48 kHz samples
+        sample_rate = 48000
+        pre_skip = struct.unpack('<H', packet[10:12])[0]
+    elif packet[:5] == b'\x7fFLAC':
+        sample_rate = int.from_bytes(packet[27:30], 'big') >> 4
+    else:
+        return None
+    if not sample_rate:
+        return None
+
+    file_size = os.fstat(f.fileno()).st_size
+    f.seek(max(0, file_size - OGG_TAIL_BYTES))
+    tail = f.read()
+    last_page = tail.rfind(b'OggS')
+    while last_page >= 0:
+        granule = struct.unpack('<q', tail[last_page + 6:last_page + 14])[0]
+        if granule >= 0:
+            return max(0, granule - pre_skip) / float(sample_rate)
+        # -1: no packet ends on this page
+        last_page = tail.rfind(b'OggS', 0, last_page)
+    return None
+
+
+def find_audio_files(paths):
+    """Audio files (by AUDIO_EXTENSIONS) under the given folders, plus any files given directly"""
+    extensions = {ext.lower() for ext in AUDIO_EXTENSIONS}
+    files = []
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            files.extend(sorted(p for p in path.rglob('*') if p.suffix.lower() in extensions))
+        else:
+            files.append(path)
+    return files
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+
+    files = find_audio_files(sys.argv[1:])
+    start = time.time()
+    durations = probe_durations(files)
+    elapsed = time.time() - start
+
+    by_format = {}
+    for audio_file, duration in durations.items():
+        if len(files) <= 20:
+            shown = f"{duration:.3f}s" if duration is not None else 'unknown'
+            print(f"  {shown:>12}  {audio_file}")
+        counts = by_format.setdefault(audio_file.suffix.lower(), [0, 0, 0.0])
+        counts[0] += 1
+        if duration is not None:
+            counts[1] += 1
+            counts[2] += duration
+
+    print("=" * 80)
+    print(f"Probed {len(files)} files in {elapsed:.2f}s "
+          f"({len(files) / elapsed if elapsed else 0:.0f} files/s, {PROBE_WORKERS} threads)")
+    for suffix, (count, known, seconds) in sorted(by_format.items()):
+        print(f"  {suffix:<6} {count:>7} files, {known:>7} with duration, {seconds / 3600:.2f} hours")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
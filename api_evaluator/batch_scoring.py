@@ -0,0 +1,394 @@
+"""
+Batch CER/WER scoring in NumPy
+
+compare_output.py scores one pair at a time in Python and prints every
+response it reads, which takes tens of minutes on a full Common Voice
+split. score_pairs() scores whole arrays of reference/hypothesis pairs:
+
+- Characters are mapped to their code points (one UTF-32 encode for all
+  texts), words to integer IDs from one shared vocabulary.
+- Pairs are sorted into batches of up to BATCH_SIZE by reference length in
+  64-token blocks, then by hypothesis length, so little work is wasted on
+  padding.
+- Each batch runs Myers' bit-parallel edit distance with one uint64 per
+  64 reference tokens per pair: a step per hypothesis token covers every
+  pair of the batch at once.
+
+Errors are edit distances (substitutions + deletions + insertions) and the
+rates are errors / reference length, as in compare_output.py without
+--legacy: texts go through normalize_text(), are stripped and words split on
+any whitespace. Use compare_output.py for the S/D/I breakdown of single
+files.
+
+--rule-report scores the corpus once per normalization rule, adding the
+rules one at a time and leaving each one out, to show what each rule does
+to corpus CER/WER.
+
+Usage:
+    python batch_scoring.py --base ../Final_data_MRK/text --api-output ../Final_data_MRK/api_response
+    python batch_scoring.py --pairs pairs.csv --reference-column annotated --hypothesis-column generated
+    python batch_scoring.py --rule-report
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+
+from text_normalization import RULES, TextNormalizer, normalize_text
+
+# Pairs scored together; larger batches mean fewer NumPy calls but more padding
+BATCH_SIZE = 4096
+
+BLOCK_BITS = 64
+
+SCORE_FIELDNAMES = ['file_name', 'annotated', 'generated', 'total_characters', 'total_words', 'cer', 'wer',
+                    'char_errors', 'word_errors']
+
+_ONE = np.uint64(1)
+_HIGH_SHIFT = np.uint64(BLOCK_BITS - 1)
+_BYTE_BITS = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.int64)
+
+
+def char_tokens(texts):
+    """(flat code point array, lengths) for a list of strings"""
+    lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+    flat = np.frombuffer(''.join(texts).encode('utf-32-le'), dtype=np.uint32).astype(np.int64)
+    return flat, lengths
+
+
+def word_tokens(texts, vocabulary):
+    """(flat word ID array, lengths) for a list of strings; new words are added to vocabulary"""
+    splits = list(map(str.split, texts))
+    lengths = np.fromiter(map(len, splits), dtype=np.int64, count=len(splits))
+    words = list(itertools.chain.from_iterable(splits))
+    for word in dict.fromkeys(words):
+        vocabulary.setdefault(word, len(vocabulary))
+    return np.fromiter(map(vocabulary.__getitem__, words), dtype=np.int64, count=len(words)), lengths
+
+
+def _padded(flat, starts, lengths, width, fill=-1):
+    """(len(starts), width) matrix of each sequence's tokens, padded with fill"""
+    if not len(flat):
+        return np.full((len(starts), width), fill, dtype=np.int64)
+    columns = np.arange(width)
+    index = np.minimum(starts[:, None] + columns, len(flat) - 1)
+    return np.where(columns < lengths[:, None], flat[index], fill)
+
+
+def _batch_distances(ref_flat, ref_starts, ref_lengths, hyp_flat, hyp_starts, hyp_lengths, blocks, vocabulary_size):
+    """Edit distances of one batch whose references all fit in `blocks` uint64 words
+
+    hyp_lengths must be sorted: the pairs whose hypothesis has ended are then
+    a prefix of the batch, and each column only works on the rest.
+    """
+    size = len(ref_lengths)
+    pair_ids = np.arange(size, dtype=np.int64)
+
+    # Match masks: one column per (pair, token) found in the pair's reference, one uint64 per block
+    total = int(ref_lengths.sum())
+    owner = np.repeat(pair_ids, ref_lengths)
+    position = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(ref_lengths) - ref_lengths, ref_lengths)
+    tokens = ref_flat[np.repeat(ref_starts, ref_lengths) + position]
+    keys, key_index = np.unique(owner * vocabulary_size + tokens, return_inverse=True)
+    masks = np.zeros((blocks, len(keys) + 1), dtype=np.uint64)  # last column: no match
+    np.bitwise_or.at(masks, (position // BLOCK_BITS, key_index.ravel()),
+                     np.left_shift(_ONE, (position % BLOCK_BITS).astype(np.uint64)))
+
+    # Mask column of every hypothesis token, looked up once for the whole batch; (width, size)
+    width = int(hyp_lengths[-1]) if size else 0
+    hypotheses = _padded(hyp_flat, hyp_starts, hyp_lengths, width)
+    query = pair_ids[:, None] * vocabulary_size + hypotheses
+    found = np.minimum(np.searchsorted(keys, query), max(len(keys) - 1, 0))
+    hit = (keys[found] == query) & (hypotheses >= 0) if len(keys) else np.zeros(query.shape, dtype=bool)
+    lookups = np.ascontiguousarray(np.where(hit, found, len(keys)).T)
+
+    positive = np.full((blocks, size), ~np.uint64(0), dtype=np.uint64)
+    negative = np.zeros((blocks, size), dtype=np.uint64)
+    mask_rows = list(masks)
+    ended = np.searchsorted(hyp_lengths, np.arange(width), side='right')
+    for column in range(width):
+        live = slice(ended[column], size)
+        lookup = lookups[column, live]
+        # Horizontal delta entering the top of the column: +1 (global distance, row 0 is 0, 1, 2, ...)
+        carry_positive = _ONE
+        carry_negative = np.uint64(0)
+        for block in range(blocks):
+            vp = positive[block, live]
+            vn = negative[block, live]
+            x = mask_rows[block].take(lookup) | carry_negative
+            d0 = (((x & vp) + vp) ^ vp) | x | vn
+            hp = vn | ~(d0 | vp)
+            hn = d0 & vp
+            carry_in_positive = carry_positive
+            carry_in_negative = carry_negative
+            carry_positive = hp >> _HIGH_SHIFT
+            carry_negative = hn >> _HIGH_SHIFT
+            hp = (hp << _ONE) | carry_in_positive
+            hn = (hn << _ONE) | carry_in_negative
+            positive[block, live] = hn | ~(d0 | hp)
+            negative[block, live] = hp & d0
+
+    # A pair's deltas stop changing after its last column: distance = top of that column (its
+    # hypothesis length) plus the vertical deltas of the rows inside its reference
+    rows = np.clip(ref_lengths[None, :] - BLOCK_BITS * np.arange(blocks)[:, None], 0, BLOCK_BITS).astype(np.uint64)
+    inside = np.where(rows == BLOCK_BITS, ~np.uint64(0), (_ONE << np.minimum(rows, _HIGH_SHIFT)) - _ONE)
+    return hyp_lengths + (_popcount(positive & inside) - _popcount(negative & inside)).sum(axis=0)
+
+
+def _popcount(values):
+    """Set bits of each uint64"""
+    counts = _BYTE_BITS[values.view(np.uint8)]
+    return counts.reshape(values.shape + (8,)).sum(axis=-1, dtype=np.int64)
+
+
+def edit_distances(ref_flat, ref_lengths, hyp_flat, hyp_lengths, batch_size=BATCH_SIZE):
+    """Edit distance of every (reference, hypothesis) pair of token ID sequences
+
+    Args:
+        ref_flat, hyp_flat: All sequences' non-negative token IDs, concatenated
+        ref_lengths, hyp_lengths: Length of each sequence
+        batch_size: Pairs per batch
+
+    Returns:
+        int64 array of distances, in input order
+    """
+    count = len(ref_lengths)
+    distances = np.zeros(count, dtype=np.int64)
+    if not count:
+        return distances
+    ref_starts = np.cumsum(ref_lengths) - ref_lengths
+    hyp_starts = np.cumsum(hyp_lengths) - hyp_lengths
+    vocabulary_size = int(max(ref_flat.max(initial=0), hyp_flat.max(initial=0))) + 1
+
+    blocks = np.maximum(1, -(-ref_lengths // BLOCK_BITS))
+    # By block count, then hypothesis length (which _batch_distances relies on)
+    order = np.lexsort((hyp_lengths, blocks))
+    # Batches never mix block counts: cut where the count changes and every batch_size pairs
+    cuts = set(np.flatnonzero(np.diff(blocks[order])) + 1) | set(range(0, count, batch_size)) | {count}
+    cuts = sorted(cuts)
+    for start, end in zip(cuts, cuts[1:]):
+        batch = order[start:end]
+        distances[batch] = _batch_distances(ref_flat, ref_starts[batch], ref_lengths[batch],
+                                            hyp_flat, hyp_starts[batch], hyp_lengths[batch],
+                                            int(blocks[batch[0]]), vocabulary_size)
+    return distances
+
+
+def _rates(errors, lengths):
+    """errors / reference length rounded like compare_output.py; 1.0 or 0.0 for empty references"""
+    rates = np.where(errors > 0, 1.0, 0.0)
+    np.divide(errors, lengths, out=rates, where=lengths > 0)
+    # Python's round(), not np.round(): np.round scales by 10**4 first and can land on the other side of a tie
+    return np.fromiter((round(rate, 4) for rate in rates.tolist()), dtype=np.float64, count=len(rates))
+
+
+def score_pairs(references, hypotheses, batch_size=BATCH_SIZE, normalize=True):
+    """Character and word error statistics of many hypotheses against their references
+
+    Returns:
+        dict of NumPy columns: total_characters, total_words, cer, wer, char_errors, word_errors
+    """
+    if normalize:
+        references = map(normalize_text, references)
+        hypotheses = map(normalize_text, hypotheses)
+    references = [text.strip() for text in references]
+    hypotheses = [text.strip() for text in hypotheses]
+
+    ref_chars, ref_char_lengths = char_tokens(references)
+    hyp_chars, hyp_char_lengths = char_tokens(hypotheses)
+    char_errors = edit_distances(ref_chars, ref_char_lengths, hyp_chars, hyp_char_lengths, batch_size)
+
+    vocabulary = {}
+    ref_words, ref_word_lengths = word_tokens(references, vocabulary)
+    hyp_words, hyp_word_lengths = word_tokens(hypotheses, vocabulary)
+    word_errors = edit_distances(ref_words, ref_word_lengths, hyp_words, hyp_word_lengths, batch_size)
+
+    return {
+        'total_characters': ref_char_lengths,
+        'total_words': ref_word_lengths,
+        'cer': _rates(char_errors, ref_char_lengths),
+        'wer': _rates(word_errors, ref_word_lengths),
+        'char_errors': char_errors,
+        'word_errors': word_errors,
+    }
+
+
+def response_sentence(json_path):
+    """Transcript of an API response sidecar (predicted words joined by spaces), '' if unreadable"""
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        words = data['output']['predicted_words']
+    except (OSError, ValueError, KeyError, TypeError):
+        return ''
+    return ' '.join(word.get('word') for word in words if word.get('word') != ' ').strip()
+
+
+def read_reference(text_path):
+    """Reference text, trying the same encodings as compare_output.read_from_text"""
+    for encoding in ('utf-8', 'latin-1', 'cp1252'):
+        try:
+            with open(text_path, 'r', encoding=encoding) as f:
+                return f.read()
+        except UnicodeDecodeError:
+            continue
+        except OSError:
+            return ''
+    return ''
+
+
+def load_folder_pairs(base, api_output):
+    """(names, references, hypotheses) for every response that has a reference .txt, by name"""
+    references = {}
+    for entry in sorted(os.scandir(base), key=lambda e: e.name):
+        if entry.is_file():
+            references.setdefault(entry.name.split('.')[0], entry.path)
+
+    names, reference_texts, hypotheses = [], [], []
+    missed = 0
+    for entry in sorted(os.scandir(api_output), key=lambda e: e.name):
+        if not entry.is_file():
+            continue
+        name = entry.name.split('.')[0]
+        if name not in references:
+            missed += 1
+            continue
+        names.append(name)
+        reference_texts.append(read_reference(references[name]))
+        hypotheses.append(response_sentence(entry.path))
+    if missed:
+        print(f"  {missed} responses without a reference text skipped")
+    return names, reference_texts, hypotheses
+
+
+def load_csv_pairs(csv_path, reference_column, hypothesis_column, name_column=None):
+    """(names, references, hypotheses) from the columns of a CSV; names default to row numbers"""
+    names, references, hypotheses = [], [], []
+    with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+        for index, row in enumerate(csv.DictReader(f)):
+            names.append(row[name_column] if name_column else str(index))
+            references.append(row[reference_column] or '')
+            hypotheses.append(row[hypothesis_column] or '')
+    return names, references, hypotheses
+
+
+def write_scores(output_path, names, references, hypotheses, table):
+    with open(output_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(SCORE_FIELDNAMES)
+        columns = [table[name].tolist() for name in SCORE_FIELDNAMES[3:]]
+        for row in zip(names, references, hypotheses, *columns):
+            writer.writerow(row)
+
+
+def corpus_rates(table):
+    """(CER, WER) over the whole corpus: all errors / all reference characters or words"""
+    return (table['char_errors'].sum() / max(int(table['total_characters'].sum()), 1),
+            table['word_errors'].sum() / max(int(table['total_words'].sum()), 1))
+
+
+def print_score_summary(table, seconds):
+    pairs = len(table['cer'])
+    print(f"Scored {pairs} pairs in {seconds:.2f}s ({pairs / max(seconds, 1e-9):.0f} pairs/s)")
+    if not pairs:
+        return
+    cer, wer = corpus_rates(table)
+    print(f"  CER: {cer:.4f} over {table['total_characters'].sum()} characters "
+          f"(mean per file {table['cer'].mean():.4f})")
+    print(f"  WER: {wer:.4f} over {table['total_words'].sum()} words "
+          f"(mean per file {table['wer'].mean():.4f})")
+
+
+def rule_report(references, hypotheses, rules=None, batch_size=BATCH_SIZE):
+    """Corpus CER/WER as the normalization rules are added in order, and with each one left out
+
+    Returns:
+        list of dicts: rule ('none' first), references_changed, hypotheses_changed (texts the
+        rule changed), cer, wer (with the rules up to this one), cer_without, wer_without
+        (with every other rule)
+    """
+    normalizer = TextNormalizer(rules, cache_size=0)
+    cer, wer = corpus_rates(score_pairs(references, hypotheses, batch_size, normalize=False))
+    report = [{'rule': 'none', 'references_changed': 0, 'hypotheses_changed': 0, 'cer': cer, 'wer': wer,
+               'cer_without': None, 'wer_without': None}]
+
+    refs, hyps = references, hypotheses
+    for name, step in normalizer.steps:
+        next_refs = list(map(step, refs))
+        next_hyps = list(map(step, hyps))
+        cer, wer = corpus_rates(score_pairs(next_refs, next_hyps, batch_size, normalize=False))
+
+        others = TextNormalizer([rule for rule in normalizer.rules if rule != name], cache_size=0)
+        without = score_pairs(list(map(others.normalize, references)), list(map(others.normalize, hypotheses)),
+                              batch_size, normalize=False)
+        cer_without, wer_without = corpus_rates(without)
+
+        report.append({'rule': name,
+                       'references_changed': sum(before != after for before, after in zip(refs, next_refs)),
+                       'hypotheses_changed': sum(before != after for before, after in zip(hyps, next_hyps)),
+                       'cer': cer, 'wer': wer, 'cer_without': cer_without, 'wer_without': wer_without})
+        refs, hyps = next_refs, next_hyps
+    return report
+
+
+def print_rule_report(report):
+    print("=" * 80)
+    print("NORMALIZATION RULES")
+    print("=" * 80)
+    print(f"{'rule':<12} {'refs changed':>12} {'hyps changed':>12} {'CER':>8} {'change':>8} {'WER':>8} "
+          f"{'change':>8} {'CER w/o':>8} {'WER w/o':>8}")
+    previous = report[0]
+    for entry in report:
+        without = (f"{entry['cer_without']:>8.4f} {entry['wer_without']:>8.4f}"
+                   if entry['cer_without'] is not None else f"{'':>8} {'':>8}")
+        print(f"{entry['rule']:<12} {entry['references_changed']:>12} {entry['hypotheses_changed']:>12} "
+              f"{entry['cer']:>8.4f} {entry['cer'] - previous['cer']:>+8.4f} "
+              f"{entry['wer']:>8.4f} {entry['wer'] - previous['wer']:>+8.4f} {without}")
+        previous = entry
+    print("change: after adding the rule to the ones above it; w/o: all rules except this one")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CER/WER of many transcripts at once")
+    parser.add_argument('--base', default=os.path.join('..', 'Final_data_MRK', 'text'),
+                        help="Folder of reference .txt files")
+    parser.add_argument('--api-output', default=os.path.join('..', 'Final_data_MRK', 'api_response'),
+                        help="Folder of API response .json files")
+    parser.add_argument('--pairs', help="CSV with reference and hypothesis columns instead of the folders")
+    parser.add_argument('--reference-column', default='annotated', help="Reference column of --pairs")
+    parser.add_argument('--hypothesis-column', default='generated', help="Hypothesis column of --pairs")
+    parser.add_argument('--name-column', help="File name column of --pairs (default: row number)")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Pairs per NumPy batch")
+    parser.add_argument('-o', '--output', default='batch_scores.csv', help="Scores CSV to write")
+    parser.add_argument('--no-normalize', action='store_true', help="Score the texts as written")
+    parser.add_argument('--rule-report', action='store_true',
+                        help=f"Show the effect of each normalization rule ({', '.join(RULES)}) instead of scoring")
+    args = parser.parse_args()
+
+    start = time.time()
+    if args.pairs:
+        names, references, hypotheses = load_csv_pairs(args.pairs, args.reference_column, args.hypothesis_column,
+                                                       args.name_column)
+    else:
+        names, references, hypotheses = load_folder_pairs(args.base, args.api_output)
+    print(f"Loaded {len(names)} pairs in {time.time() - start:.2f}s")
+
+    if args.rule_report:
+        print_rule_report(rule_report(references, hypotheses, batch_size=args.batch_size))
+        return
+
+    start = time.time()
+    table = score_pairs(references, hypotheses, args.batch_size, normalize=not args.no_normalize)
+    print_score_summary(table, time.time() - start)
+
+    write_scores(args.output, names, references, hypotheses, table)
+    print(f"✓ Scores saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
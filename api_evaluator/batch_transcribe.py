@@ -3,16 +3,15 @@ Batch transcription script for STT Model Evaluator
 Processes all audio files in the Modified folder and generates transcripts via API
 """
 
-import base64
 import json
-import socketio
 import time
 import csv
 import os
 from pathlib import Path
 from datetime import datetime
-import wave
-import contextlib
+
+from stt_client import STTClient
+from audio_probe import probe_duration
 
 # Import configuration
 try:
@@ -35,27 +34,22 @@ except ImportError:
     API_TIMEOUT = 60
     REQUEST_DELAY = 1
 
+try:
+    from config import TIMESTAMP_RATE
+except ImportError:
+    TIMESTAMP_RATE = 16000
+
 # Ensure output directory exists
 os.makedirs(API_RESPONSE_DIR, exist_ok=True)
 
 
 def get_audio_duration(audio_path):
-    """Get duration of audio file in seconds"""
-    try:
-        ext = os.path.splitext(audio_path)[1].lower()
-        
-        if ext == '.wav':
-            with contextlib.closing(wave.open(audio_path, 'r')) as f:
-                frames = f.getnframes()
-                rate = f.getframerate()
-                duration = frames / float(rate)
-                return duration
-        else:
-            # For other formats, we'll rely on the API response
-            return None
-    except Exception as e:
-        print(f"  Warning: Could not determine duration: {e}")
-        return None
+    """Get duration of audio file in seconds from its headers (WAV, FLAC, MP3, OGG)"""
+    duration = probe_duration(audio_path)
+    if duration is None:
+        # For other formats, we'll rely on the API response
+        print(f"  Warning: Could not determine duration from headers")
+    return duration
 
 
 def find_all_audio_files(base_dir):
@@ -85,76 +79,18 @@ def get_existing_transcripts():
     return existing
 
 
-def transcribe_audio(audio_path):
-    """Transcribe a single audio file using the STT API"""
-    result = {'success': False, 'data': None, 'error': None}
-    
-    # Create Socket.IO client
-    sio = socketio.Client(ssl_verify=False)
-    
-    # Event handlers
-    @sio.on('connect')
-    def on_connect():
-        print(f"  Connected to STT server")
-    
-    @sio.on('disconnect')
-    def on_disconnect():
-        print(f"  Disconnected from server")
-    
-    @sio.on('result_upload')
-    def on_result_upload(data):
-        print(f"  Received transcription result")
-        result['success'] = True
-        result['data'] = data
-        sio.disconnect()
-    
-    @sio.on('connect_error')
-    def on_connect_error(error):
-        print(f"  Connection error: {error}")
-        result['error'] = f"Connection error: {error}"
-        result['success'] = False
-    
-    try:
-        # Read and encode audio file
-        with open(audio_path, 'rb') as f:
-            audio_data = f.read()
-        
-        encoded_audio = base64.b64encode(audio_data).decode('utf-8')
-        
-        # Connect to API
-        print(f"  Connecting to API...")
-        sio.connect(SOCKET_URL, transports=["websocket"])
-        
-        # Send audio for transcription
-        payload = {
-            "index": 0,
-            "audio": encoded_audio,
-            "endOfStream": True
-        }
-        
-        print(f"  Sending audio data...")
-        sio.emit("audio_transmit_upload", payload)
-        
-        # Wait for response (with timeout)
-        start_time = time.time()
-        
-        while not result['success'] and not result['error']:
-            time.sleep(0.1)
-            if time.time() - start_time > API_TIMEOUT:
-                result['error'] = "Timeout waiting for response"
-                break
-        
-        # Ensure disconnection
-        if sio.connected:
-            sio.disconnect()
-        
-        return result
-        
-    except Exception as e:
-        result['error'] = str(e)
-        if sio.connected:
-            sio.disconnect()
-        return result
+def transcribe_audio(audio_path, client=None):
+    """Transcribe a single audio file using the STT API
+
+    Args:
+        audio_path: Path to the audio file
+        client: Shared STTClient; a one-off client is used if not given
+    """
+    if client is not None:
+        return client.transcribe(audio_path)
+
+    with STTClient(url=SOCKET_URL, timeout=API_TIMEOUT) as one_off_client:
+        return one_off_client.transcribe(audio_path)
 
 
 def extract_transcript_text(api_response):
@@ -225,10 +161,11 @@ def process_audio_files():
     print("Starting batch transcription...")
     print("=" * 80 + "\n")
     
-    # Process each file
+    # Process each file over a shared pool of persistent connections
     success_count = 0
     error_count = 0
     base_path = Path(AUDIO_BASE_DIR)
+    client = STTClient(url=SOCKET_URL, timeout=API_TIMEOUT)
     
     for idx, audio_file in enumerate(files_to_process, 1):
         # Get relative path for display and folder structure
@@ -240,7 +177,7 @@ def process_audio_files():
             duration = get_audio_duration(str(audio_file))
             
             # Transcribe
-            result = transcribe_audio(str(audio_file))
+            result = transcribe_audio(str(audio_file), client)
             
             if result['success'] and result['data']:
                 # Create output path maintaining folder structure
@@ -264,8 +201,8 @@ def process_audio_files():
                         if 'output' in result['data'] and 'predicted_words' in result['data']['output']:
                             words = result['data']['output']['predicted_words']
                             if words and 'timestamp' in words[-1]:
-                                # Last timestamp end time in milliseconds
-                                duration = words[-1]['timestamp'][1] / 1000.0
+                                # Last timestamp end, in samples at TIMESTAMP_RATE
+                                duration = words[-1]['timestamp'][1] / float(TIMESTAMP_RATE)
                     except:
                         pass
                 
@@ -316,6 +253,8 @@ def process_audio_files():
             }
             append_to_csv(CSV_OUTPUT_PATH, csv_row)
     
+    client.close()
+    
     # Summary
     print("\n" + "=" * 80)
     print("BATCH TRANSCRIPTION COMPLETE")
@@ -324,6 +263,8 @@ def process_audio_files():
     print(f"Successful: {success_count}")
     print(f"Failed: {error_count}")
     print(f"CSV output: {CSV_OUTPUT_PATH}")
+    print("-" * 80)
+    client.print_stats()
     print("=" * 80)
 
 
@@ -3,25 +3,46 @@ Batch transcription script for STT Model Evaluator
 Processes all audio files and saves transcripts in the same folder
 
 Usage:
-    python batch_transcribe_v2.py              # Process regular folders (excluding 'remaining')
-    python batch_transcribe_v2.py --remaining  # Process only 'remaining' folder
+    python batch_transcribe_v2.py                  # Process regular folders (excluding 'remaining')
+    python batch_transcribe_v2.py --remaining      # Process only 'remaining' folder
+    python batch_transcribe_v2.py --concurrency 8  # Keep 8 requests in flight
+    python batch_transcribe_v2.py --workers 4      # Split files across 4 worker processes
+    python batch_transcribe_v2.py --mode stream    # Send chunks via audio_transmit as they are read
+    python batch_transcribe_v2.py --schedule path  # Old sorted-by-path order instead of longest first
+    python batch_transcribe_v2.py --pack           # Send short WAV clips several per request
+    python batch_transcribe_v2.py --segment        # Split long WAV files at pauses, send segments in parallel
+    python batch_transcribe_v2.py --full-rescan    # List every folder again instead of using the scan cache
+    python batch_transcribe_v2.py --store jsonl    # Append responses to sharded JSONL instead of sidecars
 """
 
-import base64
+import argparse
+import asyncio
 import json
-import socketio
 import time
 import csv
 import os
-import sys
+import re
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime
 
+from stt_client import STTClient, AsyncSTTClient, combine_pool_stats, print_pool_stats
+from rate_controller import MAX_CONCURRENCY, AIMDController, AsyncAdaptiveLimiter, percentile
+from scheduler import SCHEDULE_POLICIES, ScheduleTracker, estimate_duration, order_files
+from audio_probe import probe_duration
+from corpus_scan import SCAN_CACHE, scan_cache_path_for, scan_corpus, print_scan_summary
+from run_state import MAX_ATTEMPTS, RunState, csv_path_for_run, state_path_for
+from result_writer import ResultWriter, write_json_atomic
+from response_store import STORE_COMPRESSION, ResponseStore, store_path_for
+from clip_packer import ClipPack, build_packs, split_pack_result, compare_transcripts
+from segmenter import (SEGMENT_PARALLEL, SegmentedFile, plan_segmentation, transcribe_segmented,
+                       transcribe_segmented_async)
+
 # Import configuration
 try:
     from config import (
         AUDIO_BASE_DIR,
-        CSV_OUTPUT_PATH,
         SOCKET_URL,
         AUDIO_EXTENSIONS,
         API_TIMEOUT,
@@ -30,171 +51,66 @@ try:
 except ImportError:
     # Fallback to default configuration
     AUDIO_BASE_DIR = r"D:\cv_eval_bn\validated"
-    CSV_OUTPUT_PATH = r"D:\cv_eval_bn\transcription_path.csv"
     SOCKET_URL = "https://voice.bangla.gov.bd:9394"
     AUDIO_EXTENSIONS = ['.wav', '.flac']  # WAV works best, MP3 may have issues
     API_TIMEOUT = 120
     REQUEST_DELAY = 1
 
+try:
+    from config import ADAPTIVE_RATE
+except ImportError:
+    ADAPTIVE_RATE = True
 
-def get_audio_duration_estimate(audio_path):
-    """Get rough duration estimate from file size for MP3"""
-    try:
-        file_size = os.path.getsize(audio_path)
-        # Rough estimate: 1 minute of MP3 at 128kbps ≈ 1MB
-        estimated_duration = (file_size / 1024 / 1024) * 60
-        return estimated_duration
-    except Exception as e:
-        return None
+try:
+    from config import TRACE_REQUESTS
+except ImportError:
+    TRACE_REQUESTS = True
 
+try:
+    from config import TIMESTAMP_RATE
+except ImportError:
+    TIMESTAMP_RATE = 16000
 
-def find_all_audio_files(base_dir, process_remaining=False):
-    """Recursively find all audio files in the directory
-    
-    Args:
-        base_dir: Base directory to search
-        process_remaining: If True, only process 'remaining' folder. If False, exclude it.
-    """
-    audio_files = []
-    base_path = Path(base_dir)
-    
-    if process_remaining:
-        # Only process 'remaining' folder
-        remaining_dir = base_path / 'remaining'
-        if remaining_dir.exists() and remaining_dir.is_dir():
-            for ext in AUDIO_EXTENSIONS:
-                audio_files.extend(remaining_dir.rglob(f'*{ext}'))
-    else:
-        # Get all subdirectories in base_dir, excluding 'remaining'
-        subdirs = [d for d in base_path.iterdir() if d.is_dir() and d.name.lower() != 'remaining']
-        
-        # Process each subdirectory
-        for subdir in subdirs:
-            for ext in AUDIO_EXTENSIONS:
-                audio_files.extend(subdir.rglob(f'*{ext}'))
-    
-    return sorted(audio_files)
+try:
+    from config import RUN_STATE
+except ImportError:
+    RUN_STATE = True
 
+try:
+    from config import RESPONSE_STORE
+except ImportError:
+    RESPONSE_STORE = 'sidecar'
+
+# Order in which phases appear in trace records and the summary
+TRACE_PHASES = ['read', 'encode', 'connect', 'emit', 'server_wait', 'decode', 'json_write', 'csv_write']
+
+CSV_FIELDNAMES = ['audio_file_path', 'transcription_file_path', 'transcript', 'audio_length_seconds',
+                  'api_response_time_seconds']
+STREAM_TIMING_FIELDNAMES = ['audio_file_path', 'chunks_sent', 'result_events',
+                            'time_to_first_result_seconds', 'time_to_final_result_seconds']
+
+
+def transcribe_audio(audio_path, client=None, mode='upload'):
+    """Transcribe a single audio file using the STT API
 
-def get_existing_transcripts(base_dir, process_remaining=False):
-    """Get set of audio files that already have transcripts
-    
     Args:
-        base_dir: Base directory to search
-        process_remaining: If True, only check 'remaining' folder. If False, exclude it.
+        audio_path: Path to the audio file, a ClipPack (always uploaded whole)
+            or a SegmentedFile (segments uploaded in parallel)
+        client: Shared STTClient; a one-off client is used if not given
+        mode: 'upload' sends the whole file at once, 'stream' sends 32 KB
+            audio_transmit chunks as they are read
     """
-    existing = set()
-    base_path = Path(base_dir)
-    
-    if process_remaining:
-        # Only check 'remaining' folder
-        remaining_dir = base_path / 'remaining'
-        if remaining_dir.exists() and remaining_dir.is_dir():
-            for json_file in remaining_dir.rglob('*.json'):
-                # Get the corresponding audio file path (without extension)
-                audio_base = json_file.with_suffix('')
-                # Check if any audio file with this base name exists
-                for ext in AUDIO_EXTENSIONS:
-                    audio_file = audio_base.with_suffix(ext)
-                    if audio_file.exists():
-                        existing.add(str(audio_file))
-                        break
-    else:
-        # Get all subdirectories in base_dir, excluding 'remaining'
-        subdirs = [d for d in base_path.iterdir() if d.is_dir() and d.name.lower() != 'remaining']
-        
-        # Find all JSON files in subdirectories
-        for subdir in subdirs:
-            for json_file in subdir.rglob('*.json'):
-                # Get the corresponding audio file path (without extension)
-                audio_base = json_file.with_suffix('')
-                # Check if any audio file with this base name exists
-                for ext in AUDIO_EXTENSIONS:
-                    audio_file = audio_base.with_suffix(ext)
-                    if audio_file.exists():
-                        existing.add(str(audio_file))
-                        break
-    
-    return existing
-
-
-def transcribe_audio(audio_path):
-    """Transcribe a single audio file using the STT API"""
-    result = {
-        'success': False,
-        'data': None,
-        'error': None,
-        'api_response_time': None
-    }
-    
-    # Create Socket.IO client
-    sio = socketio.Client(ssl_verify=False)
-    
-    # Event handlers
-    @sio.on('connect')
-    def on_connect():
-        print(f"  Connected to STT server")
-    
-    @sio.on('disconnect')
-    def on_disconnect():
-        print(f"  Disconnected from server")
-    
-    @sio.on('result_upload')
-    def on_result_upload(data):
-        result['api_response_time'] = time.time() - result['send_time']
-        print(f"  Received transcription result (API took {result['api_response_time']:.2f}s)")
-        result['success'] = True
-        result['data'] = data
-        sio.disconnect()
-    
-    @sio.on('connect_error')
-    def on_connect_error(error):
-        print(f"  Connection error: {error}")
-        result['error'] = f"Connection error: {error}"
-        result['success'] = False
-    
-    try:
-        # Read and encode audio file
-        with open(audio_path, 'rb') as f:
-            audio_data = f.read()
-        
-        encoded_audio = base64.b64encode(audio_data).decode('utf-8')
-        
-        # Connect to API
-        print(f"  Connecting to API...")
-        sio.connect(SOCKET_URL, transports=["websocket"])
-        
-        # Send audio for transcription
-        payload = {
-            "index": 0,
-            "audio": encoded_audio,
-            "endOfStream": True
-        }
-        
-        print(f"  Sending audio data...")
-        result['send_time'] = time.time()
-        sio.emit("audio_transmit_upload", payload)
-        
-        # Wait for response (with timeout)
-        start_time = time.time()
-        
-        while not result['success'] and not result['error']:
-            time.sleep(0.1)
-            if time.time() - start_time > API_TIMEOUT:
-                result['error'] = "Timeout waiting for response"
-                break
-        
-        # Ensure disconnection
-        if sio.connected:
-            sio.disconnect()
-        
-        return result
-        
-    except Exception as e:
-        result['error'] = str(e)
-        if sio.connected:
-            sio.disconnect()
-        return result
+    if client is None:
+        with STTClient(url=SOCKET_URL, timeout=API_TIMEOUT) as one_off_client:
+            return transcribe_audio(audio_path, one_off_client, mode)
+
+    if isinstance(audio_path, ClipPack):
+        return client.transcribe_data(audio_path.to_wav_bytes())
+    if isinstance(audio_path, SegmentedFile):
+        return transcribe_segmented(audio_path, client)
+    if mode == 'stream':
+        return client.transcribe_stream(str(audio_path))
+    return client.transcribe(str(audio_path))
 
 
 def extract_transcript_text(api_response):
@@ -211,26 +127,32 @@ def extract_transcript_text(api_response):
 
 
 def get_audio_duration_from_api(api_response):
-    """Extract audio duration from API response"""
+    """Extract audio duration from API response (end of the last word, so trailing silence is missed)"""
     try:
         if 'output' in api_response and 'predicted_words' in api_response['output']:
             words = api_response['output']['predicted_words']
             if words and 'timestamp' in words[-1]:
-                # Last timestamp end time in milliseconds
-                duration = words[-1]['timestamp'][1] / 1000.0
+                # Last timestamp end, in samples at TIMESTAMP_RATE
+                duration = words[-1]['timestamp'][1] / float(TIMESTAMP_RATE)
                 return duration
     except:
         pass
     return None
 
 
-def append_to_csv(csv_path, row_data):
-    """Append a row to CSV file (creates file if doesn't exist)"""
+def append_to_csv(csv_path, row_data, result_writer=None):
+    """Append a row to CSV file (creates file if doesn't exist)
+    
+    With a ResultWriter the row is queued and written in a batch by its thread.
+    """
+    if result_writer:
+        result_writer.append_row(csv_path, row_data, CSV_FIELDNAMES)
+        return
+    
     file_exists = os.path.exists(csv_path)
     
     with open(csv_path, 'a', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['audio_file_path', 'transcription_file_path', 'transcript', 'audio_length_seconds', 'api_response_time_seconds']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDNAMES)
         
         if not file_exists:
             writer.writeheader()
@@ -238,20 +160,57 @@ def append_to_csv(csv_path, row_data):
         writer.writerow(row_data)
 
 
-def process_audio_files(process_remaining=False):
+def make_options(**overrides):
+    """Run options passed down to every runner
+    
+    Keys:
+        concurrency: Most requests kept in flight (1 = sequential; None = MAX_CONCURRENCY with
+            adaptive rate control, which then picks the limit, else 1)
+        workers: Number of worker processes, each handling one shard of the files
+        adaptive: Use the AIMD rate controller instead of the fixed REQUEST_DELAY
+        mode: 'upload' (audio_transmit_upload) or 'stream' (chunked audio_transmit)
+        schedule: Processing order, one of scheduler.SCHEDULE_POLICIES
+        pack: Join short WAV clips into one upload and split the result by word timestamps
+        pack_check: Number of packed clips to also send alone, to measure the accuracy impact
+        segment: Split long WAV files at pauses and transcribe the segments in parallel
+        state_db: Run-state database updated as files start and finish (None = off)
+        full_rescan: List every folder again instead of reusing unchanged listings from the scan cache
+        store: 'sidecar' (indented JSON next to each audio file) or 'jsonl' (packed response store)
+        compression: Shard compression for the 'jsonl' store: None, 'gzip' or 'zstd'
+        store_dir: Response store directory, set by filter_stored() (None = sidecars)
+    """
+    options = {
+        'concurrency': None,
+        'workers': 1,
+        'adaptive': ADAPTIVE_RATE,
+        'mode': 'upload',
+        'schedule': 'longest-first',
+        'pack': False,
+        'pack_check': 0,
+        'segment': False,
+        'state_db': None,
+        'full_rescan': False,
+        'store': RESPONSE_STORE,
+        'compression': STORE_COMPRESSION,
+        'store_dir': None,
+    }
+    options.update(overrides)
+    if options['concurrency'] is None:
+        options['concurrency'] = MAX_CONCURRENCY if options['adaptive'] else 1
+    return options
+
+
+def process_audio_files(process_remaining=False, options=None):
     """Main processing function
     
     Args:
         process_remaining: If True, process only 'remaining' folder with separate CSV output
+        options: Run options from make_options()
     """
-    # Determine CSV output path
-    csv_output = CSV_OUTPUT_PATH
-    if process_remaining:
-        # Generate separate CSV for remaining folder
-        csv_dir = Path(CSV_OUTPUT_PATH).parent
-        csv_name = Path(CSV_OUTPUT_PATH).stem
-        csv_ext = Path(CSV_OUTPUT_PATH).suffix
-        csv_output = str(csv_dir / f"{csv_name}_remaining{csv_ext}")
+    options = options or make_options()
+    
+    # Separate CSV for the 'remaining' folder
+    csv_output = csv_path_for_run(process_remaining)
     
     folder_type = "'remaining' folder only" if process_remaining else "all folders (excluding 'remaining')"
     
@@ -264,32 +223,465 @@ def process_audio_files(process_remaining=False):
     print(f"API endpoint: {SOCKET_URL}")
     print("=" * 80)
     
-    # Find all audio files
+    # Find audio files without a transcript in one pass over the tree
     print("\nScanning for audio files...")
-    audio_files = find_all_audio_files(AUDIO_BASE_DIR, process_remaining)
-    print(f"Found {len(audio_files)} audio files")
+    scan = scan_corpus(AUDIO_BASE_DIR, process_remaining,
+                       cache_path=scan_cache_path_for(csv_output) if SCAN_CACHE else None,
+                       full_rescan=options['full_rescan'])
+    print_scan_summary(scan)
+    files_to_process = scan['pending']
     
-    # Get existing transcripts
-    existing_transcripts = get_existing_transcripts(AUDIO_BASE_DIR, process_remaining)
-    print(f"Found {len(existing_transcripts)} existing transcripts")
+    if options['store'] == 'jsonl':
+        files_to_process, options = filter_stored(files_to_process, csv_output, options)
     
-    # Filter out already processed files
-    files_to_process = []
-    for audio_file in audio_files:
-        if str(audio_file) not in existing_transcripts:
-            files_to_process.append(audio_file)
+    if RUN_STATE:
+        files_to_process, options = sync_run_state(files_to_process, csv_output, options)
     
     print(f"Files to process: {len(files_to_process)}")
     
+    # Fold in shard CSVs left behind by an interrupted --workers run
+    leftover = merge_shard_csvs(csv_output)
+    if leftover:
+        print(f"Merged {leftover} rows from earlier shard CSVs")
+    
     if len(files_to_process) == 0:
         print("\nAll files have been processed!")
         return
     
+    # Long clips first, so they do not end up alone at the end of the run
+    files_to_process, estimates = order_files(files_to_process, options['schedule'])
+    print(f"Schedule: {options['schedule']} "
+          f"({sum(estimates.values()) / 3600:.2f} hours of audio, estimated)")
+    
     print("\n" + "=" * 80)
     print("Starting batch transcription...")
     print("=" * 80 + "\n")
+    run_started = datetime.now().isoformat()
+    
+    # Process each file over a shared pool of persistent connections
+    if options['workers'] > 1:
+        print(f"Sharded mode: {options['workers']} worker processes, "
+              f"concurrency {options['concurrency']} each\n")
+        success_count, error_count, stats = process_files_sharded(files_to_process, csv_output, options, estimates)
+    else:
+        success_count, error_count, stats = run_files(files_to_process, csv_output, options, estimates)
+    
+    # Summary
+    print("\n" + "=" * 80)
+    print("BATCH TRANSCRIPTION COMPLETE")
+    print("=" * 80)
+    print(f"Total processed: {len(files_to_process)}")
+    print(f"Successful: {success_count}")
+    print(f"Failed: {error_count}")
+    print(f"CSV output: {csv_output}")
+    print("-" * 80)
+    print_pool_stats(stats)
+    if TRACE_REQUESTS:
+        trace_paths = [trace_path_for(csv_output)]
+        trace_paths += [trace_path_for(shard_csv_path(csv_output, i)) for i in range(options['workers'])]
+        print("-" * 80)
+        print_trace_summary(trace_paths, run_started)
+    print("=" * 80)
+
+
+def sync_run_state(files_to_process, csv_output, options):
+    """Record the scan in the run-state database and drop files that keep failing
+    
+    A new database is seeded from an existing CSV. Files left in progress by
+    an interrupted run become pending again.
+    
+    Returns:
+        (files to process, options with 'state_db' set)
+    """
+    state_db = str(state_path_for(csv_output))
+    with RunState(state_db) as state:
+        if state.created and os.path.exists(csv_output):
+            done, failed = state.import_csv(csv_output)
+            print(f"Run state: imported {done} done and {failed} failed files from {csv_output}")
+        interrupted = state.reset_interrupted()
+        if interrupted:
+            print(f"Run state: {interrupted} files were in progress when the last run stopped")
+        state.add_pending(files_to_process)
+        exhausted = state.exhausted()
+    
+    if exhausted:
+        files_to_process = [f for f in files_to_process if str(f) not in exhausted]
+        print(f"Skipping {len(exhausted)} files that failed {MAX_ATTEMPTS} times "
+              f"(python check_progress.py --requeue to retry them)")
+    print(f"Run state: {state_db}")
+    return files_to_process, dict(options, state_db=state_db)
+
+
+def filter_stored(files_to_process, csv_output, options):
+    """Drop files that already have a response in the packed store
+    
+    The store's counterpart of the sidecar check done by the scan.
+    
+    Returns:
+        (files to process, options with 'store_dir' set)
+    """
+    store_dir = str(store_path_for(csv_output))
+    with ResponseStore(store_dir, options['compression']) as store:
+        stored = store.stored_paths()
+    
+    files_to_process = [f for f in files_to_process if str(f) not in stored]
+    print(f"Response store: {len(stored)} responses in {store_dir}")
+    return files_to_process, dict(options, store_dir=store_dir)
+
+
+def run_files(files_to_process, csv_output, options, estimates=None):
+    """Transcribe a list of files with a fresh client
+    
+    With options['adaptive'], an AIMD controller picks the in-flight limit
+    (up to options['concurrency']) and the pause between requests instead
+    of REQUEST_DELAY. Files are sent in the given order; per-file start and
+    end times are written to <csv name>_schedule.csv for the tail report.
+    
+    Returns:
+        (success_count, error_count, connection stats)
+    """
+    concurrency = options['concurrency']
+    mode = options['mode']
+    controller = None
+    if options['adaptive']:
+        csv_path = Path(csv_output)
+        controller = AIMDController(
+            max_limit=concurrency,
+            log_path=str(csv_path.parent / f"{csv_path.stem}_rate_control.csv")
+        )
+    
+    if estimates is None:
+        estimates = {f: estimate_duration(f) for f in files_to_process}
+    
+    packs = []
+    segmented = 0
+    items = files_to_process
+    if options['pack']:
+        packs, items = build_packs(files_to_process)
+        packed_clips = sum(len(pack.segments) for pack in packs)
+        print(f"Packing: {packed_clips} short clips into {len(packs)} requests, {len(items)} files sent alone\n")
+    if options['segment']:
+        items, segmented = plan_segmentation(items)
+        print(f"Segmenting: {segmented} long files split at pauses, up to {SEGMENT_PARALLEL} segments in parallel\n")
+    if packs or segmented:
+        estimates = dict(estimates)
+        files_to_process = items + packs
+        estimates.update((item, item.duration) for item in files_to_process
+                         if isinstance(item, (ClipPack, SegmentedFile)))
+        if options['schedule'] != 'path':
+            files_to_process.sort(key=lambda item: estimates.get(item, 0.0),
+                                  reverse=options['schedule'] == 'longest-first')
+    
+    tracker = ScheduleTracker(files_to_process, estimates, concurrency, options['schedule'])
+    state = RunState(options['state_db']) if options['state_db'] else None
+    # Sidecars and CSV rows are written by a background thread; closing it flushes the rest
+    response_store = ResponseStore(options['store_dir'], options['compression']) if options['store_dir'] else None
+    result_writer = ResultWriter(response_store=response_store)
+    
+    try:
+        if concurrency > 1:
+            print(f"Concurrent mode: up to {concurrency} requests in flight\n")
+            client = AsyncSTTClient(url=SOCKET_URL, pool_size=concurrency, timeout=API_TIMEOUT, verbose=False)
+            success_count, error_count = asyncio.run(
+                process_files_async(files_to_process, client, csv_output, concurrency, controller, mode, tracker,
+                                    state, result_writer)
+            )
+        else:
+            # Segments of one file still go out in parallel
+            client_options = {'pool_size': SEGMENT_PARALLEL} if segmented else {}
+            client = STTClient(url=SOCKET_URL, timeout=API_TIMEOUT, **client_options)
+            success_count, error_count = process_files_sequential(files_to_process, client, csv_output,
+                                                                  controller, mode, tracker, state, result_writer)
+    finally:
+        result_writer.close()
+        if response_store:
+            response_store.close()
+        if state:
+            state.close()
+    
+    result_writer.print_summary()
+    if controller:
+        controller.print_summary()
+    if tracker.print_report():
+        csv_path = Path(csv_output)
+        tracker.save(str(csv_path.parent / f"{csv_path.stem}_schedule{csv_path.suffix}"))
+    if packs and options['pack_check'] > 0:
+        run_pack_check(packs, csv_output, options['pack_check'], options['store_dir'])
+    
+    return success_count, error_count, client.stats
+
+
+def item_files(item):
+    """Audio files behind a work item: a single file, a ClipPack or a SegmentedFile"""
+    return item.files if isinstance(item, (ClipPack, SegmentedFile)) else [item]
+
+
+def save_item(item, result, csv_output, state=None, result_writer=None):
+    """save_result() for a single file, or for every clip of a ClipPack
+    
+    Returns:
+        (successful clips, failed clips)
+    """
+    if isinstance(item, SegmentedFile):
+        item = item.audio_file
+    if not isinstance(item, ClipPack):
+        saved = save_result(item, result, csv_output, state, result_writer)
+        return int(saved), int(not saved)
+    
+    successes = 0
+    for audio_file, clip_result in split_pack_result(item, result):
+        print(f"  Clip: {audio_file.name}")
+        successes += save_result(audio_file, clip_result, csv_output, state, result_writer)
+    return successes, len(item.segments) - successes
+
+
+def append_item_error(csv_output, item, message, state=None, result_writer=None):
+    """Log an exception for a file, or for every clip of a ClipPack; returns the number of rows"""
+    files = item_files(item)
+    for audio_file in files:
+        append_error_to_csv(csv_output, audio_file, message, result_writer)
+        if state:
+            state.mark_failed(audio_file, message)
+    return len(files)
+
+
+def run_pack_check(packs, csv_output, sample_size, store_dir=None):
+    """Send a sample of packed clips alone and compare with their packed transcripts
+    
+    Clips are taken round-robin across packs so different pack positions are
+    covered. Packed results are read from the sidecars, or from the response
+    store in store_dir. Solo results are only compared, never saved.
+    """
+    sample = []
+    position = 0
+    while len(sample) < sample_size and any(position < len(p.segments) for p in packs):
+        for pack in packs:
+            if position < len(pack.segments) and len(sample) < sample_size:
+                sample.append(pack.segments[position][0])
+        position += 1
+    
+    rows = []
+    store = ResponseStore(store_dir) if store_dir else None
+    print(f"\nPacking accuracy check: sending {len(sample)} packed clips alone...")
+    with STTClient(url=SOCKET_URL, timeout=API_TIMEOUT, verbose=False) as client:
+        for audio_file in sample:
+            if store:
+                packed = store.get(audio_file)
+            else:
+                json_path = audio_file.with_suffix('.json')
+                packed = None
+                if json_path.exists():
+                    with open(json_path, 'r', encoding='utf-8') as f:
+                        packed = json.load(f)
+            if packed is None:
+                continue
+            packed_transcript = extract_transcript_text(packed)
+            result = client.transcribe(str(audio_file))
+            if result['success'] and result['data']:
+                rows.append((audio_file, extract_transcript_text(result['data']), packed_transcript))
+    if store:
+        store.close()
     
-    # Process each file
+    csv_path = Path(csv_output)
+    compare_transcripts(rows, str(csv_path.parent / f"{csv_path.stem}_pack_check{csv_path.suffix}"))
+
+
+def save_result(audio_file, result, csv_output, state=None, result_writer=None):
+    """Write the JSON sidecar and CSV row (and run-state update) for one transcription result
+    
+    With a ResultWriter, the sidecar, row and trace line are queued for its
+    thread (json_write and csv_write then time the hand-off); without one they
+    are written here. Either way the sidecar is replaced atomically. If the
+    writer has a response store, the response goes there instead of a sidecar;
+    the CSV keeps the sidecar path, which `response_store.py export` fills in.
+    
+    Returns:
+        True if the transcription succeeded, False if an error row was logged
+    """
+    phases = result.setdefault('phases', {})
+    
+    if result['success'] and result['data']:
+        # Save JSON response in the same folder as audio file
+        json_path = audio_file.with_suffix('.json')
+        
+        start = time.time()
+        if result_writer and result_writer.response_store:
+            result_writer.save_response(audio_file, result['data'])
+        elif result_writer:
+            result_writer.save_json(json_path, result['data'])
+        else:
+            write_json_atomic(json_path, result['data'])
+        phases['json_write'] = time.time() - start
+        
+        if result_writer and result_writer.response_store:
+            print(f"  ✓ Stored response")
+        else:
+            print(f"  ✓ Saved JSON: {json_path.name}")
+        
+        # Extract transcript
+        start = time.time()
+        transcript = extract_transcript_text(result['data'])
+        
+        # Audio duration from the file's headers (packed clips know theirs exactly);
+        # the API's last word timestamp is only a fallback
+        duration = result.get('audio_duration') or probe_duration(audio_file)
+        if duration is None:
+            duration = get_audio_duration_from_api(result['data'])
+        phases['decode'] = time.time() - start
+        
+        # Append to CSV
+        csv_row = {
+            'audio_file_path': str(audio_file),
+            'transcription_file_path': str(json_path),
+            'transcript': transcript,
+            'audio_length_seconds': f"{duration:.2f}" if duration else 'N/A',
+            'api_response_time_seconds': f"{result['api_response_time']:.2f}" if result['api_response_time'] else 'N/A'
+        }
+        
+        start = time.time()
+        append_to_csv(csv_output, csv_row, result_writer)
+        phases['csv_write'] = time.time() - start
+        print(f"  ✓ Updated CSV")
+        if state:
+            state.mark_done(audio_file, json_path, result['api_response_time'], duration)
+        
+        if 'time_to_final_result' in result:
+            append_stream_timing(csv_output, audio_file, result, result_writer)
+            print(f"  ✓ Stream: first result {result['time_to_first_result']:.2f}s, "
+                  f"final {result['time_to_final_result']:.2f}s")
+        print(f"  ✓ Transcript: {transcript[:100]}..." if len(transcript) > 100 else f"  ✓ Transcript: {transcript}")
+        if TRACE_REQUESTS:
+            append_trace(csv_output, audio_file, result, result_writer)
+        return True
+    
+    error_msg = result.get('error', 'Unknown error')
+    print(f"  ✗ Failed: {error_msg}")
+    start = time.time()
+    append_error_to_csv(csv_output, audio_file, f'ERROR: {error_msg}', result_writer)
+    phases['csv_write'] = time.time() - start
+    if state:
+        state.mark_failed(audio_file, error_msg, result['api_response_time'])
+    if TRACE_REQUESTS:
+        append_trace(csv_output, audio_file, result, result_writer)
+    return False
+
+
+def trace_path_for(csv_output):
+    """JSONL trace file kept next to a CSV"""
+    csv_path = Path(csv_output)
+    return csv_path.parent / f"{csv_path.stem}_trace.jsonl"
+
+
+def append_trace(csv_output, audio_file, result, result_writer=None):
+    """Append one JSON line with the per-phase durations of a request
+    
+    Phases: file read, base64 encode, connect/TLS handshake (0 on a reused
+    connection), emit, server wait (last byte sent to result received),
+    response decode (transcript and duration extraction), JSON write and
+    CSV write. bytes_received is the size of the response as compact JSON.
+    """
+    phases = result.get('phases', {})
+    bytes_received = None
+    if result['data']:
+        bytes_received = len(json.dumps(result['data'], separators=(',', ':')))
+    
+    record = {
+        'timestamp': datetime.now().isoformat(),
+        'audio_file_path': str(audio_file),
+        'success': bool(result['success'] and result['data']),
+        'error': result.get('error'),
+        'reused_connection': result.get('reused_connection', False),
+        'bytes_sent': result.get('bytes_sent', 0),
+        'bytes_received': bytes_received,
+        'total_seconds': round(result['timings']['total_time'], 6) if result['timings'].get('total_time') else None,
+        'phases': {
+            name: round(phases[name], 6) if phases.get(name) is not None else None
+            for name in TRACE_PHASES
+        }
+    }
+    
+    line = json.dumps(record, ensure_ascii=False)
+    if result_writer:
+        result_writer.append_line(trace_path_for(csv_output), line)
+        return
+    with open(trace_path_for(csv_output), 'a', encoding='utf-8') as f:
+        f.write(line + '\n')
+
+
+def print_trace_summary(trace_paths, since):
+    """Print mean and p95 per phase for trace records written after `since`"""
+    records = []
+    for trace_path in trace_paths:
+        if not Path(trace_path).exists():
+            continue
+        with open(trace_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if record['timestamp'] >= since:
+                    records.append(record)
+    if not records:
+        return
+    
+    means = {}
+    print(f"Request phases ({len(records)} traced requests):")
+    for name in TRACE_PHASES:
+        values = [r['phases'][name] for r in records if r['phases'].get(name) is not None]
+        if values:
+            means[name] = sum(values) / len(values)
+            print(f"  {name:<12} mean {means[name]:.3f}s  p95 {percentile(values, 95):.3f}s")
+    total = sum(means.values())
+    if total:
+        slowest = max(means, key=means.get)
+        print(f"  Largest share: {slowest} ({means[slowest] / total:.0%} of traced time)")
+    sent = sum(r['bytes_sent'] or 0 for r in records)
+    received = sum(r['bytes_received'] or 0 for r in records)
+    print(f"  Bytes sent: {sent / 1024 / 1024:.1f} MB, received: {received / 1024 / 1024:.1f} MB")
+
+
+def append_stream_timing(csv_output, audio_file, result, result_writer=None):
+    """Log stream-mode timings next to the main CSV for comparison with upload mode"""
+    csv_path = Path(csv_output)
+    timing_path = csv_path.parent / f"{csv_path.stem}_stream_timing{csv_path.suffix}"
+    row = {
+        'audio_file_path': str(audio_file),
+        'chunks_sent': result.get('stream_chunks', 'N/A'),
+        'result_events': result.get('stream_events', 'N/A'),
+        'time_to_first_result_seconds': f"{result['time_to_first_result']:.3f}",
+        'time_to_final_result_seconds': f"{result['time_to_final_result']:.3f}"
+    }
+    if result_writer:
+        result_writer.append_row(timing_path, row, STREAM_TIMING_FIELDNAMES)
+        return
+    
+    file_exists = timing_path.exists()
+    with open(timing_path, 'a', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=STREAM_TIMING_FIELDNAMES)
+        
+        if not file_exists:
+            writer.writeheader()
+        
+        writer.writerow(row)
+
+
+def append_error_to_csv(csv_path, audio_file, message, result_writer=None):
+    """Log a failed file to the CSV"""
+    csv_row = {
+        'audio_file_path': str(audio_file),
+        'transcription_file_path': 'ERROR',
+        'transcript': message,
+        'audio_length_seconds': 'N/A',
+        'api_response_time_seconds': 'N/A'
+    }
+    append_to_csv(csv_path, csv_row, result_writer)
+
+
+def process_files_sequential(files_to_process, client, csv_output, controller=None, mode='upload', tracker=None,
+                             state=None, result_writer=None):
+    """Transcribe files one at a time
+    
+    Between requests, pauses for the controller's delay (zero while the
+    server is healthy) or the fixed REQUEST_DELAY if no controller is given.
+    """
     success_count = 0
     error_count = 0
     
@@ -297,91 +689,263 @@ def process_audio_files(process_remaining=False):
         print(f"\n[{idx}/{len(files_to_process)}] Processing: {audio_file.name}")
         print(f"  Path: {audio_file}")
         
+        if tracker:
+            tracker.start(audio_file)
+        if state:
+            state.mark_started(item_files(audio_file))
         try:
             # Transcribe
-            result = transcribe_audio(str(audio_file))
+            result = transcribe_audio(audio_file, client, mode)
             
-            if result['success'] and result['data']:
-                # Save JSON response in the same folder as audio file
-                json_path = audio_file.with_suffix('.json')
-                
-                with open(json_path, 'w', encoding='utf-8') as f:
-                    json.dump(result['data'], f, ensure_ascii=False, indent=2)
-                
-                print(f"  ✓ Saved JSON: {json_path.name}")
-                
-                # Extract transcript
-                transcript = extract_transcript_text(result['data'])
-                
-                # Get audio duration from API response
-                duration = get_audio_duration_from_api(result['data'])
-                if duration is None:
-                    duration = get_audio_duration_estimate(str(audio_file))
-                
-                # Append to CSV
-                csv_row = {
-                    'audio_file_path': str(audio_file),
-                    'transcription_file_path': str(json_path),
-                    'transcript': transcript,
-                    'audio_length_seconds': f"{duration:.2f}" if duration else 'N/A',
-                    'api_response_time_seconds': f"{result['api_response_time']:.2f}" if result['api_response_time'] else 'N/A'
-                }
-                
-                append_to_csv(csv_output, csv_row)
-                print(f"  ✓ Updated CSV")
-                print(f"  ✓ Transcript: {transcript[:100]}..." if len(transcript) > 100 else f"  ✓ Transcript: {transcript}")
-                
-                success_count += 1
-                
-            else:
-                error_msg = result.get('error', 'Unknown error')
-                print(f"  ✗ Failed: {error_msg}")
-                error_count += 1
-                
-                # Log error to CSV
-                csv_row = {
-                    'audio_file_path': str(audio_file),
-                    'transcription_file_path': 'ERROR',
-                    'transcript': f'ERROR: {error_msg}',
-                    'audio_length_seconds': 'N/A',
-                    'api_response_time_seconds': 'N/A'
-                }
-                append_to_csv(csv_output, csv_row)
+            successes, errors = save_item(audio_file, result, csv_output, state, result_writer)
+            success_count += successes
+            error_count += errors
+            if tracker:
+                tracker.finish(audio_file)
             
-            # Small delay between requests
-            time.sleep(REQUEST_DELAY)
+            # Delay between requests
+            if controller:
+                controller.record(result['api_response_time'], None if result['success'] else result['error'])
+                time.sleep(controller.delay())
+            else:
+                time.sleep(REQUEST_DELAY)
             
         except Exception as e:
             print(f"  ✗ Exception: {e}")
-            error_count += 1
-            
-            # Log error to CSV
-            csv_row = {
-                'audio_file_path': str(audio_file),
-                'transcription_file_path': 'ERROR',
-                'transcript': f'EXCEPTION: {str(e)}',
-                'audio_length_seconds': 'N/A',
-                'api_response_time_seconds': 'N/A'
-            }
-            append_to_csv(csv_output, csv_row)
+            error_count += append_item_error(csv_output, audio_file, f'EXCEPTION: {str(e)}', state, result_writer)
+            if tracker and audio_file not in tracker.finished:
+                tracker.finish(audio_file)
+            if controller:
+                controller.record(None, str(e))
     
-    # Summary
-    print("\n" + "=" * 80)
-    print("BATCH TRANSCRIPTION COMPLETE")
-    print("=" * 80)
-    print(f"Total processed: {len(files_to_process)}")
-    print(f"Successful: {success_count}")
-    print(f"Failed: {error_count}")
-    print(f"CSV output: {csv_output}")
-    print("=" * 80)
+    client.close()
+    return success_count, error_count
+
+
+async def process_files_async(files_to_process, client, csv_output, concurrency, controller=None, mode='upload',
+                              tracker=None, state=None, result_writer=None):
+    """Transcribe files with up to `concurrency` requests in flight
+    
+    Each worker takes the next file from a shared iterator, so results are
+    written in completion order rather than path order. No REQUEST_DELAY is
+    applied: the number of workers, narrowed further by the controller's
+    limit if one is given, is what bounds the load on the server.
+    """
+    counts = {'success': 0, 'error': 0, 'done': 0}
+    total = len(files_to_process)
+    pending = iter(files_to_process)
+    limiter = AsyncAdaptiveLimiter(controller) if controller else None
+    loop = asyncio.get_running_loop()
+    
+    async def send(item):
+        if isinstance(item, ClipPack):
+            audio_data = await loop.run_in_executor(None, item.to_wav_bytes)
+            return await client.transcribe_data(audio_data)
+        if isinstance(item, SegmentedFile):
+            return await transcribe_segmented_async(item, client)
+        if mode == 'stream':
+            return await client.transcribe_stream(str(item))
+        return await client.transcribe(str(item))
+    
+    async def transcribe(audio_file):
+        # The tracker counts a file from when it is sent, not while it waits for the limiter
+        if limiter is None:
+            if tracker:
+                tracker.start(audio_file)
+            return await send(audio_file)
+        async with limiter:
+            if tracker:
+                tracker.start(audio_file)
+            result = await send(audio_file)
+            controller.record(result['api_response_time'], None if result['success'] else result['error'])
+            return result
+    
+    async def worker():
+        for audio_file in pending:
+            if state:
+                state.mark_started(item_files(audio_file))
+            try:
+                result = await transcribe(audio_file)
+                counts['done'] += 1
+                print(f"\n[{counts['done']}/{total}] {audio_file.name}")
+                print(f"  Path: {audio_file}")
+                
+                successes, errors = save_item(audio_file, result, csv_output, state, result_writer)
+                counts['success'] += successes
+                counts['error'] += errors
+            except Exception as e:
+                counts['done'] += 1
+                print(f"\n[{counts['done']}/{total}] {audio_file.name}")
+                print(f"  ✗ Exception: {e}")
+                counts['error'] += append_item_error(csv_output, audio_file, f'EXCEPTION: {str(e)}', state,
+                                                     result_writer)
+                if controller:
+                    controller.record(None, str(e))
+            if tracker and audio_file in tracker.started:
+                tracker.finish(audio_file)
+    
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        await client.close()
+    
+    return counts['success'], counts['error']
+
+
+def shard_for_path(audio_file, num_shards):
+    """Deterministic shard index for a file, stable across runs and processes
+    
+    Uses CRC32 of the path rather than hash(), which is randomized per process.
+    """
+    key = Path(audio_file).as_posix().encode('utf-8')
+    return zlib.crc32(key) % num_shards
+
+
+def shard_csv_path(csv_output, shard_index):
+    """Per-shard CSV written by one worker process"""
+    csv_path = Path(csv_output)
+    return str(csv_path.parent / f"{csv_path.stem}_shard{shard_index}{csv_path.suffix}")
+
+
+def run_shard(shard_index, files, csv_output, options, estimates=None):
+    """Worker process entry point: transcribe one shard into its own CSV"""
+    shard_csv = shard_csv_path(csv_output, shard_index)
+    success_count, error_count, stats = run_files(files, shard_csv, options, estimates)
+    return shard_index, success_count, error_count, stats
+
+
+def process_files_sharded(files_to_process, csv_output, options, estimates=None):
+    """Split files into shards by path hash and run one worker process per shard
+    
+    Each worker opens its own connection(s) and writes a separate CSV, so no
+    file handle is shared between processes. Shard CSVs are merged into
+    csv_output once all workers finish. Every shard keeps the order of
+    files_to_process, so a longest-first order carries over to each worker.
+    """
+    estimates = estimates or {}
+    workers = options['workers']
+    shards = [[] for _ in range(workers)]
+    for audio_file in files_to_process:
+        shards[shard_for_path(audio_file, workers)].append(audio_file)
+    
+    for shard_index, shard in enumerate(shards):
+        print(f"  Shard {shard_index}: {len(shard)} files -> {shard_csv_path(csv_output, shard_index)}")
+    
+    success_count = 0
+    error_count = 0
+    stats_list = []
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(run_shard, shard_index, shard, csv_output, options,
+                            {f: estimates[f] for f in shard if f in estimates})
+            for shard_index, shard in enumerate(shards) if shard
+        ]
+        for future in as_completed(futures):
+            shard_index, shard_success, shard_errors, stats = future.result()
+            print(f"\n✓ Shard {shard_index} finished: {shard_success} successful, {shard_errors} failed")
+            success_count += shard_success
+            error_count += shard_errors
+            stats_list.append(stats)
+    
+    merged = merge_shard_csvs(csv_output)
+    print(f"\nMerged {merged} rows from shard CSVs into {csv_output}")
+    
+    return success_count, error_count, combine_pool_stats(stats_list)
+
+
+def merge_shard_csvs(csv_output):
+    """Append rows from all shard CSVs to csv_output without duplicates
+    
+    One row is kept per audio file: a successful row wins over ERROR rows,
+    and files that already have a successful row in csv_output are skipped.
+    Shard CSVs are removed after a successful merge.
+    
+    Returns:
+        Number of rows appended
+    """
+    csv_path = Path(csv_output)
+    # Only the shard CSVs themselves, not their *_rate_control / *_stream_timing logs
+    shard_name = re.compile(re.escape(csv_path.stem) + r"_shard\d+" + re.escape(csv_path.suffix) + "$")
+    shard_files = sorted(p for p in csv_path.parent.glob(f"{csv_path.stem}_shard*") if shard_name.match(p.name))
+    if not shard_files:
+        return 0
+    
+    already_done = set()
+    if csv_path.exists():
+        with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                if row.get('transcription_file_path') != 'ERROR':
+                    already_done.add(row['audio_file_path'])
+    
+    # Keep insertion order so the merged CSV is deterministic
+    best_rows = {}
+    for shard_file in shard_files:
+        with open(shard_file, 'r', newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                audio_path = row['audio_file_path']
+                if audio_path in already_done:
+                    continue
+                previous = best_rows.get(audio_path)
+                if previous is None or previous['transcription_file_path'] == 'ERROR':
+                    best_rows[audio_path] = row
+    
+    with ResultWriter() as result_writer:
+        for row in best_rows.values():
+            append_to_csv(csv_output, row, result_writer)
+    
+    for shard_file in shard_files:
+        shard_file.unlink()
+    
+    return len(best_rows)
 
 
 if __name__ == "__main__":
     # Check command line arguments
-    process_remaining = '--remaining' in sys.argv or '-r' in sys.argv
+    parser = argparse.ArgumentParser(description="Batch transcription for STT model evaluation")
+    parser.add_argument('-r', '--remaining', action='store_true',
+                        help="Process only the 'remaining' folder")
+    parser.add_argument('-c', '--concurrency', type=int, default=None,
+                        help="Most requests kept in flight (default: MAX_CONCURRENCY with adaptive rate control, "
+                             "1 with --fixed-delay)")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help="Number of worker processes, one shard of the files each (default: 1)")
+    parser.add_argument('--fixed-delay', action='store_true',
+                        help="Disable adaptive rate control and wait REQUEST_DELAY between requests")
+    parser.add_argument('--mode', choices=['upload', 'stream'], default='upload',
+                        help="Send whole files (upload) or chunks as they are read (stream)")
+    parser.add_argument('--schedule', choices=SCHEDULE_POLICIES, default='longest-first',
+                        help="Processing order by estimated audio duration (default: longest-first)")
+    parser.add_argument('--pack', action='store_true',
+                        help="Join short WAV clips into one upload and split the result by word timestamps")
+    parser.add_argument('--pack-check', type=int, default=0, metavar='N',
+                        help="With --pack, also send N packed clips alone and report the accuracy difference")
+    parser.add_argument('--segment', action='store_true',
+                        help="Split long WAV files at pauses and transcribe the segments in parallel")
+    parser.add_argument('--full-rescan', action='store_true',
+                        help="List every folder again instead of reusing unchanged folders from the scan cache")
+    parser.add_argument('--store', choices=['sidecar', 'jsonl'], default=RESPONSE_STORE,
+                        help="Write responses as JSON sidecars or to the packed JSONL response store")
+    parser.add_argument('--compress', choices=['none', 'gzip', 'zstd'], default=STORE_COMPRESSION or 'none',
+                        help="Shard compression for --store jsonl (zstd needs the zstandard package)")
+    args = parser.parse_args()
+    
+    options = make_options(
+        concurrency=args.concurrency,
+        workers=args.workers,
+        adaptive=ADAPTIVE_RATE and not args.fixed_delay,
+        mode=args.mode,
+        schedule=args.schedule,
+        pack=args.pack,
+        pack_check=args.pack_check,
+        segment=args.segment,
+        full_rescan=args.full_rescan,
+        store=args.store,
+        compression=None if args.compress == 'none' else args.compress,
+    )
     
     try:
-        process_audio_files(process_remaining=process_remaining)
+        process_audio_files(process_remaining=args.remaining, options=options)
     except KeyboardInterrupt:
         print("\n\nProcess interrupted by user")
         print("Progress has been saved to CSV")
@@ -1,94 +1,153 @@
 """
 Check progress of batch transcription
+
+Reads the run-state database written by batch_transcribe_v2.py (per-status
+totals, so this is instant on any corpus size). Without a database it falls
+back to scanning the corpus and counting CSV rows.
+
+Usage:
+    python check_progress.py                     # Progress summary
+    python check_progress.py --remaining         # Same, for the 'remaining' folder run
+    python check_progress.py --failed 50         # List up to 50 failed files with their last error
+    python check_progress.py --requeue           # Retry all failed files on the next run
+    python check_progress.py --requeue --error Timeout   # Only failures whose error contains 'Timeout'
+    python check_progress.py --import-csv        # Load state from the existing CSV
+    python check_progress.py --import-json       # Mark files with a JSON sidecar as done
 """
 
+import argparse
 import os
 import csv
-from pathlib import Path
+
+from corpus_scan import scan_corpus
+from run_state import MAX_ATTEMPTS, STATUSES, RunState, csv_path_for_run, state_path_for
 
 try:
-    from config import AUDIO_BASE_DIR, API_RESPONSE_DIR, CSV_OUTPUT_PATH, AUDIO_EXTENSIONS
+    from config import AUDIO_BASE_DIR
 except ImportError:
-    AUDIO_BASE_DIR = r"D:\cv-corpus-23.0-2025-09-05\bn\clips"
-    API_RESPONSE_DIR = r"D:\cv-corpus-23.0-2025-09-05\bn\csedu_labels"
-    CSV_OUTPUT_PATH = r"D:\cv-corpus-23.0-2025-09-05\bn\transcription_results.csv"
-    AUDIO_EXTENSIONS = ['.wav', '.flac', '.mp3', '.m4a', '.ogg']
-
-
-def count_audio_files():
-    """Count total audio files"""
-    audio_files = []
-    base_path = Path(AUDIO_BASE_DIR)
-    
-    for ext in AUDIO_EXTENSIONS:
-        audio_files.extend(base_path.rglob(f'*{ext}'))
-    
-    return len(audio_files)
-
-
-def count_transcripts():
-    """Count existing transcripts"""
-    response_path = Path(API_RESPONSE_DIR)
-    
-    if not response_path.exists():
-        return 0
-    
-    return len(list(response_path.glob('*.json')))
-
-
-def count_csv_entries():
-    """Count entries in CSV"""
-    if not os.path.exists(CSV_OUTPUT_PATH):
-        return 0
-    
-    with open(CSV_OUTPUT_PATH, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        return sum(1 for row in reader)
+    AUDIO_BASE_DIR = r"D:\cv_eval_bn\validated"
 
 
-def count_errors():
-    """Count errors in CSV"""
-    if not os.path.exists(CSV_OUTPUT_PATH):
-        return 0
-    
+def count_csv_entries(csv_output):
+    """Count entries and ERROR rows in CSV"""
+    if not os.path.exists(csv_output):
+        return 0, 0
+
+    entries = 0
     error_count = 0
-    with open(CSV_OUTPUT_PATH, 'r', encoding='utf-8') as f:
+    with open(csv_output, 'r', encoding='utf-8') as f:
         reader = csv.DictReader(f)
         for row in reader:
-            if row.get('transcript_file_path') == 'ERROR':
+            entries += 1
+            # v2 CSVs use transcription_file_path, the original script transcript_file_path
+            if row.get('transcription_file_path', row.get('transcript_file_path')) == 'ERROR':
                 error_count += 1
-    
-    return error_count
+
+    return entries, error_count
+
+
+def print_state_summary(state):
+    """Progress from the run-state totals"""
+    totals = state.totals()
+    tracked = sum(t['files'] for t in totals.values())
+    done = totals['done']
+
+    print(f"\nFiles tracked:            {tracked}")
+    for status in STATUSES:
+        print(f"  {status:<22}  {totals[status]['files']}")
+    exhausted = len(state.exhausted())
+    if exhausted:
+        print(f"  (failed {MAX_ATTEMPTS}+ times: {exhausted}, skipped until requeued)")
+
+    if tracked > 0:
+        print(f"\nProgress:                 {done['files'] / tracked * 100:.1f}%")
+    if done['audio_seconds']:
+        print(f"Audio transcribed:        {done['audio_seconds'] / 3600:.2f} hours")
+        print(f"Mean RTF:                 {done['response_seconds'] / done['audio_seconds']:.3f}")
+
+    errors = state.error_counts(5)
+    if errors:
+        print("\nMost common errors:")
+        for error, count in errors:
+            print(f"  {count:>7}  {(error or '')[:70]}")
+    return tracked - done['files']
+
+
+def print_scan_summary(csv_output, process_remaining):
+    """Progress without a state database: one corpus scan plus the CSV"""
+    scan = scan_corpus(AUDIO_BASE_DIR, process_remaining)
+    csv_entries, error_count = count_csv_entries(csv_output)
+
+    print(f"\nTotal audio files:        {scan['audio_files']}")
+    print(f"Transcripts generated:    {scan['transcribed']}")
+    print(f"CSV entries:              {csv_entries}")
+    print(f"Errors:                   {error_count}")
+    print(f"Remaining:                {len(scan['pending'])}")
+
+    if scan['audio_files'] > 0:
+        progress = (scan['transcribed'] / scan['audio_files']) * 100
+        print(f"\nProgress:                 {progress:.1f}%")
+    return len(scan['pending'])
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Batch transcription progress and run-state maintenance")
+    parser.add_argument('-r', '--remaining', action='store_true',
+                        help="Use the state of the 'remaining' folder run")
+    parser.add_argument('--db', help="Run-state database (default: next to the CSV)")
+    parser.add_argument('--failed', type=int, nargs='?', const=20, metavar='N',
+                        help="List up to N failed files (default 20)")
+    parser.add_argument('--requeue', action='store_true',
+                        help="Reset failed files so the next run retries them")
+    parser.add_argument('--error', metavar='TEXT',
+                        help="With --failed/--requeue, only failures whose last error contains TEXT")
+    parser.add_argument('--import-csv', nargs='?', const='', metavar='CSV',
+                        help="Load done/failed files from a batch CSV (default: the configured CSV)")
+    parser.add_argument('--import-json', action='store_true',
+                        help="Mark audio files that have a JSON sidecar as done")
+    args = parser.parse_args()
+
+    csv_output = csv_path_for_run(args.remaining)
+    db_path = args.db or str(state_path_for(csv_output))
+
     print("=" * 60)
     print("BATCH TRANSCRIPTION PROGRESS")
     print("=" * 60)
-    
-    total_audio = count_audio_files()
-    total_transcripts = count_transcripts()
-    csv_entries = count_csv_entries()
-    error_count = count_errors()
-    
-    print(f"\nTotal audio files:        {total_audio}")
-    print(f"Transcripts generated:    {total_transcripts}")
-    print(f"CSV entries:              {csv_entries}")
-    print(f"Errors:                   {error_count}")
-    print(f"Remaining:                {total_audio - total_transcripts}")
-    
-    if total_audio > 0:
-        progress = (total_transcripts / total_audio) * 100
-        print(f"\nProgress:                 {progress:.1f}%")
-    
+
+    if args.import_csv is not None or args.import_json:
+        with RunState(db_path) as state:
+            if args.import_csv is not None:
+                source = args.import_csv or csv_output
+                done, failed = state.import_csv(source)
+                print(f"Imported from {source}: {done} done, {failed} failed")
+            if args.import_json:
+                scan = scan_corpus(AUDIO_BASE_DIR, args.remaining, collect_transcribed=True)
+                added = state.import_sidecars(scan['transcribed_files'])
+                print(f"Imported from JSON sidecars: {added} files marked done "
+                      f"({scan['transcribed']} sidecars in {scan['seconds']:.1f}s)")
+
+    if not os.path.exists(db_path):
+        print(f"No run-state database at {db_path}, counting files instead")
+        remaining = print_scan_summary(csv_output, args.remaining)
+    else:
+        with RunState(db_path) as state:
+            if args.requeue:
+                print(f"Requeued {state.requeue(args.error)} failed files")
+            if args.failed:
+                print(f"\nFailed files (attempts, last error):")
+                for audio_path, attempts, error in state.failed(args.failed, args.error):
+                    print(f"  {attempts:>2}  {audio_path}")
+                    print(f"      {(error or '')[:100]}")
+            remaining = print_state_summary(state)
+
     print("\n" + "=" * 60)
-    
-    if total_transcripts < total_audio:
-        print(f"\n{total_audio - total_transcripts} files remaining to process")
-        print("Run batch_transcribe.py to continue")
+
+    if remaining:
+        print(f"\n{remaining} files remaining to process")
+        print("Run batch_transcribe_v2.py to continue")
     else:
         print("\nAll files have been processed!")
-    
+
     print("=" * 60)
 
 
@@ -0,0 +1,247 @@
+"""
+Short-clip packing for batch transcription
+
+Most Common Voice clips are only a few seconds long, so the fixed cost of a
+request (handshake, upload, model warm-up on the server) dominates. Packing
+joins several short WAV clips into one upload, separated by silence gaps of
+known length. The returned `predicted_words` are split back into per-clip
+transcripts by their `timestamp` field: a word belongs to the clip whose
+span (extended halfway into the neighbouring gaps) contains its midpoint.
+Timestamps are shifted so each per-clip JSON looks like a standalone response.
+
+Only WAV clips with the same sample rate, channel count and sample width can
+share a pack; anything else, and clips longer than PACK_MAX_CLIP_SECONDS, is
+sent alone as before.
+"""
+
+import csv
+import io
+import wave
+from bisect import bisect_right
+
+from compare_output import levenshtein_distance
+from text_normalization import normalize_text
+
+try:
+    from config import PACK_MAX_CLIP_SECONDS, PACK_MAX_SECONDS, PACK_GAP_SECONDS
+except ImportError:
+    PACK_MAX_CLIP_SECONDS = 10
+    PACK_MAX_SECONDS = 60
+    PACK_GAP_SECONDS = 1.0
+
+try:
+    from config import TIMESTAMP_RATE
+except ImportError:
+    TIMESTAMP_RATE = 16000
+
+
+class ClipPack:
+    """Clips sent together as one upload
+
+    Only headers are read while packing; the audio itself is read in
+    to_wav_bytes(), right before the pack is sent.
+    """
+
+    def __init__(self, pack_id, params, gap_seconds=PACK_GAP_SECONDS):
+        self.pack_id = pack_id
+        self.params = params  # (nchannels, sampwidth, framerate)
+        self.gap_seconds = gap_seconds
+        self.segments = []  # (audio_file, start seconds, end seconds)
+        self.duration = 0.0
+
+    @property
+    def name(self):
+        return f"pack {self.pack_id} ({len(self.segments)} clips)"
+
+    @property
+    def files(self):
+        return [audio_file for audio_file, _, _ in self.segments]
+
+    def __str__(self):
+        return f"pack{self.pack_id}:{self.segments[0][0]}" if self.segments else f"pack{self.pack_id}"
+
+    def fits(self, duration, max_seconds):
+        gap = self.gap_seconds if self.segments else 0.0
+        return self.duration + gap + duration <= max_seconds
+
+    def add(self, audio_file, duration):
+        start = self.duration + (self.gap_seconds if self.segments else 0.0)
+        self.segments.append((audio_file, start, start + duration))
+        self.duration = start + duration
+
+    def to_wav_bytes(self):
+        """Concatenate the clips with silence gaps into one WAV file in memory"""
+        nchannels, sampwidth, framerate = self.params
+        gap = b'\0' * (int(self.gap_seconds * framerate) * nchannels * sampwidth)
+
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as out:
+            out.setnchannels(nchannels)
+            out.setsampwidth(sampwidth)
+            out.setframerate(framerate)
+            for i, (audio_file, _, _) in enumerate(self.segments):
+                if i:
+                    out.writeframes(gap)
+                with wave.open(str(audio_file), 'rb') as clip:
+                    out.writeframes(clip.readframes(clip.getnframes()))
+        return buffer.getvalue()
+
+
+def read_wav_info(audio_file):
+    """Return ((nchannels, sampwidth, framerate), duration) or None if not a readable WAV"""
+    if not str(audio_file).lower().endswith('.wav'):
+        return None
+    try:
+        with wave.open(str(audio_file), 'rb') as w:
+            params = (w.getnchannels(), w.getsampwidth(), w.getframerate())
+            return params, w.getnframes() / float(w.getframerate())
+    except (wave.Error, EOFError, OSError):
+        return None
+
+
+def build_packs(files, max_clip_seconds=PACK_MAX_CLIP_SECONDS, max_pack_seconds=PACK_MAX_SECONDS,
+                gap_seconds=PACK_GAP_SECONDS):
+    """Group short WAV clips into packs, keeping the given order within each pack
+
+    Returns:
+        (list of ClipPack, list of files to send alone)
+    """
+    packs = []
+    singles = []
+    open_packs = {}
+
+    for audio_file in files:
+        info = read_wav_info(audio_file)
+        if info is None or info[1] > max_clip_seconds:
+            singles.append(audio_file)
+            continue
+
+        params, duration = info
+        pack = open_packs.get(params)
+        if pack is None or not pack.fits(duration, max_pack_seconds):
+            pack = ClipPack(len(packs), params, gap_seconds)
+            packs.append(pack)
+            open_packs[params] = pack
+        pack.add(audio_file, duration)
+
+    # A pack of one clip gains nothing
+    for pack in [p for p in packs if len(p.segments) == 1]:
+        packs.remove(pack)
+        singles.append(pack.segments[0][0])
+
+    return packs, singles
+
+
+def split_words(words, segments, rate=TIMESTAMP_RATE):
+    """Assign predicted_words to clips by timestamp midpoint
+
+    Returns:
+        list (one per segment) of word lists, timestamps relative to the clip start
+    """
+    # Boundaries halfway through each gap
+    boundaries = [(segments[i][2] + segments[i + 1][1]) / 2 for i in range(len(segments) - 1)]
+    per_clip = [[] for _ in segments]
+
+    for word in words:
+        timestamp = word.get('timestamp')
+        if not timestamp:
+            continue
+        midpoint = (timestamp[0] + timestamp[1]) / 2 / rate
+        index = bisect_right(boundaries, midpoint)
+        offset = int(round(segments[index][1] * rate))
+        shifted = dict(word)
+        shifted['timestamp'] = [max(0, timestamp[0] - offset), max(0, timestamp[1] - offset)]
+        per_clip[index].append(shifted)
+
+    # Separators that landed at a clip edge belong to neither clip
+    for clip_words in per_clip:
+        strip_edge_separators(clip_words)
+    return per_clip
+
+
+def strip_edge_separators(words):
+    """Drop whitespace-only words from both ends of a word list, in place"""
+    while words and not words[0]['word'].strip():
+        words.pop(0)
+    while words and not words[-1]['word'].strip():
+        words.pop()
+    return words
+
+
+def split_pack_result(pack, result):
+    """Turn one pack result into per-clip result dicts save_result() can write
+
+    Each clip gets the pack's API response time, bytes sent and phase times
+    scaled by its share of the packed audio, so RTF and the phase summary
+    stay comparable with unpacked rows and add up to the pack's totals.
+    """
+    if not (result['success'] and result['data']):
+        return [(audio_file, result) for audio_file in pack.files]
+
+    words = result['data'].get('output', {}).get('predicted_words', [])
+    per_clip = split_words(words, pack.segments)
+    clip_results = []
+
+    for (audio_file, start, end), clip_words in zip(pack.segments, per_clip):
+        clip_result = dict(result)
+        clip_result['data'] = {
+            'index': result['data'].get('index', '0'),
+            'output': {'predicted_words': clip_words},
+            'packing': {
+                'pack_id': pack.pack_id,
+                'clips_in_pack': len(pack.segments),
+                'offset_seconds': round(start, 3)
+            }
+        }
+        clip_result['audio_duration'] = end - start
+        clip_result['phases'] = dict(result.get('phases', {}))
+        if pack.duration:
+            share = (end - start) / pack.duration
+            clip_result['phases'] = {name: seconds * share for name, seconds in clip_result['phases'].items()}
+            clip_result['bytes_sent'] = int(result.get('bytes_sent', 0) * share)
+            if result['api_response_time']:
+                clip_result['api_response_time'] = result['api_response_time'] * share
+        clip_results.append((audio_file, clip_result))
+    return clip_results
+
+
+def compare_transcripts(rows, report_path):
+    """Summarize how packed transcripts differ from the same clips sent alone
+
+    Transcripts are compared after normalize_text(), so punctuation and
+    spacing the model places differently around clip boundaries are not edits.
+
+    Args:
+        rows: list of (audio_file, solo transcript, packed transcript)
+        report_path: CSV receiving one row per compared clip
+    """
+    total_chars = 0
+    total_edits = 0
+    exact = 0
+
+    with open(report_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=['audio_file_path', 'solo_transcript', 'packed_transcript',
+                                               'char_edits', 'cer_vs_solo'])
+        writer.writeheader()
+        for audio_file, solo, packed in rows:
+            solo_text = normalize_text(solo)
+            packed_text = normalize_text(packed)
+            edits = levenshtein_distance(solo_text, packed_text)
+            total_edits += edits
+            total_chars += len(solo_text)
+            exact += solo_text == packed_text
+            writer.writerow({
+                'audio_file_path': str(audio_file),
+                'solo_transcript': solo,
+                'packed_transcript': packed,
+                'char_edits': edits,
+                'cer_vs_solo': f"{edits / len(solo_text):.4f}" if solo_text else 'N/A'
+            })
+
+    print(f"Packing accuracy check: {len(rows)} clips also sent alone")
+    if rows:
+        print(f"  Identical transcripts: {exact}/{len(rows)} ({exact / len(rows):.1%})")
+        if total_chars:
+            print(f"  Character difference vs solo: {total_edits / total_chars:.2%} "
+                  f"({total_edits} edits over {total_chars} chars)")
+    print(f"  Details: {report_path}")
@@ -1,162 +1,434 @@
-import os 
-import json
-import csv
-
-def dp_lcs(X, Y, i, j, memo):
-    if i == len(X) or j == len(Y):
-        memo[(i, j)] = 0
-        return 0
-    if (i, j) in memo:
-        return memo[(i, j)]
-    if X[i] == Y[j]:
-        memo[(i, j)] = 1 + dp_lcs(X, Y, i + 1, j + 1, memo)
-    else:
-        memo[(i, j)] = max(dp_lcs(X, Y, i + 1, j, memo), dp_lcs(X, Y, i, j + 1, memo))
-    return memo[(i, j)]
-
-def matches(i, j, X, Y, m, memo=None):
-    if i == len(X) or j == len(Y):
-        return
-    if X[i] == Y[j]:
-        m.append(i) 
-        matches(i + 1, j + 1, X, Y, m, memo)
-    else:
-        if memo[(i, j + 1)] >= memo[(i + 1, j)]:
-            matches(i, j + 1, X, Y, m, memo)
-        else:
-            matches(i + 1, j, X, Y, m, memo)
-    return 
-
-def error_calculation(X, Y):
-    memo = {}
-    lcs_length = dp_lcs(X, Y, 0, 0, memo)
-    print(f"LCS length: {lcs_length}")
-    errors = len(X) - lcs_length 
-    match_indices = []
-    matches(0, 0, X, Y, match_indices, memo) 
-    track = []
-    for i in range(len(X)):
-        if i not in match_indices:
-            track.append(X[i])
-    return errors, track
-
-
-def collect_files(folder):
-    save_path = []
-    files = os.listdir(folder)
-    for i in range(0, len(files)):
-        files[i] = os.path.join(folder, files[i])
-        if os.path.isfile(files[i]):
-            save_path.append(files[i])
-    return save_path 
-
-def read_from_json(file_name):
-    # Replace 'your_file_name.json' with the actual path to your file
-    try:
-        with open(file_name, 'r', encoding='utf-8') as file:
-            # json.load() reads the file object and parses the JSON content
-            data = json.load(file)
-        
-        # 'data' is now a Python object (usually a dictionary or list)
-        print(type(data))
-        print(data)
-        return data 
-
-    except FileNotFoundError:
-        print(f"Error: The file 'your_file_name.json' was not found.")
-    except json.JSONDecodeError:
-        print(f"Error: The content of 'your_file_name.json' is not valid JSON.")
-        pass 
-    
-def make_sentence(json_data):
-    print("came ", json_data)
-    predicted_words = json_data['output']['predicted_words']
-    sentence = ""
-    for i in range(0, len(predicted_words)):
-        if predicted_words[i].get('word') != " ":
-            sentence = sentence + " " + predicted_words[i].get('word')
-    sentence = sentence.strip()
-    return sentence 
-        
-
-def read_from_text(file_path):
-    """
-    Reads a text file by trying common encodings (UTF-8, Latin-1, CP1252)
-    until one succeeds.
-
-    Args:
-        file_path (str): The path to the text file.
-
-    Returns:
-        str: The contents of the file as a single string, or None if reading fails.
-    """
-    if not os.path.exists(file_path):
-        print(f"Error: File not found at {file_path}")
-        return ""
-        
-    # The order matters: start with the preferred/modern encoding (UTF-8)
-    encodings_to_try = ['utf-8', 'latin-1', 'cp1252']
-    
-    for encoding in encodings_to_try:
-        try:
-            with open(file_path, 'r', encoding=encoding) as f:
-                # Read the entire file content
-                content = f.read()
-                print(f"Successfully read file with encoding: {encoding}")
-                return content
-        except UnicodeDecodeError:
-            # If the current encoding fails, the loop continues to the next one
-            continue
-        except Exception as e:
-            # Catch other potential I/O errors (e.g., permission denied)
-            print(f"An unexpected error occurred while reading with {encoding}: {e}")
-            return ""
-            
-    # If the loop completes without returning, none of the encodings worked
-    print(f"Failed to decode file {file_path} with all tested encodings.")
-    return ""
-
-def process(base, api_output, statistics_file_name='error_statistics.csv', counter = -1):
-
-    f = open(os.path.join(statistics_file_name), 'w', newline="", encoding='utf-8') # newly creation 
-    csv_writer = csv.writer(f)
-    csv_writer.writerow(['file_name', 'annotated', 'generated', 'total_characters', 'total_words', 'cer', 'wer', 'missed_characters'])
-
-    f_base = collect_files(base)
-    flag = {}
-    for i in range(0, len(f_base)):
-        basename = os.path.basename(f_base[i])
-        flag[basename.split('.')[0]] = f_base[i]
-    f_api = collect_files(api_output)
-    print(len(f_api), len(f_base))
-    tot = 0 
-    for i in range(0, len(f_api)):
-        tot += 1 
-        basename = os.path.basename(f_api[i]).split('.')[0]
-        print(f"basename {basename} {flag.get(basename)}")
-        if flag.get(basename) is not None: # file found 
-            json_data = read_from_json(f_api[i])
-            # get sentence 
-            api_sen = make_sentence(json_data)
-            # actual sentence 
-            base_sen = read_from_text(flag.get(basename))
-            print(f"base sentence {base_sen} api reported sentence {api_sen}")
-            cer, track = error_calculation(X=base_sen, Y=api_sen)
-            w_base_sen = base_sen.split(' ')
-            w_api_sen = api_sen.split(' ')
-            wer,_ = error_calculation(X=w_base_sen, Y=w_api_sen)
-
-            f = open(os.path.join(statistics_file_name), 'a+', newline="", encoding='utf-8') # newly creation 
-            csv_writer = csv.writer(f)
-            csv_writer.writerow([basename, base_sen, api_sen, len(base_sen), len(w_base_sen), cer, wer, str(track)])
-            if counter != -1 and tot == counter:
-                break
-            f.close()
-        else:
-            print(f"Missed file {f_api[i]}")
-        
-        
-if __name__ == '__main__':
-    process(base=os.path.join('..', 'Final_data_MRK', 'text', ), 
-            api_output=os.path.join('..', 'Final_data_MRK', 'api_response'), statistics_file_name='error_statistics.csv', counter = -1)
+import argparse
+import os 
+import json
+import csv
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from text_normalization import normalize_text
+
+# Pairs per process pool task: large enough to amortize pickling, small enough to keep workers busy
+SCORE_CHUNK_SIZE = 200
+
+# One buffered handle for the whole statistics CSV
+WRITE_BUFFER_BYTES = 1 << 20
+
+def lcs_length(X, Y):
+    """
+    Length of the longest common subsequence of two sequences (strings or word lists).
+
+    Bit-parallel: bit j of v tracks row differences of the DP table against Y[j],
+    so each element of X costs a few big-int operations instead of len(Y) cell updates.
+    Memory is one integer of len(Y) bits.
+    """
+    if not X or not Y:
+        return 0
+    positions = {}
+    for j, y in enumerate(Y):
+        positions[y] = positions.get(y, 0) | (1 << j)
+    mask = (1 << len(Y)) - 1
+    v = mask
+    for x in X:
+        u = v & positions.get(x, 0)
+        v = ((v + u) | (v - u)) & mask
+    return len(Y) - bin(v).count('1')
+
+
+def lcs_matches(X, Y):
+    """
+    LCS length and the indices of X that the alignment matches.
+
+    Iterative DP over suffixes (L[i][j] = LCS of X[i:] and Y[j:]) keeping two rows.
+    For the backtrace only one bit per cell is kept: whether a mismatch at (i, j)
+    steps along Y (L[i][j+1] >= L[i+1][j]), packed into one integer per row.
+    The walk from (0, 0) takes a match whenever X[i] == Y[j] and otherwise follows
+    that bit, the same path the old recursive dp_lcs/matches pair took.
+
+    Returns:
+        (lcs length, list of matched indices of X in increasing order)
+    """
+    n, m = len(X), len(Y)
+    below = [0] * (m + 1)  # row i + 1
+    go_right = [0] * n
+    for i in range(n - 1, -1, -1):
+        x = X[i]
+        row = [0] * (m + 1)
+        bits = bytearray(b'0' * m)
+        for j in range(m - 1, -1, -1):
+            if x == Y[j]:
+                row[j] = below[j + 1] + 1
+            elif row[j + 1] >= below[j]:
+                row[j] = row[j + 1]
+                bits[j] = 49  # '1'
+            else:
+                row[j] = below[j]
+        # Reversed so that bit j of the integer is column j
+        go_right[i] = int(bytes(bits[::-1]), 2) if m else 0
+        below = row
+
+    match_indices = []
+    i = j = 0
+    while i < n and j < m:
+        if X[i] == Y[j]:
+            match_indices.append(i)
+            i += 1
+            j += 1
+        elif go_right[i] >> j & 1:
+            j += 1
+        else:
+            i += 1
+    return below[0], match_indices
+
+
+def error_calculation(X, Y, with_track=True):
+    """
+    Errors of Y against reference X as len(X) - LCS length, plus the unmatched elements of X.
+    With with_track=False only the length is computed (bit-parallel) and track is None.
+    """
+    if not with_track:
+        lcs = lcs_length(X, Y)
+        print(f"LCS length: {lcs}")
+        return len(X) - lcs, None
+    lcs, match_indices = lcs_matches(X, Y)
+    print(f"LCS length: {lcs}")
+    errors = len(X) - lcs
+    matched = set(match_indices)
+    track = []
+    for i in range(len(X)):
+        if i not in matched:
+            track.append(X[i])
+    return errors, track
+
+
+# Alignment moves found by edit_operations()
+MATCH, SUBSTITUTION, DELETION, INSERTION = 0, 1, 2, 3
+
+LEGACY_HEADER = ['file_name', 'annotated', 'generated', 'total_characters', 'total_words', 'cer', 'wer',
+                 'missed_characters']
+HEADER = ['file_name', 'annotated', 'generated', 'total_characters', 'total_words', 'cer', 'wer',
+          'char_errors', 'char_substitutions', 'char_deletions', 'char_insertions',
+          'word_errors', 'word_substitutions', 'word_deletions', 'word_insertions', 'missed_characters']
+
+
+def levenshtein_distance(X, Y, columns=None):
+    """
+    Levenshtein distance between two sequences, bit-parallel (Myers 1999, Hyyro's formulation).
+
+    Each column of the DP table against X is kept as two bit vectors of vertical +1/-1 deltas,
+    so every element of Y costs a handful of big-int operations whatever len(X) is.
+    If columns is a list, the (plus, minus) vectors of columns 0..len(Y) are appended to it;
+    edit_operations() reads the alignment back from them.
+    """
+    if not X or not Y:
+        return len(X) + len(Y)
+    peq = {}
+    for i, x in enumerate(X):
+        peq[x] = peq.get(x, 0) | (1 << i)
+    mask = (1 << len(X)) - 1
+    high = 1 << (len(X) - 1)
+    pv = mask
+    mv = 0
+    score = len(X)
+    if columns is not None:
+        columns.append((pv, mv))
+    for y in Y:
+        eq = peq.get(y, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        # Shifting in a 1 makes the top row 0, 1, 2, ... (global distance, not substring search)
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+        if columns is not None:
+            columns.append((pv, mv))
+    return score
+
+
+def _popcount(value):
+    return bin(value).count('1')
+
+
+def token_ids(*sequences):
+    """The sequences with every distinct token replaced by a small integer (shared vocabulary)"""
+    vocabulary = {}
+    return [[vocabulary.setdefault(token, len(vocabulary)) for token in sequence] for sequence in sequences]
+
+
+def edit_operations(X, Y):
+    """
+    Substitutions, deletions and insertions of a minimal alignment of hypothesis Y against reference X.
+
+    The distance comes from levenshtein_distance(), which also hands back its column bit vectors:
+    two bits per DP cell, packed in Python ints (len(X) / 4 bytes per column) instead of a table
+    of costs or moves. The backtrace rebuilds the few costs it needs from them: D[i][j] is j plus
+    the vertical deltas of column j above row i. On equal cost a diagonal move (match or
+    substitution) is preferred, then deletion, then insertion.
+
+    Returns:
+        (substitutions, deletions, insertions, indices of X deleted or substituted, in increasing order)
+    """
+    n, m = len(X), len(Y)
+    if not n or not m:
+        return 0, n, m, list(range(n))
+    columns = []
+    here = levenshtein_distance(X, Y, columns)  # D[i][j] at the current cell
+
+    counts = {SUBSTITUTION: 0, DELETION: 0, INSERTION: 0, MATCH: 0}
+    missed = []
+    i, j = n, m
+    while i > 0 or j > 0:
+        if i == 0:
+            move = INSERTION
+        elif j == 0:
+            move = DELETION
+        else:
+            bit = 1 << (i - 1)
+            pv, mv = columns[j]
+            up_cost = here - bool(pv & bit) + bool(mv & bit)
+            pv, mv = columns[j - 1]
+            left_cost = j - 1 + _popcount(pv & (2 * bit - 1)) - _popcount(mv & (2 * bit - 1))
+            diagonal_cost = left_cost - bool(pv & bit) + bool(mv & bit)
+            same = X[i - 1] == Y[j - 1]
+            if diagonal_cost + (not same) <= min(up_cost, left_cost) + 1:
+                move = MATCH if same else SUBSTITUTION
+                here = diagonal_cost
+            elif up_cost <= left_cost:
+                move = DELETION
+                here = up_cost
+            else:
+                move = INSERTION
+                here = left_cost
+        counts[move] += 1
+        if move == INSERTION:
+            j -= 1
+            continue
+        if move != MATCH:
+            missed.append(i - 1)
+        i -= 1
+        if move != DELETION:
+            j -= 1
+    missed.reverse()
+    return counts[SUBSTITUTION], counts[DELETION], counts[INSERTION], missed
+
+
+def score_pair(reference, hypothesis, legacy=False, normalize=True):
+    """
+    Character and word error statistics of a hypothesis against its reference.
+
+    Default: Levenshtein alignment. cer/wer are (S + D + I) / reference length, with the S/D/I
+    counts and the reference characters deleted or substituted; both texts go through
+    normalize_text() (unless normalize=False), are stripped and words split on any whitespace.
+    Insertions count, so a hypothesis with extra sentences scores badly.
+    legacy=True gives the old numbers: cer/wer are the counts len(reference) - LCS (insertions
+    ignored), on the raw text split on single spaces.
+
+    Returns:
+        dict keyed by the HEADER (or LEGACY_HEADER) column names, without the first three
+    """
+    if legacy:
+        char_errors, track = error_calculation(X=reference, Y=hypothesis)
+        ref_words = reference.split(' ')
+        word_errors, _ = error_calculation(X=ref_words, Y=hypothesis.split(' '), with_track=False)
+        return {'total_characters': len(reference), 'total_words': len(ref_words),
+                'cer': char_errors, 'wer': word_errors, 'missed_characters': str(track)}
+
+    if normalize:
+        reference = normalize_text(reference)
+        hypothesis = normalize_text(hypothesis)
+    reference = reference.strip()
+    hypothesis = hypothesis.strip()
+    char_s, char_d, char_i, missed = edit_operations(reference, hypothesis)
+    ref_words, hyp_words = token_ids(reference.split(), hypothesis.split())
+    word_s, word_d, word_i, _ = edit_operations(ref_words, hyp_words)
+    char_errors = char_s + char_d + char_i
+    word_errors = word_s + word_d + word_i
+    return {
+        'total_characters': len(reference), 'total_words': len(ref_words),
+        'cer': round(char_errors / len(reference), 4) if reference else float(char_errors > 0),
+        'wer': round(word_errors / len(ref_words), 4) if ref_words else float(word_errors > 0),
+        'char_errors': char_errors, 'char_substitutions': char_s, 'char_deletions': char_d,
+        'char_insertions': char_i,
+        'word_errors': word_errors, 'word_substitutions': word_s, 'word_deletions': word_d,
+        'word_insertions': word_i,
+        'missed_characters': str([reference[i] for i in missed]),
+    }
+
+
+def collect_files(folder):
+    save_path = []
+    files = os.listdir(folder)
+    for i in range(0, len(files)):
+        files[i] = os.path.join(folder, files[i])
+        if os.path.isfile(files[i]):
+            save_path.append(files[i])
+    return save_path 
+
+def read_from_json(file_name, verbose=True):
+    # Replace 'your_file_name.json' with the actual path to your file
+    try:
+        with open(file_name, 'r', encoding='utf-8') as file:
+            # json.load() reads the file object and parses the JSON content
+            data = json.load(file)
+        
+        # 'data' is now a Python object (usually a dictionary or list)
+        if verbose:
+            print(type(data))
+            print(data)
+        return data 
+
+    except FileNotFoundError:
+        print(f"Error: The file 'your_file_name.json' was not found.")
+    except json.JSONDecodeError:
+        print(f"Error: The content of 'your_file_name.json' is not valid JSON.")
+        pass 
+    
+def make_sentence(json_data, verbose=True):
+    if verbose:
+        print("came ", json_data)
+    predicted_words = json_data['output']['predicted_words']
+    sentence = ""
+    for i in range(0, len(predicted_words)):
+        if predicted_words[i].get('word') != " ":
+            sentence = sentence + " " + predicted_words[i].get('word')
+    sentence = sentence.strip()
+    return sentence 
+        
+
+def read_from_text(file_path, verbose=True):
+    """
+    Reads a text file by trying common encodings (UTF-8, Latin-1, CP1252)
+    until one succeeds.
+
+    Args:
+        file_path (str): The path to the text file.
+        verbose (bool): Print which encoding worked.
+
+    Returns:
+        str: The contents of the file as a single string, or None if reading fails.
+    """
+    if not os.path.exists(file_path):
+        print(f"Error: File not found at {file_path}")
+        return ""
+        
+    # The order matters: start with the preferred/modern encoding (UTF-8)
+    encodings_to_try = ['utf-8', 'latin-1', 'cp1252']
+    
+    for encoding in encodings_to_try:
+        try:
+            with open(file_path, 'r', encoding=encoding) as f:
+                # Read the entire file content
+                content = f.read()
+                if verbose:
+                    print(f"Successfully read file with encoding: {encoding}")
+                return content
+        except UnicodeDecodeError:
+            # If the current encoding fails, the loop continues to the next one
+            continue
+        except Exception as e:
+            # Catch other potential I/O errors (e.g., permission denied)
+            print(f"An unexpected error occurred while reading with {encoding}: {e}")
+            return ""
+            
+    # If the loop completes without returning, none of the encodings worked
+    print(f"Failed to decode file {file_path} with all tested encodings.")
+    return ""
+
+def pair_files(base, api_output):
+    """
+    (basename, response path, reference path) for every API response with a reference text,
+    sorted by basename so the output order does not depend on the directory listing.
+    """
+    f_base = collect_files(base)
+    flag = {}
+    for i in range(0, len(f_base)):
+        basename = os.path.basename(f_base[i])
+        flag[basename.split('.')[0]] = f_base[i]
+    f_api = collect_files(api_output)
+    print(len(f_api), len(f_base))
+    pairs = []
+    for i in range(0, len(f_api)):
+        basename = os.path.basename(f_api[i]).split('.')[0]
+        if flag.get(basename) is not None: # file found 
+            pairs.append((basename, f_api[i], flag.get(basename)))
+        else:
+            print(f"Missed file {f_api[i]}")
+    pairs.sort()
+    return pairs
+
+
+def score_chunk(pairs, header, legacy=False, verbose=False, normalize=True):
+    """
+    Statistics rows for a list of (basename, response path, reference path); runs in the worker processes.
+    """
+    rows = []
+    for basename, api_path, base_path in pairs:
+        json_data = read_from_json(api_path, verbose=verbose)
+        # get sentence 
+        api_sen = make_sentence(json_data, verbose=verbose)
+        # actual sentence 
+        base_sen = read_from_text(base_path, verbose=verbose)
+        if verbose:
+            print(f"base sentence {base_sen} api reported sentence {api_sen}")
+        scores = score_pair(base_sen, api_sen, legacy=legacy, normalize=normalize)
+        rows.append([basename, base_sen, api_sen] + [scores[column] for column in header[3:]])
+    return rows
+
+
+def process(base, api_output, statistics_file_name='error_statistics.csv', counter = -1, legacy=False, jobs=1,
+            chunk_size=SCORE_CHUNK_SIZE, normalize=True):
+    """
+    Score every response against its reference and write the statistics CSV.
+
+    With jobs > 1 the pairs are split into chunks of chunk_size and scored in a process pool;
+    chunks are written in order as they come back, so the rows are the same as with jobs=1.
+    """
+    header = LEGACY_HEADER if legacy else HEADER
+    pairs = pair_files(base, api_output)
+    if counter != -1:
+        pairs = pairs[:counter]
+    chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+
+    start = time.time()
+    with open(statistics_file_name, 'w', newline="", encoding='utf-8', buffering=WRITE_BUFFER_BYTES) as f:
+        csv_writer = csv.writer(f)
+        csv_writer.writerow(header)
+        if jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                for rows in executor.map(score_chunk, chunks, repeat(header), repeat(legacy), repeat(False),
+                                         repeat(normalize)):
+                    csv_writer.writerows(rows)
+        else:
+            for chunk in chunks:
+                csv_writer.writerows(score_chunk(chunk, header, legacy=legacy, verbose=True, normalize=normalize))
+    elapsed = time.time() - start
+    print(f"Scored {len(pairs)} pairs in {elapsed:.2f}s ({len(pairs) / max(elapsed, 1e-9):.0f} pairs/s, "
+          f"{jobs} jobs) -> {statistics_file_name}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="CER/WER of API transcripts against reference texts")
+    parser.add_argument('--base', default=os.path.join('..', 'Final_data_MRK', 'text'),
+                        help="Folder of reference .txt files")
+    parser.add_argument('--api-output', default=os.path.join('..', 'Final_data_MRK', 'api_response'),
+                        help="Folder of API response .json files")
+    parser.add_argument('--output', default='error_statistics.csv', help="Statistics CSV to write")
+    parser.add_argument('--counter', type=int, default=-1, help="Stop after this many files (-1 = all)")
+    parser.add_argument('--legacy', action='store_true',
+                        help="Old LCS-based counts (len(reference) - LCS, insertions ignored) and columns")
+    parser.add_argument('--no-normalize', action='store_true',
+                        help="Score the texts as written (see text_normalization.py; --legacy never normalizes)")
+    parser.add_argument('--jobs', type=int, default=1, help="Worker processes (default 1: score in this process)")
+    parser.add_argument('--chunk-size', type=int, default=SCORE_CHUNK_SIZE, help="Pairs per worker task")
+    args = parser.parse_args()
+    process(base=args.base, api_output=args.api_output, statistics_file_name=args.output, counter=args.counter,
+            legacy=args.legacy, jobs=args.jobs, chunk_size=args.chunk_size,
+            normalize=not args.no_normalize)
     
\ No newline at end of file
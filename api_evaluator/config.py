@@ -19,5 +19,76 @@ AUDIO_EXTENSIONS = ['.wav', '.flac']
 # Timeout for API requests (seconds)
 API_TIMEOUT = 60
 
-# Delay between requests (seconds)
+# Delay between requests (seconds), only used with --fixed-delay
 REQUEST_DELAY = 1
+
+# Adaptive rate control: raise the in-flight limit while the server is healthy,
+# halve it on timeouts, connection errors or a rising p95 latency
+ADAPTIVE_RATE = True
+MAX_CONCURRENCY = 32
+P95_GROWTH_LIMIT = 1.5  # cut when window p95 exceeds the best p95 by this factor
+MAX_ERROR_RATE = 0.05
+
+# Number of persistent connections kept open to the STT server
+POOL_SIZE = 1
+
+# Pooled connections idle longer than this (seconds) are re-established before reuse
+HEALTH_CHECK_INTERVAL = 30
+
+# Streaming mode (--mode stream): bytes per audio_transmit chunk, and seconds
+# without a new result event after which a stream with no end marker is done
+STREAM_CHUNK_SIZE = 32000
+STREAM_IDLE_TIMEOUT = 3
+
+# Append one JSON line per request with per-phase durations and bytes sent/received
+# to <csv name>_trace.jsonl next to the CSV
+TRACE_REQUESTS = True
+
+# Clip packing (--pack): clips up to PACK_MAX_CLIP_SECONDS are joined into uploads of
+# at most PACK_MAX_SECONDS, separated by PACK_GAP_SECONDS of silence
+PACK_MAX_CLIP_SECONDS = 10
+PACK_MAX_SECONDS = 60
+PACK_GAP_SECONDS = 1.0
+
+# Word timestamps in API responses are sample offsets at this rate
+TIMESTAMP_RATE = 16000
+
+# Segmentation (--segment): WAV files longer than SEGMENT_LONG_FILE_SECONDS are cut at
+# pauses (frames below SEGMENT_SILENCE_DB dBFS for at least SEGMENT_MIN_SILENCE_MS) into
+# segments of at most SEGMENT_MAX_SECONDS, transcribed SEGMENT_PARALLEL at a time
+SEGMENT_LONG_FILE_SECONDS = 30
+SEGMENT_MAX_SECONDS = 20
+SEGMENT_SILENCE_DB = -35
+SEGMENT_MIN_SILENCE_MS = 200
+SEGMENT_PARALLEL = 4
+
+# Keep per-file status, attempts, last error, latency and duration in
+# <csv name>_state.db (SQLite) next to the CSV; files that failed MAX_ATTEMPTS
+# times are skipped until requeued with check_progress.py --requeue
+RUN_STATE = True
+MAX_ATTEMPTS = 3
+
+# Remember each folder's listing in <csv name>_scan_cache.json and only list
+# folders whose mtime changed since the last run (--full-rescan lists all)
+SCAN_CACHE = True
+
+# Result writer thread: up to WRITER_QUEUE_SIZE results wait for the disk;
+# CSV rows are written every WRITER_FLUSH_ROWS rows or WRITER_FLUSH_SECONDS,
+# and files are fsynced every WRITER_FSYNC_SECONDS (0 = every write, None = never)
+WRITER_QUEUE_SIZE = 256
+WRITER_FLUSH_ROWS = 50
+WRITER_FLUSH_SECONDS = 1.0
+WRITER_FSYNC_SECONDS = 5.0
+
+# Where responses go: 'sidecar' (indented <audio>.json next to each file) or
+# 'jsonl' (compact records in shard files under <csv name>_responses/, see
+# response_store.py). STORE_COMPRESSION: None, 'gzip' or 'zstd' (pip install zstandard)
+RESPONSE_STORE = 'sidecar'
+STORE_COMPRESSION = 'gzip'
+STORE_SHARD_MB = 256
+
+# Text normalization before CER/WER (compare_output.py, batch_scoring.py,
+# clip_packer.py): any of 'unicode' (NFC), 'zero_width', 'digits' (০-৯ -> 0-9),
+# 'punctuation', 'case', 'whitespace'; see batch_scoring.py --rule-report
+NORMALIZATION_RULES = ['unicode', 'zero_width', 'digits', 'punctuation', 'case', 'whitespace']
+NORMALIZATION_CACHE_SIZE = 100000
@@ -0,0 +1,199 @@
+"""
+Single-pass corpus discovery
+
+Finding the files to transcribe used to take one rglob per extension per
+subfolder, a second walk for the JSON sidecars and an exists() check per
+extension per sidecar; on a large tree on network storage that took minutes
+before the first request went out. scan_corpus() walks the tree once with
+os.scandir, sorts every entry into audio or sidecar from the directory
+listing alone (no stat calls on regular files) and returns the pending files
+directly.
+
+An audio file counts as transcribed when a JSON file with the same name
+next to it exists. If several audio files share a name (clip.wav and
+clip.flac), only the first in AUDIO_EXTENSIONS order is matched to the
+sidecar, as before.
+
+With a cache file, the relevant part of each directory listing (audio files,
+sidecars, subfolders) is saved with the directory's mtime. On the next scan
+a directory whose mtime is unchanged is taken from the cache after a single
+stat; only changed directories are listed again. Adding, removing or
+renaming an entry (including a new JSON sidecar) changes the mtime of its
+directory. Filesystems with coarse timestamps (FAT: 2 s, older ext/NFS: 1 s)
+can change a directory twice within one mtime tick, so a listing taken less
+than SCAN_CACHE_MTIME_SLACK seconds after the directory's mtime is never
+trusted and that directory is listed again next time.
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+
+try:
+    from config import AUDIO_EXTENSIONS
+except ImportError:
+    AUDIO_EXTENSIONS = ['.wav', '.flac']
+
+try:
+    from config import SCAN_CACHE
+except ImportError:
+    SCAN_CACHE = True
+
+REMAINING_FOLDER = 'remaining'
+
+# Listings this close to their directory's mtime may miss a later change in the same tick
+SCAN_CACHE_MTIME_SLACK = 2.0
+
+SCAN_CACHE_VERSION = 1
+
+
+def scan_cache_path_for(csv_output):
+    """Directory listing cache kept next to a CSV"""
+    csv_path = Path(csv_output)
+    return csv_path.parent / f"{csv_path.stem}_scan_cache.json"
+
+
+def scan_corpus(base_dir, process_remaining=False, extensions=None, collect_transcribed=False,
+                cache_path=None, full_rescan=False):
+    """Walk the corpus once and return the audio files still to transcribe
+
+    Args:
+        base_dir: Base directory to search
+        process_remaining: If True, only the 'remaining' folder. If False, every
+            top-level folder except 'remaining' (files directly in base_dir are skipped).
+        extensions: Audio extensions to collect (default AUDIO_EXTENSIONS)
+        collect_transcribed: Also return the transcribed files as 'transcribed_files'
+        cache_path: Directory listing cache to read and update (None = no cache)
+        full_rescan: List every directory again; the cache is rewritten from scratch
+
+    Returns:
+        dict with 'pending' (sorted list of Path), 'audio_files', 'transcribed',
+        'directories', 'relisted' (counts) and 'seconds' (scan time)
+    """
+    start = time.time()
+    extensions = extensions or AUDIO_EXTENSIONS
+    ranks = {ext.lower(): rank for rank, ext in reversed(list(enumerate(extensions)))}
+    scan = {'pending': [], 'audio_files': 0, 'transcribed': 0, 'directories': 0, 'relisted': 0}
+    if collect_transcribed:
+        scan['transcribed_files'] = []
+
+    cached = {}
+    if cache_path and not full_rescan:
+        cached = load_scan_cache(cache_path, extensions)
+    listings = {}
+
+    stack = []
+    if os.path.isdir(base_dir):
+        with os.scandir(base_dir) as entries:
+            for entry in entries:
+                if entry.is_dir() and (entry.name.lower() == REMAINING_FOLDER) == process_remaining:
+                    stack.append(entry.path)
+
+    while stack:
+        directory = stack.pop()
+        scan['directories'] += 1
+        try:
+            listing = cached.get(directory)
+            if not is_fresh(directory, listing):
+                listing = list_directory(directory, ranks)
+                scan['relisted'] += 1
+        except OSError as e:
+            print(f"  Warning: Could not scan {directory}: {e}")
+            continue
+        listings[directory] = listing
+        stack.extend(listing['subdirs'])
+        classify_listing(directory, listing, ranks, scan)
+
+    if cache_path:
+        save_scan_cache(cache_path, extensions, listings)
+
+    scan['pending'].sort()
+    scan['seconds'] = time.time() - start
+    return scan
+
+
+def is_fresh(directory, listing):
+    """True if a cached listing can be used: same mtime and not taken within the slack window"""
+    if listing is None or listing['racy']:
+        return False
+    return os.stat(directory).st_mtime_ns == listing['mtime_ns']
+
+
+def list_directory(directory, ranks):
+    """Audio files, sidecars and subfolders of one directory, with its mtime"""
+    mtime_ns = os.stat(directory).st_mtime_ns
+    listing = {'mtime_ns': mtime_ns, 'subdirs': [], 'files': []}
+
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                listing['subdirs'].append(entry.path)
+                continue
+            ext = os.path.splitext(entry.name)[1].lower()
+            if ext == '.json' or ext in ranks:
+                listing['files'].append(entry.name)
+
+    # mtime read before listing: a change during the listing moves it on and is caught next time
+    listing['racy'] = time.time_ns() - mtime_ns < SCAN_CACHE_MTIME_SLACK * 1e9
+    return listing
+
+
+def classify_listing(directory, listing, ranks, scan):
+    """Sort one directory's files into pending and transcribed"""
+    audio = {}  # name without extension -> [(extension rank, file name)]
+    sidecars = set()
+
+    for name in listing['files']:
+        stem, ext = os.path.splitext(name)
+        ext = ext.lower()
+        if ext == '.json':
+            sidecars.add(stem)
+        elif ext in ranks:
+            audio.setdefault(stem, []).append((ranks[ext], name))
+
+    for stem, names in audio.items():
+        scan['audio_files'] += len(names)
+        names.sort()
+        for index, (_, name) in enumerate(names):
+            if index == 0 and stem in sidecars:
+                scan['transcribed'] += 1
+                if 'transcribed_files' in scan:
+                    scan['transcribed_files'].append(Path(directory, name))
+            else:
+                scan['pending'].append(Path(directory, name))
+
+
+def load_scan_cache(cache_path, extensions):
+    """Cached listings by directory, or {} if the cache is missing, unreadable or for other extensions"""
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get('version') != SCAN_CACHE_VERSION or cache.get('extensions') != [e.lower() for e in extensions]:
+        return {}
+    return cache['directories']
+
+
+def save_scan_cache(cache_path, extensions, listings):
+    """Write the cache to a temporary file and move it into place, so a crash never leaves half a cache"""
+    temp_path = f"{cache_path}.tmp"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': SCAN_CACHE_VERSION,
+                'extensions': [e.lower() for e in extensions],
+                'directories': listings
+            }, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        print(f"  Warning: Could not save scan cache {cache_path}: {e}")
+
+
+def print_scan_summary(scan):
+    cached = scan['directories'] - scan['relisted']
+    detail = f" ({scan['relisted']} listed, {cached} unchanged from cache)" if cached else ""
+    print(f"Scanned {scan['directories']} folders in {scan['seconds']:.2f}s{detail}")
+    print(f"Found {scan['audio_files']} audio files")
+    print(f"Found {scan['transcribed']} existing transcripts")
@@ -0,0 +1,310 @@
+"""
+Mock STT Socket.IO server for offline benchmarking
+
+Implements the two request flows of the real STT API with the same
+`output.predicted_words` schema, so every client in this folder can run
+against localhost instead of https://voice.bangla.gov.bd:9394:
+
+- audio_transmit_upload -> one result_upload for the whole file
+- audio_transmit        -> one result per chunk, echoing index and endOfStream
+
+Response time follows a configurable latency model:
+
+- fixed:        base latency for every request
+- proportional: base + rtf * audio duration
+- heavy-tailed: proportional latency times a Pareto factor (occasional very slow requests)
+
+Errors can be injected (error event, silent drop, disconnect), and a
+concurrency cap queues requests beyond N in flight like a real inference server.
+
+Usage:
+    python mock_stt_server.py
+    python mock_stt_server.py --port 9394 --latency-model proportional --rtf 0.15
+    python mock_stt_server.py --latency-model heavy-tailed --error-rate 0.02 --max-concurrency 4
+
+Then point the clients at it, e.g. SOCKET_URL = "http://localhost:9394" in config.py.
+"""
+
+import argparse
+import asyncio
+import base64
+import random
+import time
+
+import socketio
+from aiohttp import web
+
+# Word timestamps in the real API are sample offsets at 16 kHz
+TIMESTAMP_RATE = 16000
+
+# Assumed byte rate when the audio has no WAV header (MP3 at 128 kbps)
+FALLBACK_BYTES_PER_SECOND = 16000
+
+# Roughly how many words per second of speech the mock emits
+WORDS_PER_SECOND = 2.0
+
+VOCABULARY = ["আমি", "তুমি", "সে", "বাংলা", "ভাষা", "কথা", "বলি", "এখন", "সময়ে", "আজ",
+              "দেশ", "মানুষ", "ভালো", "নতুন", "কাজ", "করে", "এবং", "একটি", "হয়", "না"]
+
+
+def audio_format(audio_bytes):
+    """Return (bytes_per_second, header_size) from a WAV header, or the fallback
+
+    Walks the RIFF chunks by hand so it also works on the first chunk of a
+    stream, which holds the header but not the whole file.
+    """
+    if audio_bytes[:4] != b'RIFF' or audio_bytes[8:12] != b'WAVE':
+        return FALLBACK_BYTES_PER_SECOND, 0
+
+    bytes_per_second = FALLBACK_BYTES_PER_SECOND
+    offset = 12
+    while offset + 8 <= len(audio_bytes):
+        chunk_id = audio_bytes[offset:offset + 4]
+        chunk_size = int.from_bytes(audio_bytes[offset + 4:offset + 8], 'little')
+        if chunk_id == b'fmt ':
+            bytes_per_second = int.from_bytes(audio_bytes[offset + 16:offset + 20], 'little') or bytes_per_second
+        elif chunk_id == b'data':
+            return bytes_per_second, offset + 8
+        offset += 8 + chunk_size + (chunk_size & 1)
+    return bytes_per_second, 0
+
+
+def make_words(start_seconds, end_seconds, rng):
+    """Build predicted_words covering [start, end) in the real API's layout"""
+    words = []
+    count = int((end_seconds - start_seconds) * WORDS_PER_SECOND)
+    if count <= 0:
+        return words
+
+    span = (end_seconds - start_seconds) / count
+    for i in range(count):
+        word_start = start_seconds + i * span
+        word_end = word_start + span * 0.85
+        text = rng.choice(VOCABULARY)
+        words.append({
+            "word": text,
+            "char_scores": [[ch, round(rng.uniform(80, 100), 3)] for ch in text],
+            "is_confident": True,
+            "timestamp": [int(word_start * TIMESTAMP_RATE), int(word_end * TIMESTAMP_RATE)]
+        })
+        if i < count - 1:
+            words.append({
+                "word": " ",
+                "char_scores": [[" ", round(rng.uniform(60, 90), 3)]],
+                "is_confident": False,
+                "timestamp": [int(word_end * TIMESTAMP_RATE), int((word_start + span) * TIMESTAMP_RATE)]
+            })
+    return words
+
+
+class MockSTTServer:
+    """Socket.IO handlers plus the latency, error and concurrency models"""
+
+    def __init__(self, latency_model='fixed', base_latency=0.2, rtf=0.1, tail_alpha=2.0,
+                 error_rate=0.0, drop_rate=0.0, disconnect_rate=0.0, max_concurrency=0,
+                 seed=None, verbose=False):
+        self.latency_model = latency_model
+        self.base_latency = base_latency
+        self.rtf = rtf
+        self.tail_alpha = tail_alpha
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.disconnect_rate = disconnect_rate
+        self.verbose = verbose
+        self.rng = random.Random(seed)
+        self.slots = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+
+        self.streams = {}
+        self.stats = {'connections': 0, 'uploads': 0, 'chunks': 0, 'errors': 0,
+                      'dropped': 0, 'disconnects': 0, 'in_flight': 0, 'peak_in_flight': 0}
+
+        # Large uploads arrive as one message
+        self.sio = socketio.AsyncServer(async_mode='aiohttp', cors_allowed_origins='*',
+                                        max_http_buffer_size=200 * 1024 * 1024)
+        self.sio.on('connect', self.on_connect)
+        self.sio.on('disconnect', self.on_disconnect)
+        self.sio.on('audio_transmit_upload', self.on_upload)
+        self.sio.on('audio_transmit', self.on_chunk)
+
+    def _log(self, message):
+        if self.verbose:
+            print(f"  {message}")
+
+    def latency_for(self, duration):
+        """Seconds to 'process' audio of the given duration"""
+        if self.latency_model == 'fixed':
+            return self.base_latency
+        latency = self.base_latency + self.rtf * duration
+        if self.latency_model == 'heavy-tailed':
+            latency *= self.rng.paretovariate(self.tail_alpha)
+        return latency
+
+    def pick_failure(self):
+        """Decide whether this request fails and how: 'error', 'drop', 'disconnect' or None"""
+        roll = self.rng.random()
+        if roll < self.error_rate:
+            return 'error'
+        roll -= self.error_rate
+        if roll < self.drop_rate:
+            return 'drop'
+        roll -= self.drop_rate
+        if roll < self.disconnect_rate:
+            return 'disconnect'
+        return None
+
+    async def process(self, sid, duration):
+        """Hold a concurrency slot for the modelled latency; return False if the request failed"""
+        failure = self.pick_failure()
+        if self.slots:
+            await self.slots.acquire()
+        self.stats['in_flight'] += 1
+        self.stats['peak_in_flight'] = max(self.stats['peak_in_flight'], self.stats['in_flight'])
+        try:
+            await asyncio.sleep(self.latency_for(duration))
+        finally:
+            self.stats['in_flight'] -= 1
+            if self.slots:
+                self.slots.release()
+
+        if failure == 'error':
+            self.stats['errors'] += 1
+            await self.sio.emit('error', "Injected server error", to=sid)
+        elif failure == 'drop':
+            self.stats['dropped'] += 1
+        elif failure == 'disconnect':
+            self.stats['disconnects'] += 1
+            await self.sio.disconnect(sid)
+        if failure:
+            self._log(f"[{sid[:8]}] injected failure: {failure}")
+        return failure is None
+
+    async def on_connect(self, sid, environ):
+        self.stats['connections'] += 1
+        self._log(f"[{sid[:8]}] connected")
+
+    async def on_disconnect(self, sid, *args):
+        self.streams.pop(sid, None)
+        self._log(f"[{sid[:8]}] disconnected")
+
+    async def on_upload(self, sid, data):
+        self.stats['uploads'] += 1
+        audio_bytes = base64.b64decode(data.get('audio', ''))
+        bytes_per_second, header_size = audio_format(audio_bytes)
+        duration = max(0, len(audio_bytes) - header_size) / bytes_per_second
+
+        if not await self.process(sid, duration):
+            return
+        await self.sio.emit('result_upload', {
+            "index": str(data.get('index', 0)),
+            "output": {"predicted_words": make_words(0, duration, self.rng)}
+        }, to=sid)
+        self._log(f"[{sid[:8]}] upload {duration:.1f}s of audio answered")
+
+    async def on_chunk(self, sid, data):
+        self.stats['chunks'] += 1
+        audio_bytes = base64.b64decode(data.get('audio', ''))
+        index = int(data.get('index', 0))
+        end_of_stream = bool(data.get('endOfStream'))
+
+        if index == 0 or sid not in self.streams:
+            bytes_per_second, header_size = audio_format(audio_bytes)
+            # Chunks of one stream are processed in order, like a real decoder
+            self.streams[sid] = {'bytes_per_second': bytes_per_second, 'position': 0.0,
+                                 'lock': asyncio.Lock()}
+            audio_size = len(audio_bytes) - header_size
+        else:
+            audio_size = len(audio_bytes)
+        stream = self.streams[sid]
+
+        async with stream['lock']:
+            start = stream['position']
+            duration = max(0, audio_size) / stream['bytes_per_second']
+            stream['position'] = start + duration
+
+            if not await self.process(sid, duration):
+                return
+            await self.sio.emit('result', {
+                "index": str(index),
+                "endOfStream": end_of_stream,
+                "output": {"predicted_words": make_words(start, start + duration, self.rng)}
+            }, to=sid)
+
+        if end_of_stream:
+            self.streams.pop(sid, None)
+            self._log(f"[{sid[:8]}] stream of {stream['position']:.1f}s finished")
+
+    async def report_stats(self, interval):
+        """Print a one-line summary every `interval` seconds while there is traffic"""
+        last = None
+        while True:
+            await asyncio.sleep(interval)
+            snapshot = (self.stats['uploads'], self.stats['chunks'])
+            if snapshot != last:
+                print(f"[{time.strftime('%H:%M:%S')}] uploads {self.stats['uploads']}, "
+                      f"chunks {self.stats['chunks']}, in flight {self.stats['in_flight']} "
+                      f"(peak {self.stats['peak_in_flight']}), errors {self.stats['errors']}, "
+                      f"dropped {self.stats['dropped']}, disconnects {self.stats['disconnects']}")
+                last = snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock STT Socket.IO server for offline benchmarking")
+    parser.add_argument('--host', default='127.0.0.1', help="Interface to listen on")
+    parser.add_argument('--port', type=int, default=9394, help="Port to listen on")
+    parser.add_argument('--latency-model', choices=['fixed', 'proportional', 'heavy-tailed'],
+                        default='proportional', help="How response time is modelled")
+    parser.add_argument('--base-latency', type=float, default=0.2, help="Fixed part of every response time (s)")
+    parser.add_argument('--rtf', type=float, default=0.1, help="Seconds of processing per second of audio")
+    parser.add_argument('--tail-alpha', type=float, default=2.0,
+                        help="Pareto shape for heavy-tailed latency (smaller = heavier tail)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with an error event")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="Fraction of requests never answered")
+    parser.add_argument('--disconnect-rate', type=float, default=0.0, help="Fraction of requests that drop the connection")
+    parser.add_argument('--max-concurrency', type=int, default=0,
+                        help="Requests processed at once; more are queued (0 = unlimited)")
+    parser.add_argument('--seed', type=int, default=None, help="Random seed for reproducible runs")
+    parser.add_argument('--stats-interval', type=float, default=10, help="Seconds between stats lines")
+    parser.add_argument('--verbose', action='store_true', help="Log every request")
+    args = parser.parse_args()
+
+    server = MockSTTServer(
+        latency_model=args.latency_model,
+        base_latency=args.base_latency,
+        rtf=args.rtf,
+        tail_alpha=args.tail_alpha,
+        error_rate=args.error_rate,
+        drop_rate=args.drop_rate,
+        disconnect_rate=args.disconnect_rate,
+        max_concurrency=args.max_concurrency,
+        seed=args.seed,
+        verbose=args.verbose
+    )
+
+    app = web.Application()
+    server.sio.attach(app)
+
+    async def start_stats(app):
+        app['stats_task'] = asyncio.create_task(server.report_stats(args.stats_interval))
+
+    async def stop_stats(app):
+        app['stats_task'].cancel()
+
+    app.on_startup.append(start_stats)
+    app.on_cleanup.append(stop_stats)
+
+    print("=" * 80)
+    print("MOCK STT SERVER")
+    print("=" * 80)
+    print(f"Listening on: http://{args.host}:{args.port}")
+    print(f"Latency model: {args.latency_model} (base {args.base_latency}s, rtf {args.rtf}"
+          + (f", pareto alpha {args.tail_alpha}" if args.latency_model == 'heavy-tailed' else "") + ")")
+    print(f"Failures: error {args.error_rate:.1%}, drop {args.drop_rate:.1%}, "
+          f"disconnect {args.disconnect_rate:.1%}")
+    print(f"Max concurrency: {args.max_concurrency or 'unlimited'}")
+    print("=" * 80)
+
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Adaptive rate control for batch transcription
+
+Replaces the fixed REQUEST_DELAY with an AIMD (additive-increase,
+multiplicative-decrease) controller. The controller owns a limit on
+requests in flight:
+
+- While latency and error rate stay healthy, the limit grows (doubling
+  during slow start, then +1 per window of completed requests).
+- On a timeout, connection error or a window p95 that has grown well past
+  the best p95 seen so far, the limit is halved.
+- Below 1 the limit means "fraction of the time a request is in flight":
+  callers sleep between requests so a struggling server gets room to recover.
+
+Every adjustment is printed and, if a log path is given, appended to a CSV
+so the server's real capacity can be read off after a run.
+"""
+
+import asyncio
+import csv
+import math
+import os
+from collections import deque
+from datetime import datetime
+
+try:
+    from config import MAX_CONCURRENCY, P95_GROWTH_LIMIT, MAX_ERROR_RATE
+except ImportError:
+    MAX_CONCURRENCY = 32
+    P95_GROWTH_LIMIT = 1.5
+    MAX_ERROR_RATE = 0.05
+
+# Smallest fractional limit: one request in flight 10% of the time
+MIN_LIMIT = 0.1
+
+# Fewest completed requests between two adjustments
+MIN_WINDOW = 10
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (pct in 0-100)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def classify_error(error):
+    """Map a result error string to 'timeout', 'connection' or 'other'"""
+    if not error:
+        return None
+    if error.startswith('Timeout'):
+        return 'timeout'
+    if error.startswith('Connection error') or error.startswith('Disconnected'):
+        return 'connection'
+    return 'other'
+
+
+class AIMDController:
+    """Additive-increase / multiplicative-decrease limit on requests in flight
+
+    Args:
+        initial_limit: Starting limit
+        max_limit: Upper bound, normally the connection pool size
+        decrease_factor: Multiplier applied to the limit on congestion
+        p95_growth_limit: Cut when a window's p95 exceeds the best p95 by this factor
+        max_error_rate: Cut when a window's error rate exceeds this
+        log_path: Optional CSV file receiving one row per adjustment
+        verbose: Print every adjustment
+    """
+
+    def __init__(self, initial_limit=1, max_limit=MAX_CONCURRENCY, decrease_factor=0.5,
+                 p95_growth_limit=P95_GROWTH_LIMIT, max_error_rate=MAX_ERROR_RATE,
+                 log_path=None, verbose=True):
+        self.max_limit = max(MIN_LIMIT, max_limit)
+        self.limit = min(max(MIN_LIMIT, initial_limit), self.max_limit)
+        self.decrease_factor = decrease_factor
+        self.p95_growth_limit = p95_growth_limit
+        self.max_error_rate = max_error_rate
+        self.log_path = log_path
+        self.verbose = verbose
+
+        self.slow_start = True
+        self.best_p95 = None
+        self.completed = 0
+        self.adjustments = []
+
+        self._window_latencies = []
+        self._window_errors = 0
+        self._since_cut = math.inf
+        self._recent_latencies = deque(maxlen=50)
+
+    @property
+    def max_in_flight(self):
+        """Whole number of requests that may be in flight right now"""
+        return max(1, int(self.limit))
+
+    def delay(self):
+        """Seconds to wait before the next request
+
+        Zero while the limit is at least 1. For a fractional limit, spaces
+        requests so that one is in flight only `limit` of the time.
+        """
+        if self.limit >= 1 or not self._recent_latencies:
+            return 0.0
+        avg_latency = sum(self._recent_latencies) / len(self._recent_latencies)
+        return avg_latency * (1 / self.limit - 1)
+
+    def record(self, latency, error=None):
+        """Feed one completed request into the controller
+
+        Args:
+            latency: API response time in seconds (None if unknown)
+            error: Error string from the result dict, None on success
+        """
+        self.completed += 1
+        self._since_cut += 1
+        kind = classify_error(error)
+
+        if latency is not None and kind is None:
+            self._window_latencies.append(latency)
+            self._recent_latencies.append(latency)
+        if kind is not None:
+            self._window_errors += 1
+
+        # Timeouts and dropped connections are congestion signals on their own.
+        # Requests already in flight when the limit was cut are allowed to
+        # drain first, so one overload does not halve the limit repeatedly.
+        if kind in ('timeout', 'connection'):
+            if self._since_cut >= self.max_in_flight:
+                self._decrease(f"{kind} error")
+            return
+
+        window_size = max(MIN_WINDOW, self.max_in_flight)
+        window_total = len(self._window_latencies) + self._window_errors
+        if window_total < window_size:
+            return
+
+        p95 = percentile(self._window_latencies, 95)
+        error_rate = self._window_errors / window_total
+
+        if error_rate > self.max_error_rate:
+            self._decrease(f"error rate {error_rate:.1%}", p95, error_rate)
+        elif p95 is not None and self.best_p95 is not None and p95 > self.best_p95 * self.p95_growth_limit:
+            self._decrease(f"p95 {p95:.2f}s > {self.p95_growth_limit}x best {self.best_p95:.2f}s", p95, error_rate)
+        else:
+            self._increase(p95, error_rate)
+
+        if p95 is not None and (self.best_p95 is None or p95 < self.best_p95):
+            self.best_p95 = p95
+        self._reset_window()
+
+    def _reset_window(self):
+        self._window_latencies = []
+        self._window_errors = 0
+
+    def _increase(self, p95, error_rate):
+        if self.limit >= self.max_limit:
+            return
+        if self.slow_start:
+            new_limit = self.limit * 2
+        else:
+            new_limit = self.limit + 1
+        self._adjust(min(new_limit, self.max_limit), "healthy window", p95, error_rate)
+
+    def _decrease(self, reason, p95=None, error_rate=None):
+        self.slow_start = False
+        self._since_cut = 0
+        new_limit = max(MIN_LIMIT, self.limit * self.decrease_factor)
+        self._adjust(new_limit, reason, p95, error_rate)
+        self._reset_window()
+
+    def _adjust(self, new_limit, reason, p95=None, error_rate=None):
+        old_limit = self.limit
+        self.limit = round(new_limit, 3)
+        if self.limit == old_limit:
+            return
+
+        entry = {
+            'timestamp': datetime.now().isoformat(),
+            'completed': self.completed,
+            'old_limit': old_limit,
+            'new_limit': self.limit,
+            'reason': reason,
+            'window_p95_seconds': f"{p95:.3f}" if p95 is not None else 'N/A',
+            'window_error_rate': f"{error_rate:.3f}" if error_rate is not None else 'N/A'
+        }
+        self.adjustments.append(entry)
+
+        if self.verbose:
+            direction = "↑" if self.limit > old_limit else "↓"
+            print(f"  [rate] {direction} limit {old_limit:g} -> {self.limit:g} ({reason})")
+
+        if self.log_path:
+            file_exists = os.path.exists(self.log_path)
+            with open(self.log_path, 'a', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=list(entry.keys()))
+                if not file_exists:
+                    writer.writeheader()
+                writer.writerow(entry)
+
+    def print_summary(self):
+        """Print how the limit evolved over the run"""
+        increases = sum(1 for a in self.adjustments if a['new_limit'] > a['old_limit'])
+        decreases = len(self.adjustments) - increases
+        peak = max([a['new_limit'] for a in self.adjustments] + [self.limit])
+        cut_points = [a['old_limit'] for a in self.adjustments if a['new_limit'] < a['old_limit']]
+
+        print(f"Rate control: {increases} increases, {decreases} decreases")
+        print(f"Final in-flight limit: {self.limit:g} (peak {peak:g})")
+        if cut_points:
+            print(f"Limit at congestion (median): {percentile(cut_points, 50):g}")
+        if self.best_p95 is not None:
+            print(f"Best window p95 latency: {self.best_p95:.2f}s")
+
+
+class AsyncAdaptiveLimiter:
+    """asyncio gate that admits at most controller.max_in_flight requests
+
+    Usage:
+        async with limiter:
+            result = await client.transcribe(path)
+    """
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.controller.max_in_flight)
+            self.in_flight += 1
+
+        delay = self.controller.delay()
+        if delay:
+            await asyncio.sleep(delay)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self.in_flight -= 1
+            # The limit may have grown: wake every waiter to re-check
+            self._condition.notify_all()
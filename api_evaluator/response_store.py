@@ -0,0 +1,360 @@
+"""
+Packed response store
+
+One indented JSON file per clip means tens of thousands of small files next
+to the audio: slow directory listings and slow copies to the annotation
+machine. With RESPONSE_STORE = 'jsonl' (or --store jsonl) the batch runner
+appends compact responses to a few large shard files instead, in
+<csv name>_responses/ next to the CSV:
+
+    responses_00000.jsonl.gz   one line per response: {"audio_file_path": ..., "response": {...}}
+    index.db                   SQLite: audio path -> shard, byte offset, length, line
+
+Responses are written in blocks, one per writer flush. Uncompressed, each
+line is its own block; with gzip or zstd each block is one compressed
+member/frame, so a lookup reads and decompresses one block, however large
+the store. Concatenated members are still a valid .gz/.zst file, so shards
+can also be read with zcat or zstdcat.
+
+Every process writing to the store creates its own shard file, so --workers
+processes never append to the same file; they share the index (SQLite WAL).
+A shard is closed and a new one started after STORE_SHARD_MB. Index rows are
+committed after their block is written, so after a crash a response is
+either indexed and readable or transcribed again. If a file is transcribed
+again, the index points to the newest response.
+
+Resume works as with sidecars: a file with an indexed response counts as
+transcribed. 'export' writes the sidecar layout (<audio>.json, indented)
+for the webapp.
+
+Usage:
+    python response_store.py stats                          # responses, shards, size on disk
+    python response_store.py get D:\\cv_eval_bn\\validated\\a\\clip.wav
+    python response_store.py export                         # write missing sidecars next to the audio
+    python response_store.py export --overwrite             # also replace existing sidecars
+    python response_store.py reindex                        # rebuild index.db from the shard files
+    python response_store.py --remaining stats              # store of the --remaining run
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import zlib
+from datetime import datetime
+from pathlib import Path
+
+from result_writer import write_json_atomic
+from run_state import csv_path_for_run
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    from config import STORE_COMPRESSION
+except ImportError:
+    STORE_COMPRESSION = 'gzip'
+
+try:
+    from config import STORE_SHARD_MB
+except ImportError:
+    STORE_SHARD_MB = 256
+
+SHARD_SUFFIXES = {None: '.jsonl', 'gzip': '.jsonl.gz', 'zstd': '.jsonl.zst'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    audio_file_path TEXT PRIMARY KEY,
+    shard TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    line INTEGER NOT NULL,
+    updated_at TEXT
+);
+"""
+
+
+def store_path_for(csv_output):
+    """Response store directory kept next to a CSV"""
+    csv_path = Path(csv_output)
+    return csv_path.parent / f"{csv_path.stem}_responses"
+
+
+def shard_compression(shard_name):
+    """Compression of a shard file, from its name"""
+    for compression, suffix in SHARD_SUFFIXES.items():
+        if compression and shard_name.endswith(suffix):
+            return compression
+    return None
+
+
+class ResponseStore:
+    """Sharded JSONL responses with an SQLite offset index
+
+    Args:
+        store_dir: Store directory, created if missing
+        compression: None, 'gzip' or 'zstd' for the shards this instance writes
+            (reading handles every kind)
+        shard_mb: Size at which a new shard file is started
+    """
+
+    def __init__(self, store_dir, compression=STORE_COMPRESSION, shard_mb=STORE_SHARD_MB):
+        if compression not in SHARD_SUFFIXES:
+            raise ValueError(f"Unknown store compression: {compression}")
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError("zstd compression needs the zstandard package (pip install zstandard)")
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.compression = compression
+        self.shard_bytes = shard_mb * 1024 * 1024
+        self.shard = None
+        self.shard_name = None
+        self.block_cache = (None, None)  # last decompressed block: ((shard, offset), lines)
+
+        # Writes come from the result writer thread, reads from the main thread, never both at once
+        self.conn = sqlite3.connect(str(self.store_dir / 'index.db'), timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+
+    def close(self):
+        if self.shard:
+            self.shard.close()
+            self.shard = None
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def count(self):
+        """Number of indexed responses"""
+        return self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    # ---------- writing ----------
+
+    def append(self, records, fsync=False):
+        """Write [(audio_file, response)] as one block and index them"""
+        lines = [
+            json.dumps({'audio_file_path': str(audio_file), 'response': response},
+                       ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+            for audio_file, response in records
+        ]
+        f = self._writable_shard()
+        offset = f.tell()
+        now = datetime.now().isoformat()
+
+        if self.compression:
+            block = self._compress(b''.join(lines))
+            f.write(block)
+            entries = [(str(audio_file), self.shard_name, offset, len(block), line, now)
+                       for line, (audio_file, _) in enumerate(records)]
+        else:
+            entries = []
+            for (audio_file, _), data in zip(records, lines):
+                entries.append((str(audio_file), self.shard_name, offset, len(data), 0, now))
+                offset += len(data)
+            f.write(b''.join(lines))
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO responses (audio_file_path, shard, offset, length, line, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (audio_file_path) DO UPDATE SET shard = excluded.shard, "
+                "offset = excluded.offset, length = excluded.length, line = excluded.line, "
+                "updated_at = excluded.updated_at", entries
+            )
+
+    def sync(self):
+        if self.shard:
+            os.fsync(self.shard.fileno())
+
+    def _writable_shard(self):
+        if self.shard and self.shard.tell() >= self.shard_bytes:
+            self.shard.close()
+            self.shard = None
+        if self.shard is None:
+            # Exclusive create: a shard number taken by another process is skipped
+            number = len(self.shard_names())
+            while True:
+                if any((self.store_dir / f"responses_{number:05d}{suffix}").exists()
+                       for suffix in SHARD_SUFFIXES.values()):
+                    number += 1
+                    continue
+                name = f"responses_{number:05d}{SHARD_SUFFIXES[self.compression]}"
+                try:
+                    self.shard = open(self.store_dir / name, 'xb')
+                    break
+                except FileExistsError:
+                    number += 1
+            self.shard_name = name
+        return self.shard
+
+    def _compress(self, data):
+        if self.compression == 'gzip':
+            return gzip.compress(data, compresslevel=6)
+        return zstandard.ZstdCompressor(level=3).compress(data)
+
+    # ---------- reading ----------
+
+    def get(self, audio_file):
+        """Stored response for an audio file, or None"""
+        row = self.conn.execute(
+            "SELECT shard, offset, length, line FROM responses WHERE audio_file_path = ?", (str(audio_file),)
+        ).fetchone()
+        if row is None:
+            return None
+        return self._read(*row)['response']
+
+    def __contains__(self, audio_file):
+        return self.conn.execute(
+            "SELECT 1 FROM responses WHERE audio_file_path = ?", (str(audio_file),)
+        ).fetchone() is not None
+
+    def stored_paths(self):
+        """Set of audio paths (str) with a stored response"""
+        return {row[0] for row in self.conn.execute("SELECT audio_file_path FROM responses")}
+
+    def iter_responses(self):
+        """(audio path, response) for every indexed response, in file order (each block read once)"""
+        rows = self.conn.execute(
+            "SELECT audio_file_path, shard, offset, length, line FROM responses ORDER BY shard, offset, line"
+        )
+        for audio_path, shard, offset, length, line in rows:
+            yield audio_path, self._read(shard, offset, length, line)['response']
+
+    def _read(self, shard, offset, length, line):
+        key = (shard, offset)
+        if self.block_cache[0] != key:
+            with open(self.store_dir / shard, 'rb') as f:
+                f.seek(offset)
+                block = f.read(length)
+            compression = shard_compression(shard)
+            if compression:
+                block = _decompress(block, compression)
+            self.block_cache = (key, block.splitlines())
+        return json.loads(self.block_cache[1][line])
+
+    def shard_names(self):
+        return sorted(p.name for p in self.store_dir.glob('responses_*.jsonl*') if not p.name.endswith('.tmp'))
+
+    # ---------- maintenance ----------
+
+    def export_sidecars(self, overwrite=False):
+        """Write <audio>.json (indented, as the sidecar backend does) for every stored response
+
+        Returns:
+            (written, skipped because the sidecar exists)
+        """
+        written = skipped = 0
+        for audio_path, response in self.iter_responses():
+            json_path = Path(audio_path).with_suffix('.json')
+            if json_path.exists() and not overwrite:
+                skipped += 1
+                continue
+            write_json_atomic(json_path, response)
+            written += 1
+        return written, skipped
+
+    def reindex(self):
+        """Rebuild the index from the shard files; the last record per file wins
+
+        A block cut short by a crash ends the shard it is in.
+        Returns the number of indexed responses.
+        """
+        entries = {}
+        for shard in self.shard_names():
+            with open(self.store_dir / shard, 'rb') as f:
+                data = f.read()
+            try:
+                for offset, length, lines in _iter_blocks(data, shard_compression(shard)):
+                    for line, text in enumerate(lines):
+                        audio_path = json.loads(text)['audio_file_path']
+                        entries[audio_path] = (audio_path, shard, offset, length, line)
+            except (OSError, ValueError, EOFError, zlib.error) as e:
+                print(f"  Warning: {shard} ends in an incomplete block: {e}")
+
+        now = datetime.now().isoformat()
+        with self.conn:
+            self.conn.execute("DELETE FROM responses")
+            self.conn.executemany(
+                "INSERT INTO responses (audio_file_path, shard, offset, length, line, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", [entry + (now,) for entry in entries.values()]
+            )
+        return len(entries)
+
+
+def _decompress(block, compression):
+    if compression == 'gzip':
+        return gzip.decompress(block)
+    if zstandard is None:
+        raise ImportError("Reading zstd shards needs the zstandard package (pip install zstandard)")
+    return zstandard.ZstdDecompressor().decompress(block)
+
+
+def _iter_blocks(data, compression):
+    """(offset, length, lines) for each block of a shard file's contents"""
+    offset = 0
+    while offset < len(data):
+        if compression is None:
+            end = data.find(b'\n', offset)
+            if end < 0:
+                raise ValueError("last line has no newline")
+            yield offset, end + 1 - offset, [data[offset:end]]
+            offset = end + 1
+            continue
+        if compression == 'gzip':
+            decompressor = zlib.decompressobj(wbits=31)
+        elif zstandard is not None:
+            decompressor = zstandard.ZstdDecompressor().decompressobj()
+        else:
+            raise ImportError("Reading zstd shards needs the zstandard package (pip install zstandard)")
+        text = decompressor.decompress(data[offset:])
+        if not decompressor.eof:
+            raise EOFError("compressed block is truncated")
+        length = len(data) - offset - len(decompressor.unused_data)
+        yield offset, length, text.splitlines()
+        offset += length
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect, export or reindex a packed response store")
+    parser.add_argument('-r', '--remaining', action='store_true', help="Use the store of the 'remaining' folder run")
+    parser.add_argument('--store', help="Store directory (default: next to the CSV)")
+    parser.add_argument('command', choices=['stats', 'get', 'export', 'reindex'])
+    parser.add_argument('audio_file', nargs='?', help="With get: audio file whose response to print")
+    parser.add_argument('--overwrite', action='store_true', help="With export: replace existing sidecars")
+    args = parser.parse_args()
+
+    store_dir = args.store or store_path_for(csv_path_for_run(args.remaining))
+    if not Path(store_dir).exists():
+        print(f"No response store at {store_dir}")
+        return
+
+    with ResponseStore(store_dir) as store:
+        if args.command == 'get':
+            response = store.get(args.audio_file)
+            print(json.dumps(response, ensure_ascii=False, indent=2) if response else f"Not stored: {args.audio_file}")
+        elif args.command == 'export':
+            written, skipped = store.export_sidecars(args.overwrite)
+            print(f"Wrote {written} sidecars ({skipped} already existed)")
+        elif args.command == 'reindex':
+            print(f"Indexed {store.reindex()} responses")
+        else:
+            shards = store.shard_names()
+            size = sum((store.store_dir / shard).stat().st_size for shard in shards)
+            print(f"Store: {store_dir}")
+            print(f"Responses: {store.count()}")
+            print(f"Shards: {len(shards)}, {size / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
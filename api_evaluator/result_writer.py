@@ -0,0 +1,314 @@
+"""
+Background writer for batch results
+
+Writing results used to happen on the request path: every CSV row opened
+the CSV, checked whether it existed, wrote the row and closed it again, and
+every JSON sidecar was written in place with json.dump, so a crash in the
+middle of a write left a truncated sidecar that the next run counted as
+transcribed. ResultWriter moves all of that to one thread:
+
+- Requests hand results to a bounded queue; when the disk falls behind, the
+  queue fills up and the runner waits instead of buffering without limit.
+- Sidecars are written to <name>.json.tmp right away, but only moved into
+  place (os.replace) by the flush that writes their CSV row, after the row.
+  A crash in between leaves a row without a sidecar, so the file is
+  transcribed again on resume, never a sidecar without a row that resume
+  would skip. With a ResponseStore, responses go to its shard files
+  instead, one block per flush.
+- CSV rows and trace lines are buffered per file and written in one go when
+  WRITER_FLUSH_ROWS are waiting or the oldest has waited WRITER_FLUSH_SECONDS.
+  Output files stay open for the whole run.
+- Every WRITER_FSYNC_SECONDS, the open files, the store shards, the
+  sidecars renamed since the last sync and their folders are fsynced.
+  0 syncs every sidecar before its rename and everything on every flush, so
+  a sidecar is complete or absent also after a power loss; with a longer
+  cadence, a power loss can leave the sidecars renamed in the last interval
+  empty, and the scan counts those as transcribed. None leaves it all to
+  the operating system.
+- A write that fails, for any reason, is counted and reported as a warning;
+  the thread keeps going, so the runner never waits on a dead writer.
+
+The queue is processed in order, so a file's sidecar is queued before its
+CSV row and both go out with the same flush.
+"""
+
+import csv
+import json
+import os
+import queue
+import threading
+import time
+
+try:
+    from config import WRITER_QUEUE_SIZE, WRITER_FLUSH_ROWS, WRITER_FLUSH_SECONDS, WRITER_FSYNC_SECONDS
+except ImportError:
+    WRITER_QUEUE_SIZE = 256
+    WRITER_FLUSH_ROWS = 50
+    WRITER_FLUSH_SECONDS = 1.0
+    WRITER_FSYNC_SECONDS = 5.0
+
+
+def write_json_temp(json_path, data, fsync=False):
+    """Write JSON to <json_path>.tmp and return that path; os.replace() it to publish"""
+    temp_path = f"{json_path}.tmp"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return temp_path
+
+
+def write_json_atomic(json_path, data, fsync=False):
+    """Write JSON to a temporary file next to json_path and move it into place"""
+    temp_path = write_json_temp(json_path, data, fsync=fsync)
+    try:
+        os.replace(temp_path, json_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def _fsync_file(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_directory(directory):
+    """Make the renames in a folder durable; folders cannot be opened for fsync on Windows"""
+    if os.name == 'nt':
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ResultWriter:
+    """Writer thread for JSON sidecars, CSV rows and JSONL lines
+
+    Args:
+        queue_size: Writes waiting before save_json()/append_row() block
+        flush_rows: Buffered rows, lines and sidecars that trigger a flush
+        flush_seconds: Longest time a row waits in the buffer
+        fsync_seconds: Time between fsyncs (0 = every write, None = never)
+        response_store: ResponseStore for save_response() (None = sidecars only)
+    """
+
+    def __init__(self, queue_size=WRITER_QUEUE_SIZE, flush_rows=WRITER_FLUSH_ROWS,
+                 flush_seconds=WRITER_FLUSH_SECONDS, fsync_seconds=WRITER_FSYNC_SECONDS, response_store=None):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.response_store = response_store
+        self.responses = []  # (audio file, response) waiting for the next store block
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.fsync_seconds = fsync_seconds
+
+        self.buffers = {}   # path -> [row dict or line]
+        self.handles = {}   # path -> (open file, csv.DictWriter or None)
+        self.renames = []      # (temp path, sidecar path) published with the next flush
+        self.unsynced = []     # sidecars renamed since the last fsync
+        self.buffered = 0
+        self.oldest = None
+        self.last_sync = time.time()
+        self.stats = {'sidecars': 0, 'stored': 0, 'rows': 0, 'flushes': 0, 'fsyncs': 0, 'errors': 0,
+                      'max_queue': 0, 'write_seconds': 0.0}
+
+        self.thread = threading.Thread(target=self._run, name='result-writer', daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # ---------- producer side ----------
+
+    def save_json(self, json_path, data):
+        """Queue a sidecar; it appears at json_path with the flush that writes its CSV row"""
+        self._put(('json', str(json_path), data))
+
+    def save_response(self, audio_file, response):
+        """Queue a response for the response store; written with the next flush"""
+        self._put(('response', str(audio_file), response))
+
+    def append_row(self, csv_path, row, fieldnames):
+        """Queue a CSV row; the header is written if the file is new or empty"""
+        self._put(('row', str(csv_path), (row, fieldnames)))
+
+    def append_line(self, path, line):
+        """Queue one line of text (a newline is added)"""
+        self._put(('line', str(path), line))
+
+    def close(self):
+        """Write everything still queued or buffered, sync and stop the thread"""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def _put(self, task):
+        self.queue.put(task)
+        self.stats['max_queue'] = max(self.stats['max_queue'], self.queue.qsize())
+
+    # ---------- writer thread ----------
+
+    def _run(self):
+        while True:
+            timeout = None
+            if self.oldest is not None:
+                timeout = max(0.0, self.oldest + self.flush_seconds - time.time())
+            try:
+                task = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                self._flush()
+                continue
+            if task is None:
+                break
+
+            start = time.time()
+            kind, path, payload = task
+            try:
+                if kind == 'json':
+                    # Renamed by the flush that writes the file's CSV row, not before
+                    temp_path = write_json_temp(path, payload, fsync=self.fsync_seconds == 0)
+                    self.renames.append((temp_path, path))
+                    self.buffered += 1
+                    if self.oldest is None:
+                        self.oldest = start
+                elif kind == 'response':
+                    self.responses.append((path, payload))
+                    self.buffered += 1
+                    if self.oldest is None:
+                        self.oldest = start
+                else:
+                    self.buffers.setdefault(path, []).append((kind, payload))
+                    self.buffered += 1
+                    if self.oldest is None:
+                        self.oldest = start
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"  Warning: Could not write {path}: {e}")
+            self.stats['write_seconds'] += time.time() - start
+
+            if self.buffered >= self.flush_rows:
+                self._flush()
+
+        self._flush()
+        self._sync()
+        for f, _ in self.handles.values():
+            f.close()
+        self.handles = {}
+
+    def _flush(self):
+        start = time.time()
+        # Responses before rows, so no CSV row points to a response that is not stored
+        if self.responses:
+            try:
+                self.response_store.append(self.responses, fsync=self.fsync_seconds == 0)
+                self.stats['stored'] += len(self.responses)
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"  Warning: Could not store {len(self.responses)} responses: {e}")
+            self.responses = []
+        for path, entries in self.buffers.items():
+            try:
+                f, writer = self._handle(path, entries[0])
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"  Warning: Could not write {len(entries)} rows to {path}: {e}")
+                continue
+            for kind, payload in entries:
+                # One bad row (unknown field, unencodable text) is reported and skipped, not the batch
+                try:
+                    if kind == 'row':
+                        writer.writerow(payload[0])
+                    else:
+                        f.write(payload + '\n')
+                    self.stats['rows'] += 1
+                except Exception as e:
+                    self.stats['errors'] += 1
+                    print(f"  Warning: Could not write a row to {path}: {e}")
+            try:
+                f.flush()
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"  Warning: Could not write rows to {path}: {e}")
+        if self.renames:
+            if self.fsync_seconds == 0:
+                # Rows on disk before the sidecars that mark their files as done
+                self._sync()
+            for temp_path, path in self.renames:
+                try:
+                    os.replace(temp_path, path)
+                    self.stats['sidecars'] += 1
+                    if self.fsync_seconds is not None:
+                        self.unsynced.append(path)
+                except Exception as e:
+                    self.stats['errors'] += 1
+                    print(f"  Warning: Could not write {path}: {e}")
+            self.renames = []
+        if self.buffers or self.buffered:
+            self.stats['flushes'] += 1
+        self.buffers = {}
+        self.buffered = 0
+        self.oldest = None
+
+        if self.fsync_seconds is not None and time.time() - self.last_sync >= self.fsync_seconds:
+            self._sync()
+        self.stats['write_seconds'] += time.time() - start
+
+    def _handle(self, path, first_entry):
+        """Open file (and DictWriter for CSVs) for a path, kept open until close()"""
+        if path not in self.handles:
+            kind, payload = first_entry
+            new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+            if kind == 'row':
+                f = open(path, 'a', newline='', encoding='utf-8')
+                writer = csv.DictWriter(f, fieldnames=payload[1])
+                if new_file:
+                    writer.writeheader()
+            else:
+                f = open(path, 'a', encoding='utf-8')
+                writer = None
+            self.handles[path] = (f, writer)
+        return self.handles[path]
+
+    def _sync(self):
+        if self.fsync_seconds is None:
+            return
+        try:
+            for f, _ in self.handles.values():
+                os.fsync(f.fileno())
+            if self.fsync_seconds:
+                # With fsync_seconds == 0 the data was synced before the rename
+                for path in self.unsynced:
+                    _fsync_file(path)
+            for directory in {os.path.dirname(os.path.abspath(path)) for path in self.unsynced}:
+                _fsync_directory(directory)
+            if self.response_store:
+                self.response_store.sync()
+            self.stats['fsyncs'] += 1
+        except Exception as e:
+            self.stats['errors'] += 1
+            print(f"  Warning: fsync failed: {e}")
+        self.unsynced = []
+        self.last_sync = time.time()
+
+    def print_summary(self):
+        stats = self.stats
+        stored = f"{stats['stored']} stored responses, " if self.response_store else ""
+        print(f"Writer: {stats['sidecars']} sidecars, {stored}{stats['rows']} rows in {stats['flushes']} flushes, "
+              f"{stats['fsyncs']} fsyncs, {stats['write_seconds']:.2f}s writing, "
+              f"queue peak {stats['max_queue']}/{self.queue.maxsize}")
+        if stats['errors']:
+            print(f"  ✗ {stats['errors']} write errors (see warnings above)")
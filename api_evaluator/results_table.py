@@ -0,0 +1,270 @@
+"""
+Typed columnar copy of the results CSV
+
+The CSV keeps everything as text ('N/A' for missing numbers, error messages
+in the transcript column), so every analysis re-parses and coerces the whole
+file. This converts it to Parquet (or Arrow IPC for .arrow/.feather
+outputs) with real types and nulls:
+
+    audio_file_path             string
+    success                     bool
+    transcription_file_path     string, null for errors
+    transcript                  string, null for errors
+    transcript_chars            int32
+    audio_length_seconds        float64, null if unknown
+    api_response_time_seconds   float64, null if unknown
+    error_code                  dictionary string: timeout, connection, server_error,
+                                bad_input, exception, other; null for successes
+    error_message               string, null for successes
+    words                       list<string>, from the sidecar or response store
+    word_start_seconds          list<float32>
+    word_end_seconds            list<float32>
+
+Rows are converted CONVERT_CHUNK_ROWS at a time, each chunk one row group
+(Parquet) or record batch (Arrow), so memory stays flat on a history of
+millions of rows. Readers load only the columns they ask for; see
+read_results() and analyze_results.py.
+
+Usage:
+    python results_table.py                    # transcription_path.csv -> transcription_path.parquet
+    python results_table.py --remaining        # the 'remaining' run's CSV
+    python results_table.py --format arrow     # Arrow IPC file instead of Parquet
+    python results_table.py --no-words         # skip per-word timings (no sidecar reads)
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from rate_controller import classify_error
+from response_store import ResponseStore, store_path_for
+from run_state import csv_path_for_run
+
+try:
+    from config import TIMESTAMP_RATE
+except ImportError:
+    TIMESTAMP_RATE = 16000
+
+# CSV rows per row group / record batch
+CONVERT_CHUNK_ROWS = 100000
+
+# Threads reading sidecars for the word timings
+SIDECAR_READERS = 16
+
+ERROR_CODES = ['timeout', 'connection', 'server_error', 'bad_input', 'exception', 'other']
+
+SCHEMA = pa.schema([
+    ('audio_file_path', pa.string()),
+    ('success', pa.bool_()),
+    ('transcription_file_path', pa.string()),
+    ('transcript', pa.string()),
+    ('transcript_chars', pa.int32()),
+    ('audio_length_seconds', pa.float64()),
+    ('api_response_time_seconds', pa.float64()),
+    ('error_code', pa.dictionary(pa.int8(), pa.string())),
+    ('error_message', pa.string()),
+    ('words', pa.list_(pa.string())),
+    ('word_start_seconds', pa.list_(pa.float32())),
+    ('word_end_seconds', pa.list_(pa.float32())),
+])
+
+
+def table_path_for(csv_output, file_format='parquet'):
+    """Columnar results file kept next to a CSV"""
+    csv_path = Path(csv_output)
+    return csv_path.parent / f"{csv_path.stem}.{file_format}"
+
+
+def error_code(message):
+    """Error code for the message of an ERROR row ('ERROR: ...' or 'EXCEPTION: ...')"""
+    if message.startswith('EXCEPTION:'):
+        return 'exception'
+    message = re.sub(r'^ERROR:\s*', '', message)
+    message = re.sub(r'^segment \d+/\d+:\s*', '', message)
+    kind = classify_error(message)
+    if kind != 'other':
+        return kind
+    if message.startswith('Socket error'):
+        return 'server_error'
+    if message.startswith('File not found') or message.startswith('Empty audio file'):
+        return 'bad_input'
+    return 'other'
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _word_timings(response):
+    """(words, starts, ends) from an API response; timestamps are samples at TIMESTAMP_RATE"""
+    words = (response or {}).get('output', {}).get('predicted_words') or []
+    starts = []
+    ends = []
+    for word in words:
+        timestamp = word.get('timestamp') or [None, None]
+        starts.append(timestamp[0] / TIMESTAMP_RATE if timestamp[0] is not None else None)
+        ends.append(timestamp[1] / TIMESTAMP_RATE if timestamp[1] is not None else None)
+    return [word.get('word') for word in words], starts, ends
+
+
+def _read_sidecar(json_path):
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def chunk_columns(rows, executor=None, store=None):
+    """Column lists for one chunk of CSV rows (v1 or v2 column names)
+
+    With an executor, per-word timings are read from the response store if
+    the file is in it, else from the sidecar; without one they are left null.
+    """
+    columns = {name: [] for name in SCHEMA.names}
+    for row in rows:
+        json_path = row.get('transcription_file_path', row.get('transcript_file_path'))
+        success = json_path != 'ERROR'
+        transcript = row.get('transcript') or ''
+        columns['audio_file_path'].append(row['audio_file_path'])
+        columns['success'].append(success)
+        columns['transcription_file_path'].append(json_path if success else None)
+        columns['transcript'].append(transcript if success else None)
+        columns['transcript_chars'].append(len(transcript) if success else 0)
+        columns['audio_length_seconds'].append(_number(row.get('audio_length_seconds', row.get('duration_seconds'))))
+        columns['api_response_time_seconds'].append(_number(row.get('api_response_time_seconds')))
+        columns['error_code'].append(None if success else ERROR_CODES.index(error_code(transcript)))
+        columns['error_message'].append(None if success else transcript)
+
+    # Same dictionary in every chunk: an Arrow IPC file cannot replace it between batches
+    columns['error_code'] = pa.DictionaryArray.from_arrays(pa.array(columns['error_code'], pa.int8()),
+                                                           pa.array(ERROR_CODES))
+
+    if executor is None:
+        for name in ('words', 'word_start_seconds', 'word_end_seconds'):
+            columns[name] = [None] * len(rows)
+        return columns
+
+    def response_for(index):
+        if not columns['success'][index]:
+            return None
+        audio_path = columns['audio_file_path'][index]
+        if store is not None and audio_path in store:
+            return store.get(audio_path)
+        return _read_sidecar(columns['transcription_file_path'][index])
+
+    # The store is read in this thread (one SQLite connection); sidecars in the pool
+    if store is not None:
+        responses = [response_for(i) for i in range(len(rows))]
+    else:
+        responses = list(executor.map(response_for, range(len(rows))))
+    for response in responses:
+        if response is None:
+            columns['words'].append(None)
+            columns['word_start_seconds'].append(None)
+            columns['word_end_seconds'].append(None)
+            continue
+        words, starts, ends = _word_timings(response)
+        columns['words'].append(words)
+        columns['word_start_seconds'].append(starts)
+        columns['word_end_seconds'].append(ends)
+    return columns
+
+
+def convert_csv(csv_path, output_path, words=True, store_dir=None, chunk_rows=CONVERT_CHUNK_ROWS):
+    """Write the CSV as Parquet (or Arrow IPC for .arrow/.feather) in chunks
+
+    The output is written to a temporary file and moved into place at the end.
+
+    Returns:
+        Number of rows written
+    """
+    output_path = Path(output_path)
+    arrow = output_path.suffix in ('.arrow', '.feather')
+    temp_path = f"{output_path}.tmp"
+    store = ResponseStore(store_dir) if words and store_dir and Path(store_dir).exists() else None
+    executor = ThreadPoolExecutor(max_workers=SIDECAR_READERS) if words else None
+
+    total = 0
+    sink = open(temp_path, 'wb')
+    writer = pa.ipc.new_file(sink, SCHEMA) if arrow else pq.ParquetWriter(sink, SCHEMA, compression='zstd')
+    try:
+        with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            while True:
+                rows = list(itertools.islice(reader, chunk_rows))
+                if not rows:
+                    break
+                table = pa.Table.from_pydict(chunk_columns(rows, executor, store), schema=SCHEMA)
+                writer.write_table(table)
+                total += len(rows)
+    finally:
+        writer.close()
+        sink.close()
+        if executor:
+            executor.shutdown()
+        if store:
+            store.close()
+    os.replace(temp_path, output_path)
+    return total
+
+
+def read_results(path, columns=None):
+    """Read a converted results file, loading only `columns` (all if None)"""
+    path = Path(path)
+    if path.suffix in ('.arrow', '.feather'):
+        # Memory-mapped: columns not asked for are never read
+        return feather.read_table(str(path), columns=columns, memory_map=True)
+    return pq.read_table(str(path), columns=columns)
+
+
+def read_head(path, columns, count):
+    """First `count` rows of some columns, reading only the first row group/batch"""
+    path = Path(path)
+    if path.suffix in ('.arrow', '.feather'):
+        return read_results(path, columns).slice(0, count)
+    parquet_file = pq.ParquetFile(str(path))
+    if parquet_file.num_row_groups == 0:
+        return SCHEMA.empty_table().select(columns)
+    return parquet_file.read_row_group(0, columns=columns).slice(0, count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the results CSV to a typed columnar file")
+    parser.add_argument('-r', '--remaining', action='store_true', help="Convert the 'remaining' run's CSV")
+    parser.add_argument('--csv', help="CSV to convert (default: the configured CSV)")
+    parser.add_argument('--format', choices=['parquet', 'arrow'], default='parquet',
+                        help="Parquet (default) or Arrow IPC file")
+    parser.add_argument('-o', '--output', help="Output file (default: next to the CSV)")
+    parser.add_argument('--no-words', action='store_true', help="Leave the per-word timing columns empty")
+    args = parser.parse_args()
+
+    csv_output = args.csv or csv_path_for_run(args.remaining)
+    output_path = args.output or table_path_for(csv_output, args.format)
+    if not os.path.exists(csv_output):
+        print(f"ERROR: CSV file not found: {csv_output}")
+        return
+
+    print(f"Converting {csv_output} -> {output_path}")
+    start = time.time()
+    rows = convert_csv(csv_output, output_path, words=not args.no_words, store_dir=store_path_for(csv_output))
+    elapsed = time.time() - start
+    print(f"✓ {rows} rows in {elapsed:.1f}s ({os.path.getsize(output_path) / 1024 / 1024:.1f} MB, "
+          f"CSV {os.path.getsize(csv_output) / 1024 / 1024:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+SQLite run-state store for batch transcription
+
+One row per audio file with its status, number of attempts, last error,
+API latency and audio duration. The batch runner updates a row in its own
+transaction as each file starts and finishes, so the database is consistent
+even if the run is killed; worker processes share one database file (WAL
+mode, busy timeout). Per-status totals (files, audio seconds, API seconds)
+are kept up to date by triggers, so check_progress.py reads progress from a
+handful of rows instead of counting the whole table or the file tree.
+
+Statuses:
+    pending      found by the scan, not sent yet
+    in_progress  sent; still set after a crash, reset to pending on the next run
+    done         transcript saved
+    failed       last attempt failed; retried on the next run until it has
+                 failed MAX_ATTEMPTS times, then skipped until requeued
+"""
+
+import csv
+import os
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+try:
+    from config import MAX_ATTEMPTS
+except ImportError:
+    MAX_ATTEMPTS = 3
+
+try:
+    from config import CSV_OUTPUT_PATH
+except ImportError:
+    CSV_OUTPUT_PATH = r"D:\cv_eval_bn\transcription_path.csv"
+
+STATUSES = ['pending', 'in_progress', 'done', 'failed']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    audio_file_path TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    api_response_time REAL,
+    audio_duration REAL,
+    transcription_file_path TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS files_status ON files (status, attempts);
+
+CREATE TABLE IF NOT EXISTS totals (
+    status TEXT PRIMARY KEY,
+    files INTEGER NOT NULL DEFAULT 0,
+    audio_seconds REAL NOT NULL DEFAULT 0,
+    response_seconds REAL NOT NULL DEFAULT 0
+);
+
+-- One totals row per status exists up front: an INSERT OR IGNORE inside a trigger
+-- would take on the conflict handling of the upsert that fired it
+INSERT OR IGNORE INTO totals (status) VALUES ('pending'), ('in_progress'), ('done'), ('failed');
+
+CREATE TRIGGER IF NOT EXISTS files_insert AFTER INSERT ON files BEGIN
+    UPDATE totals SET files = files + 1,
+        audio_seconds = audio_seconds + COALESCE(NEW.audio_duration, 0),
+        response_seconds = response_seconds + COALESCE(NEW.api_response_time, 0)
+    WHERE status = NEW.status;
+END;
+
+CREATE TRIGGER IF NOT EXISTS files_update AFTER UPDATE ON files BEGIN
+    UPDATE totals SET files = files - 1,
+        audio_seconds = audio_seconds - COALESCE(OLD.audio_duration, 0),
+        response_seconds = response_seconds - COALESCE(OLD.api_response_time, 0)
+    WHERE status = OLD.status;
+    UPDATE totals SET files = files + 1,
+        audio_seconds = audio_seconds + COALESCE(NEW.audio_duration, 0),
+        response_seconds = response_seconds + COALESCE(NEW.api_response_time, 0)
+    WHERE status = NEW.status;
+END;
+
+CREATE TRIGGER IF NOT EXISTS files_delete AFTER DELETE ON files BEGIN
+    UPDATE totals SET files = files - 1,
+        audio_seconds = audio_seconds - COALESCE(OLD.audio_duration, 0),
+        response_seconds = response_seconds - COALESCE(OLD.api_response_time, 0)
+    WHERE status = OLD.status;
+END;
+"""
+
+
+def csv_path_for_run(process_remaining):
+    """CSV written by batch_transcribe_v2.py, with or without --remaining"""
+    if not process_remaining:
+        return CSV_OUTPUT_PATH
+    csv_path = Path(CSV_OUTPUT_PATH)
+    return str(csv_path.parent / f"{csv_path.stem}_remaining{csv_path.suffix}")
+
+
+def state_path_for(csv_output):
+    """State database kept next to a CSV"""
+    csv_path = Path(csv_output)
+    return csv_path.parent / f"{csv_path.stem}_state.db"
+
+
+class RunState:
+    """Connection to a run-state database; every method commits its own transaction
+
+    Args:
+        db_path: SQLite file, created with its schema if missing
+    """
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self.created = not os.path.exists(self.db_path)
+        self.conn = sqlite3.connect(self.db_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # ---------- runner updates ----------
+
+    def add_pending(self, audio_files):
+        """Record files the scan found without a transcript
+
+        New files are added as pending. Files marked done or in_progress whose
+        transcript is missing go back to pending; failed files keep their status
+        and attempt count.
+        """
+        now = datetime.now().isoformat()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO files (audio_file_path, status, updated_at) VALUES (?, 'pending', ?) "
+                "ON CONFLICT (audio_file_path) DO UPDATE SET status = 'pending', updated_at = excluded.updated_at "
+                "WHERE files.status IN ('done', 'in_progress')",
+                [(str(f), now) for f in audio_files]
+            )
+
+    def exhausted(self, max_attempts=MAX_ATTEMPTS):
+        """Paths of files that failed max_attempts times or more"""
+        rows = self.conn.execute(
+            "SELECT audio_file_path FROM files WHERE status = 'failed' AND attempts >= ?", (max_attempts,)
+        )
+        return {row[0] for row in rows}
+
+    def mark_started(self, audio_files):
+        now = datetime.now().isoformat()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO files (audio_file_path, status, attempts, updated_at) VALUES (?, 'in_progress', 1, ?) "
+                "ON CONFLICT (audio_file_path) DO UPDATE SET status = 'in_progress', "
+                "attempts = files.attempts + 1, updated_at = excluded.updated_at",
+                [(str(f), now) for f in audio_files]
+            )
+
+    def mark_done(self, audio_file, json_path, api_response_time, audio_duration):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO files (audio_file_path, status, attempts, api_response_time, audio_duration, "
+                "transcription_file_path, updated_at) VALUES (?, 'done', 1, ?, ?, ?, ?) "
+                "ON CONFLICT (audio_file_path) DO UPDATE SET status = 'done', last_error = NULL, "
+                "api_response_time = excluded.api_response_time, audio_duration = excluded.audio_duration, "
+                "transcription_file_path = excluded.transcription_file_path, updated_at = excluded.updated_at",
+                (str(audio_file), api_response_time, audio_duration, str(json_path), datetime.now().isoformat())
+            )
+
+    def mark_failed(self, audio_file, error, api_response_time=None):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO files (audio_file_path, status, attempts, last_error, api_response_time, updated_at) "
+                "VALUES (?, 'failed', 1, ?, ?, ?) "
+                "ON CONFLICT (audio_file_path) DO UPDATE SET status = 'failed', last_error = excluded.last_error, "
+                "api_response_time = excluded.api_response_time, updated_at = excluded.updated_at",
+                (str(audio_file), error, api_response_time, datetime.now().isoformat())
+            )
+
+    # ---------- queries ----------
+
+    def totals(self):
+        """{status: {'files', 'audio_seconds', 'response_seconds'}} for every status"""
+        totals = {status: {'files': 0, 'audio_seconds': 0.0, 'response_seconds': 0.0} for status in STATUSES}
+        for status, files, audio_seconds, response_seconds in self.conn.execute(
+                "SELECT status, files, audio_seconds, response_seconds FROM totals"):
+            totals[status] = {'files': files, 'audio_seconds': audio_seconds, 'response_seconds': response_seconds}
+        return totals
+
+    def failed(self, limit=None, error_like=None):
+        """(path, attempts, last error) of failed files, most attempts first"""
+        query = "SELECT audio_file_path, attempts, last_error FROM files WHERE status = 'failed'"
+        params = []
+        if error_like:
+            query += " AND last_error LIKE ?"
+            params.append(f"%{error_like}%")
+        query += " ORDER BY attempts DESC, audio_file_path"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        return self.conn.execute(query, params).fetchall()
+
+    def error_counts(self, limit=10):
+        """Most common last errors among failed files: [(error, count)]"""
+        return self.conn.execute(
+            "SELECT last_error, COUNT(*) FROM files WHERE status = 'failed' "
+            "GROUP BY last_error ORDER BY COUNT(*) DESC LIMIT ?", (limit,)
+        ).fetchall()
+
+    # ---------- maintenance ----------
+
+    def reset_interrupted(self):
+        """Put files left in_progress by a crashed run back to pending; returns how many"""
+        with self.conn:
+            return self.conn.execute(
+                "UPDATE files SET status = 'pending', updated_at = ? WHERE status = 'in_progress'",
+                (datetime.now().isoformat(),)
+            ).rowcount
+
+    def requeue(self, error_like=None):
+        """Make failed files eligible again (attempts reset to 0); returns how many"""
+        query = "UPDATE files SET status = 'pending', attempts = 0, updated_at = ? WHERE status = 'failed'"
+        params = [datetime.now().isoformat()]
+        if error_like:
+            query += " AND last_error LIKE ?"
+            params.append(f"%{error_like}%")
+        with self.conn:
+            return self.conn.execute(query, params).rowcount
+
+    def import_csv(self, csv_path):
+        """Load results from a batch CSV (v1 or v2 columns) in one transaction
+
+        A successful row wins over ERROR rows for the same file; each ERROR row
+        counts as one attempt. Rows without a transcript path are skipped.
+        Returns (done, failed) files imported.
+        """
+        rows = {}
+        with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                json_path = row.get('transcription_file_path', row.get('transcript_file_path'))
+                if not json_path:
+                    continue  # neither a result nor an error (truncated or hand-edited row)
+                entry = rows.setdefault(row['audio_file_path'], {'json_path': None, 'errors': 0})
+                if json_path == 'ERROR':
+                    entry['errors'] += 1
+                    entry['error'] = row.get('transcript', '')
+                else:
+                    entry['json_path'] = json_path
+                    entry['duration'] = _float_or_none(row.get('audio_length_seconds', row.get('duration_seconds')))
+                    entry['response_time'] = _float_or_none(row.get('api_response_time_seconds'))
+
+        now = datetime.now().isoformat()
+        done = [(path, e['errors'] + 1, e['response_time'], e['duration'], e['json_path'], now)
+                for path, e in rows.items() if e['json_path']]
+        failed = [(path, e['errors'], e['error'], now) for path, e in rows.items() if not e['json_path']]
+        with self.conn:
+            self.conn.executemany(
+                # An upsert rather than INSERT OR REPLACE, whose implicit delete skips the totals trigger
+                "INSERT INTO files (audio_file_path, status, attempts, api_response_time, audio_duration, "
+                "transcription_file_path, updated_at) VALUES (?, 'done', ?, ?, ?, ?, ?) "
+                "ON CONFLICT (audio_file_path) DO UPDATE SET status = 'done', attempts = excluded.attempts, "
+                "last_error = NULL, api_response_time = excluded.api_response_time, "
+                "audio_duration = excluded.audio_duration, transcription_file_path = excluded.transcription_file_path, "
+                "updated_at = excluded.updated_at", done
+            )
+            self.conn.executemany(
+                "INSERT INTO files (audio_file_path, status, attempts, last_error, updated_at) "
+                "VALUES (?, 'failed', ?, ?, ?) ON CONFLICT (audio_file_path) DO NOTHING", failed
+            )
+        return len(done), len(failed)
+
+    def import_sidecars(self, audio_files):
+        """Mark audio files that already have a JSON sidecar as done; returns how many changed
+
+        Only status and sidecar path are set; import_csv() also brings in
+        durations and latencies.
+        """
+        now = datetime.now().isoformat()
+        added = 0
+        with self.conn:
+            for audio_file in audio_files:
+                json_path = Path(audio_file).with_suffix('.json')
+                added += self.conn.execute(
+                    "INSERT INTO files (audio_file_path, status, attempts, transcription_file_path, updated_at) "
+                    "VALUES (?, 'done', 1, ?, ?) ON CONFLICT (audio_file_path) DO UPDATE SET status = 'done', "
+                    "transcription_file_path = excluded.transcription_file_path, updated_at = excluded.updated_at "
+                    "WHERE files.status != 'done'",
+                    (str(audio_file), str(json_path), now)
+                ).rowcount
+        return added
+
+
+def _float_or_none(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,221 @@
+"""
+Duration-aware scheduling for batch transcription
+
+Files used to be sent in path order, so with several requests in flight a
+few long clips picked up at the very end kept one connection busy while
+the others sat idle. Ordering the work by audio duration fixes most of
+that tail:
+
+- longest-first:  longest-processing-time-first (LPT), the classic
+                  makespan heuristic; long clips start early and short
+                  clips fill the gaps at the end
+- shortest-first: quickest results first, worst tail
+- path:           the old sorted-by-path order
+
+ScheduleTracker records when each file started and finished and, after the
+run, compares the actual makespan and tail with what a simulation of the
+same order predicts (and with what path order would have given).
+"""
+
+import csv
+import heapq
+import os
+import time
+
+from audio_probe import probe_durations, probe_duration
+
+SCHEDULE_POLICIES = ['longest-first', 'shortest-first', 'path']
+
+
+def estimate_duration(audio_path, probed=None):
+    """Audio duration in seconds: from the file's headers, else estimated from file size
+
+    Args:
+        probed: Result of audio_probe.probe_duration() if already known
+    """
+    duration = probed if probed is not None else probe_duration(audio_path)
+    if duration is not None:
+        return duration
+    try:
+        # Rough estimate: 1 minute of MP3 at 128kbps ≈ 1MB
+        return os.path.getsize(audio_path) / 1024 / 1024 * 60
+    except OSError:
+        return 0.0
+
+
+def order_files(files, policy='longest-first'):
+    """Order files for processing according to a scheduling policy
+
+    Returns:
+        (ordered file list, {file: estimated duration in seconds})
+    """
+    estimates = {f: estimate_duration(f, probed) for f, probed in probe_durations(files).items()}
+    if policy == 'longest-first':
+        ordered = sorted(files, key=lambda f: (-estimates[f], str(f)))
+    elif policy == 'shortest-first':
+        ordered = sorted(files, key=lambda f: (estimates[f], str(f)))
+    else:
+        ordered = sorted(files)
+    return ordered, estimates
+
+
+def simulate_schedule(service_times, concurrency):
+    """List-schedule jobs in the given order on `concurrency` slots
+
+    Returns:
+        (makespan, tail) where tail is the time from the last job being
+        started until the last job finishes, i.e. the period in which some
+        slots have nothing left to do.
+    """
+    if not service_times:
+        return 0.0, 0.0
+    slots = [0.0] * max(1, concurrency)
+    last_start = 0.0
+    for service in service_times:
+        start = heapq.heappop(slots)
+        last_start = start
+        heapq.heappush(slots, start + service)
+    makespan = max(slots)
+    return makespan, makespan - last_start
+
+
+def fit_service_model(pairs):
+    """Least-squares fit of service time = overhead + rtf * audio duration
+
+    Args:
+        pairs: list of (audio duration, measured seconds)
+
+    Returns:
+        (overhead, rtf)
+    """
+    if not pairs:
+        return 0.0, 0.0
+    n = len(pairs)
+    mean_x = sum(x for x, _ in pairs) / n
+    mean_y = sum(y for _, y in pairs) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in pairs)
+    if var_x == 0:
+        # All clips the same length: treat the whole time as overhead
+        return mean_y, 0.0
+    rtf = sum((x - mean_x) * (y - mean_y) for x, y in pairs) / var_x
+    rtf = max(0.0, rtf)
+    overhead = max(0.0, mean_y - rtf * mean_x)
+    return overhead, rtf
+
+
+class ScheduleTracker:
+    """Records per-file start and finish times and reports the run's tail
+
+    Args:
+        files: Files in the order they will be dispatched
+        estimates: {file: estimated duration in seconds}
+        concurrency: Configured number of requests in flight
+        policy: Name of the scheduling policy, for the report
+    """
+
+    def __init__(self, files, estimates, concurrency, policy):
+        self.files = list(files)
+        self.estimates = estimates
+        self.concurrency = concurrency
+        self.policy = policy
+
+        self.started = {}
+        self.finished = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._busy_seconds = 0.0
+        self._last_change = None
+        self._first_start = None
+
+    def _account(self, now):
+        if self._last_change is not None:
+            self._busy_seconds += self.in_flight * (now - self._last_change)
+        self._last_change = now
+
+    def start(self, audio_file):
+        now = time.time()
+        if self._first_start is None:
+            self._first_start = now
+        self._account(now)
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        self.started[audio_file] = now
+
+    def finish(self, audio_file):
+        now = time.time()
+        self._account(now)
+        self.in_flight -= 1
+        self.finished[audio_file] = now
+
+    def report(self):
+        """Estimated versus actual makespan and tail, or None before any file finished"""
+        done = [f for f in self.files if f in self.finished]
+        if not done:
+            return None
+
+        actual_makespan = max(self.finished[f] for f in done) - self._first_start
+        actual_tail = max(self.finished[f] for f in done) - max(self.started[f] for f in done)
+        avg_in_flight = self._busy_seconds / actual_makespan if actual_makespan else 1
+        # Simulate with the slots the run actually reached (the rate controller may stay below concurrency)
+        slots = max(1, self.peak_in_flight)
+
+        overhead, rtf = fit_service_model([
+            (self.estimates.get(f, 0.0), self.finished[f] - self.started[f]) for f in done
+        ])
+
+        def predicted(order):
+            return simulate_schedule([overhead + rtf * self.estimates.get(f, 0.0) for f in order], slots)
+
+        est_makespan, est_tail = predicted(done)
+        path_makespan, path_tail = predicted(sorted(done, key=str))
+
+        return {
+            'policy': self.policy,
+            'files': len(done),
+            'concurrency': self.concurrency,
+            'avg_in_flight': avg_in_flight,
+            'service_overhead': overhead,
+            'service_rtf': rtf,
+            'actual_makespan': actual_makespan,
+            'actual_tail': actual_tail,
+            'estimated_makespan': est_makespan,
+            'estimated_tail': est_tail,
+            'path_order_makespan': path_makespan,
+            'path_order_tail': path_tail
+        }
+
+    def print_report(self):
+        report = self.report()
+        if report is None:
+            return report
+
+        print(f"Schedule: {report['policy']}, {report['files']} files, "
+              f"concurrency {report['concurrency']} (avg {report['avg_in_flight']:.1f} in flight)")
+        print(f"Service time model: {report['service_overhead']:.2f}s + "
+              f"{report['service_rtf']:.3f} x audio seconds")
+        print(f"  {'':<22} {'makespan':>10} {'tail':>10}")
+        print(f"  {'actual':<22} {report['actual_makespan']:>9.1f}s {report['actual_tail']:>9.1f}s")
+        print(f"  {'estimated':<22} {report['estimated_makespan']:>9.1f}s {report['estimated_tail']:>9.1f}s")
+        if report['policy'] != 'path':
+            print(f"  {'path order (estimated)':<22} {report['path_order_makespan']:>9.1f}s "
+                  f"{report['path_order_tail']:>9.1f}s")
+        return report
+
+    def save(self, csv_path):
+        """Write one row per file: dispatch order, estimated duration, start and end offsets"""
+        if self._first_start is None:
+            return
+        with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=['order', 'audio_file_path', 'estimated_duration_seconds',
+                                                   'start_seconds', 'end_seconds'])
+            writer.writeheader()
+            for order, audio_file in enumerate(self.files, 1):
+                started = self.started.get(audio_file)
+                ended = self.finished.get(audio_file)
+                writer.writerow({
+                    'order': order,
+                    'audio_file_path': str(audio_file),
+                    'estimated_duration_seconds': f"{self.estimates.get(audio_file, 0.0):.2f}",
+                    'start_seconds': f"{started - self._first_start:.3f}" if started else 'N/A',
+                    'end_seconds': f"{ended - self._first_start:.3f}" if ended else 'N/A'
+                })
@@ -0,0 +1,289 @@
+"""
+Silence-based segmentation of long recordings
+
+Long files (BNTTS recordings run to several minutes) used to go out as one
+upload and could run past API_TIMEOUT on the server. Files longer than
+SEGMENT_LONG_FILE_SECONDS are split into segments of at most
+SEGMENT_MAX_SECONDS, cut in the middle of pauses, and the segments are
+transcribed in parallel. Each segment has its own API_TIMEOUT, and the file
+is done roughly when its longest segment is.
+
+Pauses are found from the RMS level of 20 ms frames (NumPy): a frame is
+silent below SEGMENT_SILENCE_DB, or a few dB above the file's noise floor if
+that is higher. Within each window of half to full SEGMENT_MAX_SECONDS the
+longest pause wins; if the window has no pause at all, the quietest point is
+used instead (a "forced" cut, which may split a word).
+
+The segment results are stitched back into one `predicted_words` list with
+timestamps shifted by each segment's offset, so the JSON sidecar looks like
+a single response for the whole file.
+
+Only 8/16/32-bit PCM WAV files can be segmented; anything else is sent whole.
+"""
+
+import asyncio
+import io
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from clip_packer import read_wav_info, strip_edge_separators
+
+try:
+    from config import SEGMENT_LONG_FILE_SECONDS, SEGMENT_MAX_SECONDS, SEGMENT_PARALLEL
+except ImportError:
+    SEGMENT_LONG_FILE_SECONDS = 30
+    SEGMENT_MAX_SECONDS = 20
+    SEGMENT_PARALLEL = 4
+
+try:
+    from config import SEGMENT_SILENCE_DB, SEGMENT_MIN_SILENCE_MS
+except ImportError:
+    SEGMENT_SILENCE_DB = -35
+    SEGMENT_MIN_SILENCE_MS = 200
+
+try:
+    from config import TIMESTAMP_RATE
+except ImportError:
+    TIMESTAMP_RATE = 16000
+
+FRAME_MS = 20
+# Frames this far above the quietest 10% of the file still count as silence
+NOISE_FLOOR_MARGIN_DB = 6
+
+SAMPLE_TYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+
+class SegmentedFile:
+    """A long WAV file sent as several segments
+
+    Only the header is read when the file is planned; the audio is read and
+    cut in split(), right before the segments are sent.
+    """
+
+    def __init__(self, audio_file, params, duration):
+        self.audio_file = audio_file
+        self.params = params  # (nchannels, sampwidth, framerate)
+        self.duration = duration
+        self.segments = []  # (start seconds, end seconds), filled by split()
+        self.forced_cuts = 0
+
+    @property
+    def name(self):
+        return f"{self.audio_file.name} (segmented)"
+
+    @property
+    def files(self):
+        return [self.audio_file]
+
+    def __str__(self):
+        return str(self.audio_file)
+
+    def split(self, max_seconds=SEGMENT_MAX_SECONDS):
+        """Read the file, cut it at pauses and return one WAV file (bytes) per segment"""
+        nchannels, sampwidth, framerate = self.params
+        with wave.open(str(self.audio_file), 'rb') as w:
+            frames = w.readframes(w.getnframes())
+
+        levels = frame_levels(frames, self.params)
+        frame_len = max(1, int(framerate * FRAME_MS / 1000))
+        cuts, self.forced_cuts = find_cuts(levels, FRAME_MS / 1000, max_seconds)
+
+        block = nchannels * sampwidth
+        total = len(frames) // block
+        bounds = [0] + [cut * frame_len for cut in cuts] + [total]
+
+        self.segments = []
+        segment_bytes = []
+        for start, end in zip(bounds, bounds[1:]):
+            self.segments.append((start / framerate, end / framerate))
+            buffer = io.BytesIO()
+            with wave.open(buffer, 'wb') as out:
+                out.setnchannels(nchannels)
+                out.setsampwidth(sampwidth)
+                out.setframerate(framerate)
+                out.writeframes(frames[start * block:end * block])
+            segment_bytes.append(buffer.getvalue())
+        return segment_bytes
+
+
+def frame_levels(frames, params, frame_ms=FRAME_MS):
+    """RMS level in dBFS of each frame_ms frame, channels mixed down"""
+    nchannels, sampwidth, framerate = params
+    samples = np.frombuffer(frames, dtype=SAMPLE_TYPES[sampwidth]).astype(np.float64)
+    if sampwidth == 1:
+        samples -= 128  # 8-bit WAV is unsigned
+    samples /= float(2 ** (8 * sampwidth - 1))
+    samples = samples[:len(samples) // nchannels * nchannels].reshape(-1, nchannels).mean(axis=1)
+
+    frame_len = max(1, int(framerate * frame_ms / 1000))
+    count = len(samples) // frame_len
+    if count == 0:
+        return np.zeros(0)
+    framed = samples[:count * frame_len].reshape(count, frame_len)
+    rms = np.sqrt(np.mean(framed ** 2, axis=1))
+    return 20 * np.log10(rms + 1e-10)
+
+
+def find_cuts(levels, frame_seconds, max_seconds=SEGMENT_MAX_SECONDS,
+              silence_db=SEGMENT_SILENCE_DB, min_silence_ms=SEGMENT_MIN_SILENCE_MS):
+    """Frame indices to cut at so no segment is longer than max_seconds
+
+    Returns:
+        (list of cut frame indices, number of cuts made outside a pause)
+    """
+    count = len(levels)
+    max_frames = max(2, int(max_seconds / frame_seconds))
+    if count <= max_frames:
+        return [], 0
+
+    threshold = max(silence_db, np.percentile(levels, 10) + NOISE_FLOOR_MARGIN_DB)
+    min_frames = max(1, int(min_silence_ms / 1000 / frame_seconds))
+
+    # Runs of silent frames: starts/ends from the edges of the boolean mask
+    silent = np.concatenate(([False], levels < threshold, [False]))
+    edges = np.flatnonzero(np.diff(silent.astype(np.int8)))
+    starts, ends = edges[0::2], edges[1::2]
+    long_enough = ends - starts >= min_frames
+    starts, ends = starts[long_enough], ends[long_enough]
+    lengths = ends - starts
+    middles = (starts + ends) // 2
+
+    # Quietest point over a pause-sized window, for windows without a pause
+    smoothed = np.convolve(levels, np.ones(min_frames) / min_frames, mode='same')
+
+    cuts = []
+    forced = 0
+    segment_start = 0
+    while count - segment_start > max_frames:
+        low = segment_start + max_frames // 2
+        high = segment_start + max_frames
+        candidates = np.flatnonzero((middles > low) & (middles <= high))[::-1]
+        if len(candidates):
+            # Longest pause in the window, the later one on a tie
+            cut = int(middles[candidates[np.argmax(lengths[candidates])]])
+        else:
+            cut = low + 1 + int(np.argmin(smoothed[low + 1:high + 1]))
+            forced += 1
+        cuts.append(cut)
+        segment_start = cut
+    return cuts, forced
+
+
+def plan_segmentation(files, long_file_seconds=SEGMENT_LONG_FILE_SECONDS):
+    """Wrap WAV files longer than long_file_seconds in SegmentedFile
+
+    Returns:
+        (list with long files replaced by SegmentedFile, number of files wrapped)
+    """
+    items = []
+    wrapped = 0
+    for audio_file in files:
+        info = read_wav_info(audio_file)
+        if info is not None and info[1] > long_file_seconds and info[0][1] in SAMPLE_TYPES:
+            items.append(SegmentedFile(audio_file, info[0], info[1]))
+            wrapped += 1
+        else:
+            items.append(audio_file)
+    return items, wrapped
+
+
+def stitch_words(segmented, segment_words, rate=TIMESTAMP_RATE):
+    """Join per-segment predicted_words into one list with file-relative timestamps"""
+    words = []
+    for (start, _), words_in_segment in zip(segmented.segments, segment_words):
+        offset = int(round(start * rate))
+        shifted = []
+        for word in words_in_segment:
+            word = dict(word)
+            if word.get('timestamp'):
+                word['timestamp'] = [word['timestamp'][0] + offset, word['timestamp'][1] + offset]
+            shifted.append(word)
+        strip_edge_separators(shifted)
+        if not shifted:
+            continue
+        if words:
+            # Segments were cut inside a pause, so there is a word break at every cut
+            gap = [words[-1].get('timestamp', [offset])[-1], shifted[0].get('timestamp', [offset])[0]]
+            words.append({'word': ' ', 'timestamp': gap})
+        words.extend(shifted)
+    return words
+
+
+def stitch_results(segmented, results, started):
+    """Combine per-segment result dicts into one result for the whole file
+
+    The file fails if any segment failed. api_response_time runs from the
+    first segment being sent to the last result arriving. Phase durations are
+    summed over segments, except server_wait, which is the longest segment's
+    (segments wait in parallel); the read phase includes silence detection.
+    """
+    elapsed = time.time() - started
+    result = {
+        'success': False,
+        'data': None,
+        'error': None,
+        'api_response_time': None,
+        'reused_connection': all(r.get('reused_connection') for r in results),
+        'bytes_sent': sum(r.get('bytes_sent', 0) for r in results),
+        'phases': {},
+        'timings': {'start_time': started, 'total_time': elapsed},
+        'audio_duration': segmented.duration
+    }
+    for name in ['read', 'encode', 'connect', 'emit']:
+        result['phases'][name] = sum(r['phases'].get(name) or 0.0 for r in results)
+    waits = [r['phases']['server_wait'] for r in results if r['phases'].get('server_wait') is not None]
+    result['phases']['server_wait'] = max(waits) if waits else None
+
+    for index, r in enumerate(results, 1):
+        if not (r['success'] and r['data']):
+            result['error'] = f"segment {index}/{len(results)}: {r.get('error') or 'Unknown error'}"
+            return result
+
+    segment_words = [r['data'].get('output', {}).get('predicted_words', []) for r in results]
+    result['success'] = True
+    result['api_response_time'] = (max(r['timings']['response_time'] for r in results)
+                                   - min(r['timings']['send_time'] for r in results))
+    result['data'] = {
+        'index': results[0]['data'].get('index', '0'),
+        'output': {'predicted_words': stitch_words(segmented, segment_words)},
+        'segmentation': {
+            'segments': len(segmented.segments),
+            'offsets_seconds': [round(start, 3) for start, _ in segmented.segments],
+            'longest_segment_seconds': round(max(end - start for start, end in segmented.segments), 3),
+            'forced_cuts': segmented.forced_cuts
+        }
+    }
+    return result
+
+
+def transcribe_segmented(segmented, client, parallel=SEGMENT_PARALLEL):
+    """Split a SegmentedFile and send its segments over an STTClient, `parallel` at a time
+
+    The client needs pool_size >= parallel for the segments to actually overlap.
+    """
+    started = time.time()
+    segment_bytes = segmented.split()
+    split_seconds = time.time() - started
+
+    with ThreadPoolExecutor(max_workers=max(1, min(parallel, len(segment_bytes)))) as executor:
+        results = list(executor.map(client.transcribe_data, segment_bytes))
+    results[0]['phases']['read'] += split_seconds
+    return stitch_results(segmented, results, started)
+
+
+async def transcribe_segmented_async(segmented, client):
+    """Split a SegmentedFile and send all its segments over an AsyncSTTClient at once
+
+    The client's pool bounds how many are actually in flight.
+    """
+    started = time.time()
+    loop = asyncio.get_running_loop()
+    segment_bytes = await loop.run_in_executor(None, segmented.split)
+    split_seconds = time.time() - started
+
+    results = await asyncio.gather(*(client.transcribe_data(data) for data in segment_bytes))
+    results[0]['phases']['read'] += split_seconds
+    return stitch_results(segmented, list(results), started)
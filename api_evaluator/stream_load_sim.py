@@ -0,0 +1,330 @@
+"""
+Multi-user real-time streaming load simulator
+
+Opens N concurrent `audio_transmit` sessions, each paced at true real time
+(a chunk covering X ms of audio is sent every X ms), from a pool of WAV
+files. N is ramped up step by step; for every step the simulator reports
+partial-result latency percentiles, dropped sessions and whether the
+real-time lag (how far results trail the audio that has been sent) keeps
+growing during a session - the sign that the server can no longer keep up.
+
+Usage:
+    python stream_load_sim.py --audio-dir ./test_audio
+    python stream_load_sim.py --audio-dir ./test_audio --start 2 --step 2 --max 20
+    python stream_load_sim.py --audio-dir ./test_audio --url http://localhost:9394  # local stand-in server
+"""
+
+import argparse
+import asyncio
+import base64
+import csv
+import json
+import time
+import wave
+from pathlib import Path
+
+import socketio
+
+from rate_controller import percentile
+
+try:
+    from config import SOCKET_URL, API_TIMEOUT
+except ImportError:
+    SOCKET_URL = "https://voice.bangla.gov.bd:9394"
+    API_TIMEOUT = 120
+
+# Audio covered by one audio_transmit chunk
+CHUNK_MS = 250
+
+# A session whose lag grew by more than this (seconds) is falling behind real time
+LAG_GROWTH_THRESHOLD = 0.5
+
+
+def load_wav_pool(audio_dir, limit=50):
+    """Read up to `limit` WAV files into memory with their byte rate
+
+    Returns a list of dicts with 'path', 'data', 'bytes_per_second' and 'duration'.
+    """
+    pool = []
+    for wav_path in sorted(Path(audio_dir).rglob('*.wav'))[:limit]:
+        try:
+            with wave.open(str(wav_path), 'rb') as w:
+                bytes_per_second = w.getframerate() * w.getnchannels() * w.getsampwidth()
+                duration = w.getnframes() / float(w.getframerate())
+        except (wave.Error, EOFError) as e:
+            print(f"  Skipping {wav_path.name}: {e}")
+            continue
+        pool.append({
+            'path': str(wav_path),
+            'data': wav_path.read_bytes(),
+            'bytes_per_second': bytes_per_second,
+            'duration': duration
+        })
+    return pool
+
+
+class StreamSession:
+    """One simulated live user streaming files back to back over its own connection"""
+
+    def __init__(self, session_id, url, pool, chunk_ms, timeout):
+        self.session_id = session_id
+        self.url = url
+        self.pool = pool
+        self.chunk_ms = chunk_ms
+        self.timeout = timeout
+
+        self.latencies = []        # seconds from chunk sent to its result
+        self.lags = []             # (wall-clock send time, lag behind real time) per result
+        self.streams_completed = 0
+        self.dropped = False
+        self.drop_reason = None
+        self.max_send_delay = 0.0  # how late the sender itself was against the schedule
+
+        self._sent_at = {}
+        self._due = {}
+        self._answered = set()     # chunk indices of the current file that have a result
+        self._stale = set()        # indices of the previous file still unanswered when it ended
+        self._results_seen = 0
+        self._last_index = None
+        self._final = None
+        self._stream_start = None
+
+        self.sio = socketio.AsyncClient(ssl_verify=False, reconnection=False)
+        self.sio.on('result', self._on_result)
+        self.sio.on('disconnect', self._on_disconnect)
+
+    async def _on_result(self, data):
+        received = time.time()
+        index = data.get('index') if isinstance(data, dict) else None
+        try:
+            index = int(index)
+        except (TypeError, ValueError):
+            # No usable index: assume results arrive in chunk order
+            index = self._results_seen
+        self._results_seen += 1
+
+        if index in self._stale:
+            # Late result for the previous file (indices restart at 0 for every file)
+            self._stale.discard(index)
+            return
+        sent = self._sent_at.get(index)
+        if sent is not None and index not in self._answered:
+            self._answered.add(index)
+            self.latencies.append(received - sent)
+            # Lag: how far behind the real-time schedule for this chunk its result arrived
+            lag = received - (self._stream_start + self._due[index])
+            self.lags.append((sent, lag))
+
+        is_last = isinstance(data, dict) and data.get('endOfStream')
+        if (is_last or index == self._last_index) and self._final and not self._final.done():
+            self._final.set_result(True)
+
+    async def _on_disconnect(self):
+        if self._final and not self._final.done():
+            self._final.set_result(False)
+
+    async def stream_file(self, entry):
+        """Send one file at real-time pace and wait for its last result"""
+        data = entry['data']
+        chunk_size = max(1, int(entry['bytes_per_second'] * self.chunk_ms / 1000))
+        chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+        self._stale = set(self._sent_at) - self._answered
+        self._sent_at = {}
+        self._due = {}
+        self._answered = set()
+        self._results_seen = 0
+        self._last_index = len(chunks) - 1
+        self._final = asyncio.get_running_loop().create_future()
+        self._stream_start = time.time()
+
+        for i, chunk in enumerate(chunks):
+            # Absolute schedule, so small sleep overruns do not accumulate
+            self._due[i] = i * self.chunk_ms / 1000
+            delay = self._stream_start + self._due[i] - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                self.max_send_delay = max(self.max_send_delay, -delay)
+
+            self._sent_at[i] = time.time()
+            await self.sio.emit("audio_transmit", {
+                "index": i,
+                "audio": base64.b64encode(chunk).decode('utf-8'),
+                "endOfStream": i == len(chunks) - 1
+            })
+
+        try:
+            ok = await asyncio.wait_for(self._final, self.timeout)
+        except asyncio.TimeoutError:
+            ok = False
+            self.drop_reason = "timeout waiting for final result"
+        if not ok and not self.drop_reason:
+            self.drop_reason = "disconnected mid-stream"
+        return ok
+
+    async def run(self, deadline):
+        """Stream files until the step deadline passes (the current file is always finished)"""
+        try:
+            await self.sio.connect(self.url, transports=["websocket"])
+        except Exception as e:
+            self.dropped = True
+            self.drop_reason = f"connect failed: {e}"
+            return
+
+        file_index = self.session_id
+        try:
+            while time.time() < deadline:
+                entry = self.pool[file_index % len(self.pool)]
+                file_index += 1
+                if not await self.stream_file(entry):
+                    self.dropped = True
+                    return
+                self.streams_completed += 1
+        except Exception as e:
+            self.dropped = True
+            self.drop_reason = str(e)
+        finally:
+            if self.sio.connected:
+                await self.sio.disconnect()
+
+    def lag_growth(self):
+        """Mean lag in the last third of the session minus mean lag in the first third
+
+        Samples are ordered by wall-clock send time, so a session streaming
+        several files is measured over its whole duration, file after file.
+        """
+        if len(self.lags) < 3:
+            return None
+        lags = [lag for _, lag in sorted(self.lags)]
+        third = len(lags) // 3
+        first = sum(lags[:third]) / third
+        last = sum(lags[-third:]) / third
+        return last - first
+
+
+async def run_step(num_sessions, url, pool, chunk_ms, step_duration, timeout):
+    """Run one ramp step with num_sessions concurrent users"""
+    deadline = time.time() + step_duration
+    sessions = [StreamSession(i, url, pool, chunk_ms, timeout) for i in range(num_sessions)]
+    started = time.time()
+    await asyncio.gather(*(s.run(deadline) for s in sessions))
+    elapsed = time.time() - started
+
+    latencies = [lat for s in sessions for lat in s.latencies]
+    growths = [g for g in (s.lag_growth() for s in sessions) if g is not None]
+    max_lags = [max(lag for _, lag in s.lags) for s in sessions if s.lags]
+    dropped = [s for s in sessions if s.dropped]
+
+    return {
+        'sessions': num_sessions,
+        'elapsed_seconds': round(elapsed, 2),
+        'streams_completed': sum(s.streams_completed for s in sessions),
+        'dropped_sessions': len(dropped),
+        'drop_reasons': sorted({s.drop_reason for s in dropped if s.drop_reason}),
+        'partial_results': len(latencies),
+        'latency_p50': percentile(latencies, 50),
+        'latency_p90': percentile(latencies, 90),
+        'latency_p99': percentile(latencies, 99),
+        'lag_growth_median': percentile(growths, 50),
+        'max_lag': max(max_lags) if max_lags else None,
+        'max_send_delay': max(s.max_send_delay for s in sessions),
+    }
+
+
+def format_seconds(value):
+    return f"{value:.2f}" if value is not None else "-"
+
+
+def print_step_table(steps):
+    print(f"{'users':>6} {'streams':>8} {'dropped':>8} {'p50':>7} {'p90':>7} {'p99':>7} "
+          f"{'lag+':>7} {'maxlag':>7}  status")
+    print("-" * 80)
+    for step in steps:
+        print(f"{step['sessions']:>6} {step['streams_completed']:>8} {step['dropped_sessions']:>8} "
+              f"{format_seconds(step['latency_p50']):>7} {format_seconds(step['latency_p90']):>7} "
+              f"{format_seconds(step['latency_p99']):>7} {format_seconds(step['lag_growth_median']):>7} "
+              f"{format_seconds(step['max_lag']):>7}  {step['status']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Real-time streaming load simulator for the STT API")
+    parser.add_argument('--audio-dir', required=True, help="Directory with WAV files to stream")
+    parser.add_argument('--url', default=SOCKET_URL, help=f"Socket.IO endpoint (default: {SOCKET_URL})")
+    parser.add_argument('--start', type=int, default=1, help="Concurrent users in the first step")
+    parser.add_argument('--step', type=int, default=1, help="Users added per step")
+    parser.add_argument('--max', type=int, default=10, help="Maximum concurrent users")
+    parser.add_argument('--step-duration', type=float, default=60, help="Seconds per step")
+    parser.add_argument('--chunk-ms', type=int, default=CHUNK_MS, help="Audio per chunk in milliseconds")
+    parser.add_argument('--max-drop-rate', type=float, default=0.2,
+                        help="Stop ramping once this fraction of sessions drops")
+    parser.add_argument('--report', default='stream_load_report',
+                        help="Report path prefix (.json and .csv are written)")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("STT STREAMING LOAD SIMULATOR")
+    print("=" * 80)
+    print(f"API endpoint: {args.url}")
+    print(f"Users: {args.start} -> {args.max} (+{args.step} per step, {args.step_duration:.0f}s each)")
+    print(f"Chunk size: {args.chunk_ms} ms of audio, sent at real-time pace")
+
+    pool = load_wav_pool(args.audio_dir)
+    if not pool:
+        print(f"ERROR: No WAV files found in {args.audio_dir}")
+        return
+    print(f"WAV pool: {len(pool)} files, {sum(e['duration'] for e in pool):.1f}s of audio")
+    print("=" * 80)
+
+    steps = []
+    lag_onset = None
+    for num_sessions in range(args.start, args.max + 1, args.step):
+        print(f"\nStep: {num_sessions} concurrent users...")
+        step = asyncio.run(run_step(num_sessions, args.url, pool, args.chunk_ms,
+                                    args.step_duration, API_TIMEOUT))
+
+        lagging = step['lag_growth_median'] is not None and step['lag_growth_median'] > LAG_GROWTH_THRESHOLD
+        drop_rate = step['dropped_sessions'] / num_sessions
+        if drop_rate > args.max_drop_rate:
+            step['status'] = "overloaded"
+        elif lagging:
+            step['status'] = "falling behind"
+        else:
+            step['status'] = "ok"
+        if lagging and lag_onset is None:
+            lag_onset = num_sessions
+
+        steps.append(step)
+        print(f"  p50 {format_seconds(step['latency_p50'])}s, p99 {format_seconds(step['latency_p99'])}s, "
+              f"dropped {step['dropped_sessions']}/{num_sessions}, status: {step['status']}")
+
+        if step['status'] == "overloaded":
+            print("  Drop rate above limit, stopping ramp")
+            break
+
+    print("\n" + "=" * 80)
+    print("RESULTS (latency = chunk sent -> its partial result; lag+ = lag growth within a session)")
+    print("=" * 80)
+    print_step_table(steps)
+    print("-" * 80)
+    healthy = [s['sessions'] for s in steps if s['status'] == 'ok']
+    print(f"Highest healthy concurrency: {max(healthy) if healthy else 'none'}")
+    print(f"Real-time lag starts to grow at: {lag_onset if lag_onset else 'not reached'}")
+
+    with open(f"{args.report}.json", 'w', encoding='utf-8') as f:
+        json.dump({'url': args.url, 'chunk_ms': args.chunk_ms, 'lag_onset': lag_onset, 'steps': steps},
+                  f, ensure_ascii=False, indent=2)
+    with open(f"{args.report}.csv", 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=[k for k in steps[0].keys() if k != 'drop_reasons'],
+                                extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(steps)
+    print(f"\nReport saved to: {args.report}.json, {args.report}.csv")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\nSimulation interrupted by user")
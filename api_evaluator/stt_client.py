@@ -0,0 +1,854 @@
+"""
+Shared Socket.IO client for the STT API
+
+Keeps a pool of long-lived connections to the STT server so that every
+transcription request does not pay for a fresh TLS + websocket handshake.
+Connections are health-checked before reuse and re-established when they
+drop. Used by batch_transcribe.py, batch_transcribe_v2.py,
+test_single_transcribe.py and the latency test scripts.
+
+AsyncSTTClient is the asyncio variant used for concurrent batch runs: it
+keeps one request in flight per pooled connection.
+
+Usage:
+    from stt_client import STTClient
+
+    client = STTClient()
+    result = client.transcribe("/path/to/audio.wav")
+    client.print_stats()
+    client.close()
+"""
+
+import asyncio
+import base64
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import nullcontext
+
+import socketio
+
+# Import configuration
+try:
+    from config import SOCKET_URL, API_TIMEOUT
+except ImportError:
+    SOCKET_URL = "https://voice.bangla.gov.bd:9394"
+    API_TIMEOUT = 120
+
+try:
+    from config import POOL_SIZE, HEALTH_CHECK_INTERVAL
+except ImportError:
+    POOL_SIZE = 1
+    HEALTH_CHECK_INTERVAL = 30
+
+try:
+    from config import STREAM_CHUNK_SIZE, STREAM_IDLE_TIMEOUT
+except ImportError:
+    STREAM_CHUNK_SIZE = 32000
+    STREAM_IDLE_TIMEOUT = 3
+
+
+def new_result():
+    """Empty result dict in the layout every transcriber expects"""
+    return {
+        'success': False,
+        'data': None,
+        'error': None,
+        'api_response_time': None,
+        'reused_connection': False,
+        'bytes_sent': 0,
+        # Seconds spent in each step of the request, for per-request tracing
+        'phases': {
+            'read': 0.0,
+            'encode': 0.0,
+            'connect': 0.0,
+            'emit': 0.0,
+            'server_wait': None
+        },
+        'timings': {
+            'start_time': time.time(),
+            'connect_time': None,
+            'send_time': None,
+            'response_time': None,
+            'total_time': None
+        }
+    }
+
+
+def build_upload_payload(audio_path, phases=None):
+    """Read and base64-encode an audio file into an audio_transmit_upload payload
+
+    If a phases dict is given, the read and encode durations are added to it.
+    """
+    start = time.time()
+    with open(audio_path, 'rb') as f:
+        audio_data = f.read()
+    if phases is not None:
+        phases['read'] += time.time() - start
+    return encode_upload_payload(audio_data, phases)
+
+
+def encode_upload_payload(audio_data, phases=None):
+    """Base64-encode audio bytes already in memory into an audio_transmit_upload payload"""
+    start = time.time()
+    audio = base64.b64encode(audio_data).decode('utf-8')
+    if phases is not None:
+        phases['encode'] += time.time() - start
+
+    return {
+        "index": 0,
+        "audio": audio,
+        "endOfStream": True
+    }
+
+
+def iter_stream_payloads(audio_path, chunk_size=STREAM_CHUNK_SIZE, phases=None):
+    """Yield audio_transmit payloads as the file is read, one chunk at a time
+
+    A chunk is only read (and base64-encoded) right before it is sent, so
+    the first chunk goes out without waiting for the rest of the file.
+    If a phases dict is given, read and encode durations are added to it.
+    """
+    if phases is None:
+        phases = {'read': 0.0, 'encode': 0.0}
+
+    with open(audio_path, 'rb') as f:
+        index = 0
+        start = time.time()
+        chunk = f.read(chunk_size)
+        while chunk:
+            next_chunk = f.read(chunk_size)
+            read_done = time.time()
+            audio = base64.b64encode(chunk).decode('utf-8')
+            phases['read'] += read_done - start
+            phases['encode'] += time.time() - read_done
+            yield {
+                "index": index,
+                "audio": audio,
+                "endOfStream": not next_chunk
+            }
+            start = time.time()
+            index += 1
+            chunk = next_chunk
+
+
+class StreamCollector:
+    """Merges the `result` events of one audio_transmit stream into upload layout
+
+    A new event replaces any collected words that start at or after its first
+    word's timestamp, so both incremental and cumulative partial results end
+    up as one `predicted_words` list without duplicates. The stream counts as
+    finished when an event echoes the endOfStream chunk (via its `endOfStream`
+    flag or `index`); otherwise the caller finishes it after
+    STREAM_IDLE_TIMEOUT seconds without new events.
+    """
+
+    def __init__(self, result):
+        self.result = result
+        self.events = 0
+        self.words = []
+        self.index = None
+        self.last_index = None
+        self.final_seen = False
+        self.last_event_time = None
+
+    def add(self, data, received_time):
+        timings = self.result['timings']
+        if timings['first_result_time'] is None:
+            timings['first_result_time'] = received_time
+        timings['response_time'] = received_time
+        self.last_event_time = received_time
+        self.events += 1
+
+        if isinstance(data, dict):
+            self.index = data.get('index', self.index)
+            words = (data.get('output') or {}).get('predicted_words') or []
+            if words and 'timestamp' in words[0]:
+                start = words[0]['timestamp'][0]
+                self.words = [w for w in self.words if w.get('timestamp', [0])[0] < start]
+            self.words.extend(words)
+
+            if data.get('endOfStream'):
+                self.final_seen = True
+            elif self.last_index is not None and str(data.get('index')) == str(self.last_index):
+                self.final_seen = True
+
+    def is_complete(self):
+        return self.final_seen
+
+    def finish(self):
+        """Fill the result dict with the merged transcript and stream timings"""
+        result = self.result
+        timings = result['timings']
+        result['data'] = {
+            'index': self.index if self.index is not None else "0",
+            'output': {'predicted_words': self.words}
+        }
+        result['success'] = True
+        result['stream_events'] = self.events
+        result['time_to_first_result'] = timings['first_result_time'] - timings['send_time']
+        result['time_to_final_result'] = timings['response_time'] - timings['send_time']
+        result['api_response_time'] = result['time_to_final_result']
+
+
+class _PooledConnectionBase:
+    """Request state and Socket.IO event handlers shared by the sync and async connections
+
+    The handlers are plain functions: the sync client runs them on its reader
+    thread, so they take self.lock; the async client runs them on the event
+    loop, where the lock is a no-op. `future` is a concurrent.futures.Future
+    or an asyncio.Future, which complete the same way.
+    """
+
+    def __init__(self, url, sio, lock, verbose=True, event_hook=None):
+        self.url = url
+        self.verbose = verbose
+        self.event_hook = event_hook
+        self.pending = None
+        self.future = None
+        self.stream = None
+        self.lock = lock
+        self.last_used = 0.0
+        self.handshake_times = []
+
+        # Reconnection is handled by the pool, not by python-socketio
+        self.sio = sio
+        self.sio.on('connect', self._on_connect)
+        self.sio.on('disconnect', self._on_disconnect)
+        self.sio.on('connect_error', self._on_connect_error)
+        self.sio.on('error', self._on_error)
+        self.sio.on('result_upload', self._on_result_upload)
+        self.sio.on('result', self._on_result)
+
+    def _log(self, event, message):
+        if self.verbose:
+            print(f"  {message}")
+        if self.event_hook:
+            self.event_hook(event, message)
+
+    def _on_connect(self):
+        self._log('connect', "Connected to STT server")
+
+    def _fail_pending(self, error):
+        with self.lock:
+            if self.pending is not None and not self.future.done():
+                self.pending['error'] = error
+                self.future.set_result(False)
+
+    def _on_disconnect(self):
+        self._log('disconnect', "Disconnected from server")
+        self._fail_pending("Disconnected before result was received")
+
+    def _on_connect_error(self, error):
+        self._log('connect_error', f"Connection error: {error}")
+        self._fail_pending(f"Connection error: {error}")
+
+    def _on_error(self, error):
+        self._log('error', f"Socket error: {error}")
+        self._fail_pending(f"Socket error: {error}")
+
+    def _on_result_upload(self, data):
+        received_time = time.time()
+        with self.lock:
+            result = self.pending
+            if result is None or self.future.done():
+                # Late answer to a request that already timed out
+                self._log('result_upload', "Ignoring result with no pending request")
+                return
+            result['timings']['response_time'] = received_time
+            result['api_response_time'] = received_time - result['timings']['send_time']
+            result['data'] = data
+            result['success'] = True
+            self._log('result_upload', f"Received transcription result (API took {result['api_response_time']:.2f}s)")
+            # Wakes the waiting request immediately
+            self.future.set_result(True)
+
+    def _on_result(self, data):
+        received_time = time.time()
+        with self.lock:
+            if self.stream is None or self.future.done():
+                self._log('result', "Ignoring streaming result with no pending stream")
+                return
+            self.stream.add(data, received_time)
+            if self.stream.is_complete():
+                self.stream.finish()
+                self._log('result', f"Received final streaming result ({self.stream.events} events)")
+                self.future.set_result(True)
+
+    @property
+    def connected(self):
+        return self.sio.connected
+
+    def is_healthy(self):
+        """Check that both the Socket.IO and the underlying Engine.IO session are alive"""
+        if not self.sio.connected:
+            return False
+        return getattr(self.sio.eio, 'state', 'connected') == 'connected'
+
+    def _transport_open(self):
+        """The server closed the Socket.IO session but left the transport open;
+        it has to be closed too before connect() can be called again"""
+        return not self.sio.connected and getattr(self.sio.eio, 'state', 'disconnected') != 'disconnected'
+
+    def _handshake_done(self, start):
+        elapsed = time.time() - start
+        self.handshake_times.append(elapsed)
+        self.last_used = time.time()
+        return elapsed
+
+    def begin_request(self, result, future, stream=None):
+        """Make result the request pending on this connection"""
+        with self.lock:
+            result['error'] = None
+            if stream is not None:
+                result['timings']['first_result_time'] = None
+            self.pending = result
+            self.stream = stream
+            self.future = future
+
+    def end_request(self):
+        """Forget the pending request once the pool takes the connection back"""
+        with self.lock:
+            self.pending = None
+            self.future = None
+            self.stream = None
+        self.last_used = time.time()
+
+    def stream_sent(self, chunks):
+        """Record the number of chunks sent; False if there was nothing to send"""
+        result = self.pending
+        result['timings']['last_emit_time'] = time.time()
+        result['stream_chunks'] = chunks
+        if chunks == 0:
+            result['error'] = "Empty audio file"
+            return False
+
+        with self.lock:
+            collector = self.stream
+            collector.last_index = chunks - 1
+            # The final event may have arrived while we were still sending
+            if str(collector.index) == str(collector.last_index) and not self.future.done():
+                collector.final_seen = True
+                collector.finish()
+                self.future.set_result(True)
+        return True
+
+    def check_stream(self, deadline):
+        """Finish a stream the server has gone quiet on, or time it out
+
+        Returns True if the stream timed out and the connection must be dropped.
+        """
+        with self.lock:
+            if self.future.done():
+                return False
+            collector = self.stream
+            now = time.time()
+            if collector.events and now - collector.last_event_time >= STREAM_IDLE_TIMEOUT:
+                # No end-of-stream marker, but the server has gone quiet
+                collector.finish()
+                self.future.set_result(True)
+                return False
+            timed_out = now > deadline and self.future.cancel()
+            if timed_out:
+                self.pending['error'] = "Timeout waiting for response"
+            return timed_out
+
+
+def record_upload_emit(result, payload):
+    """Emit time and bytes of an audio_transmit_upload sent at timings['send_time']"""
+    result['timings']['last_emit_time'] = time.time()
+    result['phases']['emit'] += result['timings']['last_emit_time'] - result['timings']['send_time']
+    result['bytes_sent'] += len(payload['audio'])
+
+
+class PooledConnection(_PooledConnectionBase):
+    """A single long-lived Socket.IO connection with at most one request in flight"""
+
+    def __init__(self, url, verbose=True, event_hook=None):
+        super().__init__(url, socketio.Client(ssl_verify=False, reconnection=False), threading.Lock(),
+                         verbose, event_hook)
+
+    def connect(self):
+        """Perform the TLS + websocket handshake and record how long it took"""
+        self._log('connecting', "Connecting to API...")
+        start = time.time()
+        self.sio.connect(self.url, transports=["websocket"])
+        return self._handshake_done(start)
+
+    def disconnect(self):
+        if self.sio.connected:
+            self.sio.disconnect()
+        elif self._transport_open():
+            self.sio.eio.disconnect(abort=True)
+
+
+def combine_pool_stats(stats_list):
+    """Sum the stats dicts of several clients, e.g. one per worker process"""
+    combined = {}
+    for stats in stats_list:
+        for key, value in stats.items():
+            combined[key] = combined.get(key, 0) + value
+    return combined
+
+
+def print_pool_stats(stats):
+    """Print connection reuse counters and the handshake time they saved"""
+    handshakes = stats.get('handshakes', 0)
+    avg_handshake = stats.get('handshake_seconds', 0.0) / handshakes if handshakes else 0.0
+    saved = avg_handshake * stats.get('reused', 0)
+    print(f"Requests sent: {stats.get('requests', 0)}")
+    print(f"Connections opened: {handshakes} "
+          f"(reconnects: {stats.get('reconnects', 0)}, failed health checks: {stats.get('health_check_failures', 0)})")
+    print(f"Requests on reused connections: {stats.get('reused', 0)}")
+    print(f"Average handshake time: {avg_handshake:.2f}s")
+    print(f"Handshake time saved: {saved:.1f}s")
+
+
+class _PoolBase:
+    """Settings, reuse counters and request bookkeeping shared by the sync and async clients
+
+    The clients only differ in how they wait: acquiring a connection,
+    connecting, emitting and waiting for the result are done by the
+    subclass, everything around that is here.
+    """
+
+    def __init__(self, url=SOCKET_URL, pool_size=POOL_SIZE, timeout=API_TIMEOUT,
+                 max_retries=1, verbose=True, event_hook=None):
+        self.url = url
+        self.pool_size = max(1, pool_size)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.verbose = verbose
+        self.event_hook = event_hook
+        self._all = []
+
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'requests': 0,
+            'reused': 0,
+            'handshakes': 0,
+            'handshake_seconds': 0.0,
+            'reconnects': 0,
+            'health_check_failures': 0,
+        }
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def _new_connection(self, connection_class):
+        conn = connection_class(self.url, verbose=self.verbose, event_hook=self.event_hook)
+        self._all.append(conn)
+        return conn
+
+    def _needs_handshake(self, conn):
+        """False if conn can be reused as is; a connection that fails the check must be dropped first"""
+        if not conn.handshake_times:
+            return True
+        idle_for = time.time() - conn.last_used
+        if conn.is_healthy() and idle_for < HEALTH_CHECK_INTERVAL:
+            return False
+        # Dead, or idle long enough that a proxy may have silently dropped it
+        self._count('health_check_failures')
+        self._count('reconnects')
+        return True
+
+    def _connected(self, result, handshake):
+        """Account for the handshake (0.0 = reused connection) before the request is sent"""
+        if handshake:
+            self._count('handshakes')
+            self._count('handshake_seconds', handshake)
+        result['reused_connection'] = handshake == 0.0
+        result['phases']['connect'] += handshake
+        if result['reused_connection']:
+            self._count('reused')
+        result['timings']['connect_time'] = time.time()
+
+    def _retry(self, result, attempts):
+        """Whether a failed attempt is sent again on a fresh connection"""
+        if result['success'] or attempts > self.max_retries:
+            return False
+        if result['error'] and result['error'].startswith('Timeout'):
+            # The server is slow, not the connection; do not resend
+            return False
+
+        # Connection failed mid-request: reconnect and try again
+        if self.verbose:
+            print(f"  Retrying after connection failure: {result['error']}")
+        result['error'] = None
+        return True
+
+    @staticmethod
+    def _finish(result):
+        if result['timings']['response_time']:
+            result['timings']['total_time'] = result['timings']['response_time'] - result['timings']['start_time']
+            if result['timings'].get('last_emit_time'):
+                result['phases']['server_wait'] = result['timings']['response_time'] - result['timings']['last_emit_time']
+        return result
+
+    def handshake_savings(self):
+        """Estimate the handshake time saved by reusing connections"""
+        handshakes = self.stats['handshakes']
+        if handshakes == 0:
+            return 0.0, 0.0
+        avg_handshake = self.stats['handshake_seconds'] / handshakes
+        return avg_handshake, avg_handshake * self.stats['reused']
+
+    def print_stats(self):
+        print_pool_stats(self.stats)
+
+
+class STTClient(_PoolBase):
+    """Pool of persistent connections to the STT server
+
+    Args:
+        url: Socket.IO endpoint of the STT server
+        pool_size: Maximum number of connections kept open
+        timeout: Seconds to wait for a transcription result
+        max_retries: Reconnect-and-resend attempts when a connection fails mid-request
+        verbose: Print connection events and progress messages
+        event_hook: Optional callable(event, message) receiving every connection event
+    """
+
+    def __init__(self, url=SOCKET_URL, pool_size=POOL_SIZE, timeout=API_TIMEOUT,
+                 max_retries=1, verbose=True, event_hook=None):
+        super().__init__(url, pool_size, timeout, max_retries, verbose, event_hook)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+    # ---------- pool management ----------
+
+    def _acquire(self):
+        """Take an idle connection, or open a new one while below pool_size"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if len(self._all) < self.pool_size:
+                return self._new_connection(PooledConnection)
+
+        return self._idle.get()
+
+    def _release(self, conn):
+        self._idle.put(conn)
+
+    def _ensure_connected(self, conn):
+        """Health-check a connection and (re)connect it if needed
+
+        Returns the handshake duration, or 0.0 if an existing connection was reused.
+        """
+        if not self._needs_handshake(conn):
+            return 0.0
+        if conn.handshake_times:
+            self._drop(conn)
+        return conn.connect()
+
+    def _drop(self, conn):
+        """Close a connection whose state can no longer be trusted"""
+        try:
+            conn.disconnect()
+        except Exception:
+            pass
+
+    # ---------- requests ----------
+
+    def transcribe(self, audio_path):
+        """Transcribe a single audio file using the STT API
+
+        Returns the same result dict the batch scripts have always used
+        ('success', 'data', 'error', 'api_response_time'), plus 'timings'
+        and 'reused_connection'.
+        """
+        result = new_result()
+
+        try:
+            payload = build_upload_payload(audio_path, result['phases'])
+        except Exception as e:
+            result['error'] = str(e)
+            return result
+
+        return self._run_request(result, lambda conn: self._send_and_wait(conn, payload, result))
+
+    def transcribe_data(self, audio_data):
+        """Transcribe audio bytes built in memory (e.g. several packed clips)"""
+        result = new_result()
+        payload = encode_upload_payload(audio_data, result['phases'])
+        return self._run_request(result, lambda conn: self._send_and_wait(conn, payload, result))
+
+    def transcribe_stream(self, audio_path, chunk_size=STREAM_CHUNK_SIZE):
+        """Transcribe a file through the streaming `audio_transmit` event
+
+        Chunks are sent as soon as they are read, without pacing. The `result`
+        events are merged into the upload JSON layout. The result dict also
+        gets 'time_to_first_result' and 'time_to_final_result' (seconds from
+        the first chunk being sent); 'api_response_time' is the latter.
+        """
+        result = new_result()
+        result['timings']['first_result_time'] = None
+
+        if not os.path.exists(audio_path):
+            result['error'] = f"File not found: {audio_path}"
+            return result
+
+        return self._run_request(result, lambda conn: self._stream_and_wait(conn, audio_path, chunk_size, result))
+
+    def _run_request(self, result, send):
+        """Run send(conn) on a pooled connection, reconnecting and retrying on failure"""
+        self._count('requests')
+        attempts = 0
+
+        while True:
+            attempts += 1
+            conn = self._acquire()
+            try:
+                self._connected(result, self._ensure_connected(conn))
+                send(conn)
+            except Exception as e:
+                result['error'] = str(e)
+                self._drop(conn)
+            finally:
+                conn.end_request()
+                self._release(conn)
+
+            if not self._retry(result, attempts):
+                return self._finish(result)
+
+    def _send_and_wait(self, conn, payload, result):
+        """Emit the payload on a connection and block until its result_upload
+
+        The event handler completes a per-request Future, so the result is
+        handed back the moment it arrives instead of on the next poll tick.
+        """
+        conn.begin_request(result, Future())
+
+        if self.verbose:
+            print(f"  Sending audio data...")
+        result['timings']['send_time'] = time.time()
+        conn.sio.emit("audio_transmit_upload", payload)
+        record_upload_emit(result, payload)
+
+        try:
+            conn.future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            with conn.lock:
+                # cancel() fails if the result landed just after the timeout
+                timed_out = conn.future.cancel()
+                if timed_out:
+                    result['error'] = "Timeout waiting for response"
+            if timed_out:
+                # A late result would be attributed to the next request
+                self._drop(conn)
+
+    def _stream_and_wait(self, conn, audio_path, chunk_size, result):
+        """Send a file chunk by chunk and block until its final `result`"""
+        conn.begin_request(result, Future(), StreamCollector(result))
+
+        if self.verbose:
+            print(f"  Streaming audio data...")
+        result['timings']['send_time'] = time.time()
+        chunks = 0
+        for payload in iter_stream_payloads(audio_path, chunk_size, result['phases']):
+            emit_start = time.time()
+            conn.sio.emit("audio_transmit", payload)
+            result['phases']['emit'] += time.time() - emit_start
+            result['bytes_sent'] += len(payload['audio'])
+            chunks += 1
+        if not conn.stream_sent(chunks):
+            return
+
+        deadline = result['timings']['send_time'] + self.timeout
+        while True:
+            try:
+                conn.future.result(timeout=STREAM_IDLE_TIMEOUT)
+                return
+            except FutureTimeoutError:
+                pass
+
+            if conn.check_stream(deadline):
+                self._drop(conn)
+                return
+            if conn.future.done():
+                return
+
+    def close(self):
+        """Disconnect every pooled connection"""
+        for conn in self._all:
+            self._drop(conn)
+        self._all = []
+        self._idle = queue.LifoQueue()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class AsyncPooledConnection(_PooledConnectionBase):
+    """asyncio counterpart of PooledConnection
+
+    Each connection carries at most one request at a time, so a
+    result_upload event always belongs to the request pending on the
+    connection it arrived on.
+    """
+
+    def __init__(self, url, verbose=True, event_hook=None):
+        # Handlers run on the event loop, between awaits, so no lock is needed
+        super().__init__(url, socketio.AsyncClient(ssl_verify=False, reconnection=False), nullcontext(),
+                         verbose, event_hook)
+
+    async def connect(self):
+        self._log('connecting', "Connecting to API...")
+        start = time.time()
+        await self.sio.connect(self.url, transports=["websocket"])
+        return self._handshake_done(start)
+
+    async def disconnect(self):
+        if self.sio.connected:
+            await self.sio.disconnect()
+        elif self._transport_open():
+            await self.sio.eio.disconnect(abort=True)
+
+
+class AsyncSTTClient(_PoolBase):
+    """asyncio pool of persistent connections to the STT server
+
+    Up to pool_size requests are in flight at once, one per connection.
+    Takes the same arguments as STTClient; all request methods are coroutines.
+    """
+
+    def __init__(self, url=SOCKET_URL, pool_size=POOL_SIZE, timeout=API_TIMEOUT,
+                 max_retries=1, verbose=True, event_hook=None):
+        super().__init__(url, pool_size, timeout, max_retries, verbose, event_hook)
+        self._idle = asyncio.LifoQueue()
+
+    # ---------- pool management ----------
+
+    async def _acquire(self):
+        if self._idle.empty() and len(self._all) < self.pool_size:
+            return self._new_connection(AsyncPooledConnection)
+        return await self._idle.get()
+
+    def _release(self, conn):
+        self._idle.put_nowait(conn)
+
+    async def _ensure_connected(self, conn):
+        if not self._needs_handshake(conn):
+            return 0.0
+        if conn.handshake_times:
+            await self._drop(conn)
+        return await conn.connect()
+
+    async def _drop(self, conn):
+        try:
+            await conn.disconnect()
+        except Exception:
+            pass
+
+    # ---------- requests ----------
+
+    async def transcribe(self, audio_path):
+        """Transcribe a single audio file; returns the same dict as STTClient.transcribe"""
+        result = new_result()
+        loop = asyncio.get_running_loop()
+
+        try:
+            # File I/O and base64 run off the event loop
+            payload = await loop.run_in_executor(None, build_upload_payload, audio_path, result['phases'])
+        except Exception as e:
+            result['error'] = str(e)
+            return result
+
+        return await self._run_request(result, lambda conn: self._send_and_wait(conn, payload, result))
+
+    async def transcribe_data(self, audio_data):
+        """Transcribe audio bytes built in memory; returns the same dict as STTClient.transcribe_data"""
+        result = new_result()
+        loop = asyncio.get_running_loop()
+        payload = await loop.run_in_executor(None, encode_upload_payload, audio_data, result['phases'])
+        return await self._run_request(result, lambda conn: self._send_and_wait(conn, payload, result))
+
+    async def transcribe_stream(self, audio_path, chunk_size=STREAM_CHUNK_SIZE):
+        """Stream a file through `audio_transmit`; returns the same dict as STTClient.transcribe_stream"""
+        result = new_result()
+        result['timings']['first_result_time'] = None
+
+        if not os.path.exists(audio_path):
+            result['error'] = f"File not found: {audio_path}"
+            return result
+
+        return await self._run_request(result, lambda conn: self._stream_and_wait(conn, audio_path, chunk_size, result))
+
+    async def _run_request(self, result, send):
+        self._count('requests')
+        attempts = 0
+
+        while True:
+            attempts += 1
+            conn = await self._acquire()
+            try:
+                self._connected(result, await self._ensure_connected(conn))
+                await send(conn)
+            except Exception as e:
+                result['error'] = str(e)
+                await self._drop(conn)
+            finally:
+                conn.end_request()
+                self._release(conn)
+
+            if not self._retry(result, attempts):
+                return self._finish(result)
+
+    async def _send_and_wait(self, conn, payload, result):
+        conn.begin_request(result, asyncio.get_running_loop().create_future())
+
+        result['timings']['send_time'] = time.time()
+        await conn.sio.emit("audio_transmit_upload", payload)
+        record_upload_emit(result, payload)
+
+        try:
+            await asyncio.wait_for(conn.future, self.timeout)
+        except asyncio.TimeoutError:
+            result['error'] = "Timeout waiting for response"
+            # A late result would be attributed to the next request
+            await self._drop(conn)
+
+    async def _stream_and_wait(self, conn, audio_path, chunk_size, result):
+        conn.begin_request(result, asyncio.get_running_loop().create_future(), StreamCollector(result))
+
+        result['timings']['send_time'] = time.time()
+        chunks = 0
+        for payload in iter_stream_payloads(audio_path, chunk_size, result['phases']):
+            emit_start = time.time()
+            await conn.sio.emit("audio_transmit", payload)
+            result['phases']['emit'] += time.time() - emit_start
+            result['bytes_sent'] += len(payload['audio'])
+            chunks += 1
+        if not conn.stream_sent(chunks):
+            return
+
+        deadline = result['timings']['send_time'] + self.timeout
+        while not conn.future.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(conn.future), STREAM_IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+            if conn.check_stream(deadline):
+                await self._drop(conn)
+                return
+
+    async def close(self):
+        for conn in self._all:
+            await self._drop(conn)
+        self._all = []
+        self._idle = asyncio.LifoQueue()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
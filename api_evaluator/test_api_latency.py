@@ -1,18 +1,54 @@
 """
 Test script to check API latency with a sample MP3 file
+
+With --sweep, runs a load test instead: a sample of the corpus is sent at
+concurrency 1, 2, 4, ... N and throughput, latency percentiles and error
+rate are recorded per level, together with the knee point where adding
+concurrency stops paying off.
+
+Usage:
+    python test_api_latency.py
+    python test_api_latency.py --sweep --max-concurrency 16 --sample 50
+    python test_api_latency.py --sweep --audio-dir ./test_audio --url http://127.0.0.1:9394
 """
 
-import base64
+import argparse
+import asyncio
+import csv
 import json
-import socketio
-import time
 import os
+import random
+import time
 from pathlib import Path
 from datetime import datetime
 
+from stt_client import STTClient, AsyncSTTClient
+from rate_controller import percentile
+from audio_probe import probe_duration
+
 # Configuration
 SOCKET_URL = "https://voice.bangla.gov.bd:9394"
 TEST_AUDIO_FILE = "./common_voice_bn_30704510.mp3"  # Place a sample MP3 file in this directory
+API_TIMEOUT = 120  # 2 minutes timeout
+
+# Extra requests sent on the already-open connection to show handshake savings
+WARM_RUNS = 1
+
+try:
+    from config import AUDIO_BASE_DIR, AUDIO_EXTENSIONS
+except ImportError:
+    AUDIO_BASE_DIR = r"D:\cv_eval_bn\validated"
+    AUDIO_EXTENSIONS = ['.wav', '.flac']
+
+# Concurrency sweep defaults
+SWEEP_MAX_CONCURRENCY = 16
+SWEEP_SAMPLE_SIZE = 50
+
+# Past the knee, doubling concurrency adds less than this fraction of throughput
+KNEE_MIN_GAIN = 0.10
+
+# Levels above this error rate do not count as usable capacity
+SWEEP_MAX_ERROR_RATE = 0.05
 
 
 def get_audio_duration_mp3(audio_path):
@@ -27,103 +63,17 @@ def get_audio_duration_mp3(audio_path):
         return None
 
 
-def transcribe_audio_with_timing(audio_path):
+def transcribe_audio_with_timing(audio_path, client):
     """Transcribe audio and measure timing"""
-    result = {
-        'success': False,
-        'data': None,
-        'error': None,
-        'timings': {
-            'start_time': None,
-            'connect_time': None,
-            'send_time': None,
-            'response_time': None,
-            'total_time': None
-        }
-    }
-    
-    # Create Socket.IO client
-    sio = socketio.Client(ssl_verify=False)
+    print(f"  Reading audio file and sending it...")
+    result = client.transcribe(audio_path)
     
-    # Event handlers
-    @sio.on('connect')
-    def on_connect():
-        result['timings']['connect_time'] = time.time()
+    if result['timings']['connect_time'] and result['timings']['start_time']:
         elapsed = result['timings']['connect_time'] - result['timings']['start_time']
-        print(f"  ✓ Connected to server (took {elapsed:.2f}s)")
-    
-    @sio.on('disconnect')
-    def on_disconnect():
-        print(f"  ✓ Disconnected from server")
-    
-    @sio.on('result_upload')
-    def on_result_upload(data):
-        result['timings']['response_time'] = time.time()
-        elapsed = result['timings']['response_time'] - result['timings']['send_time']
-        print(f"  ✓ Received response (took {elapsed:.2f}s)")
-        result['success'] = True
-        result['data'] = data
-        sio.disconnect()
+        state = "reused connection" if result['reused_connection'] else "new connection"
+        print(f"  ✓ Connection ready (took {elapsed:.2f}s, {state})")
     
-    @sio.on('connect_error')
-    def on_connect_error(error):
-        print(f"  ✗ Connection error: {error}")
-        result['error'] = f"Connection error: {error}"
-        result['success'] = False
-    
-    try:
-        result['timings']['start_time'] = time.time()
-        
-        # Read and encode audio file
-        print(f"  Reading audio file...")
-        with open(audio_path, 'rb') as f:
-            audio_data = f.read()
-        
-        file_size_mb = len(audio_data) / 1024 / 1024
-        print(f"  File size: {file_size_mb:.2f} MB")
-        
-        encoded_audio = base64.b64encode(audio_data).decode('utf-8')
-        
-        # Connect to API
-        print(f"  Connecting to API...")
-        sio.connect(SOCKET_URL, transports=["websocket"])
-        
-        # Send audio for transcription
-        payload = {
-            "index": 0,
-            "audio": encoded_audio,
-            "endOfStream": True
-        }
-        
-        print(f"  Sending audio data...")
-        result['timings']['send_time'] = time.time()
-        sio.emit("audio_transmit_upload", payload)
-        
-        # Wait for response (with timeout)
-        timeout = 120  # 2 minutes timeout
-        start_wait = time.time()
-        
-        while not result['success'] and not result['error']:
-            time.sleep(0.1)
-            if time.time() - start_wait > timeout:
-                result['error'] = "Timeout waiting for response"
-                break
-        
-        # Calculate total time
-        if result['timings']['response_time']:
-            result['timings']['total_time'] = result['timings']['response_time'] - result['timings']['start_time']
-        
-        # Ensure disconnection
-        if sio.connected:
-            sio.disconnect()
-        
-        return result
-        
-    except Exception as e:
-        result['error'] = str(e)
-        if sio.connected:
-            sio.disconnect()
-        return result
+    return result
 
 
 def extract_transcript_text(api_response):
@@ -139,7 +89,166 @@ def extract_transcript_text(api_response):
         return ""
 
 
-def main():
+def get_audio_duration(audio_path):
+    """Duration from the file's headers, size-based estimate if they cannot be read"""
+    duration = probe_duration(audio_path)
+    if duration is not None:
+        return duration
+    return get_audio_duration_mp3(audio_path)
+
+
+def sweep_levels(max_concurrency):
+    """Concurrency levels 1, 2, 4, ... up to and including max_concurrency"""
+    levels = []
+    level = 1
+    while level < max_concurrency:
+        levels.append(level)
+        level *= 2
+    levels.append(max_concurrency)
+    return levels
+
+
+def pick_sample(audio_dir, sample_size, seed=0):
+    """Pick a reproducible random sample of audio files from the corpus"""
+    files = [p for ext in AUDIO_EXTENSIONS for p in Path(audio_dir).rglob(f'*{ext}')]
+    files.sort()
+    if len(files) > sample_size:
+        files = random.Random(seed).sample(files, sample_size)
+    return files
+
+
+async def run_level(files, durations, concurrency, url):
+    """Send every sample file once with `concurrency` requests in flight"""
+    pending = iter(files)
+    results = []
+
+    async def worker():
+        for audio_file in pending:
+            result = await client.transcribe(str(audio_file))
+            results.append((audio_file, result))
+
+    async with AsyncSTTClient(url=url, pool_size=concurrency, timeout=API_TIMEOUT, verbose=False) as client:
+        start = time.time()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall_time = time.time() - start
+
+    ok = [(f, r) for f, r in results if r['success']]
+    latencies = [r['api_response_time'] for _, r in ok if r['api_response_time'] is not None]
+    audio_seconds = sum(durations.get(f) or 0 for f, _ in ok)
+
+    return {
+        'concurrency': concurrency,
+        'files': len(results),
+        'successful': len(ok),
+        'errors': len(results) - len(ok),
+        'error_rate': round((len(results) - len(ok)) / len(results), 4) if results else 0,
+        'wall_time_seconds': round(wall_time, 3),
+        'files_per_second': round(len(ok) / wall_time, 3) if wall_time else 0,
+        'audio_seconds_per_second': round(audio_seconds / wall_time, 3) if wall_time else 0,
+        'latency_p50': round(percentile(latencies, 50), 3) if latencies else None,
+        'latency_p90': round(percentile(latencies, 90), 3) if latencies else None,
+        'latency_p99': round(percentile(latencies, 99), 3) if latencies else None
+    }
+
+
+def find_knee(levels):
+    """Highest level whose throughput still grew by KNEE_MIN_GAIN over the previous level
+
+    Levels with an error rate above SWEEP_MAX_ERROR_RATE never qualify.
+    """
+    usable = [lv for lv in levels if lv['error_rate'] <= SWEEP_MAX_ERROR_RATE]
+    if not usable:
+        return None
+    knee = usable[0]
+    for level in usable[1:]:
+        if level['files_per_second'] < knee['files_per_second'] * (1 + KNEE_MIN_GAIN):
+            break
+        knee = level
+    return knee['concurrency']
+
+
+def print_sweep_table(levels, knee):
+    def fmt(value):
+        return f"{value:.2f}" if value is not None else "-"
+
+    print(f"{'conc':>5} {'files/s':>8} {'audio s/s':>10} {'p50':>7} {'p90':>7} {'p99':>7} {'errors':>7}")
+    print("-" * 80)
+    for lv in levels:
+        marker = "  <- knee" if lv['concurrency'] == knee else ""
+        print(f"{lv['concurrency']:>5} {lv['files_per_second']:>8.2f} {lv['audio_seconds_per_second']:>10.2f} "
+              f"{fmt(lv['latency_p50']):>7} {fmt(lv['latency_p90']):>7} {fmt(lv['latency_p99']):>7} "
+              f"{lv['error_rate']:>7.1%}{marker}")
+
+
+def run_sweep(args):
+    print("=" * 80)
+    print("STT API CONCURRENCY SWEEP")
+    print("=" * 80)
+    print(f"API endpoint: {args.url}")
+    print(f"Audio directory: {args.audio_dir}")
+
+    files = pick_sample(args.audio_dir, args.sample)
+    if not files:
+        print(f"ERROR: No audio files found in {args.audio_dir}")
+        return
+    durations = {f: get_audio_duration(f) for f in files}
+    levels_to_run = sweep_levels(args.max_concurrency)
+
+    print(f"Sample: {len(files)} files, {sum(d or 0 for d in durations.values()):.1f}s of audio")
+    print(f"Concurrency levels: {', '.join(str(c) for c in levels_to_run)}")
+    print("=" * 80)
+
+    levels = []
+    for concurrency in levels_to_run:
+        print(f"\nConcurrency {concurrency}...")
+        level = asyncio.run(run_level(files, durations, concurrency, args.url))
+        levels.append(level)
+        p99 = f"{level['latency_p99']:.2f}s" if level['latency_p99'] is not None else "-"
+        print(f"  {level['files_per_second']:.2f} files/s, p99 {p99}, errors {level['errors']}/{level['files']}")
+        if level['error_rate'] > 0.5:
+            print("  More than half the requests failed, stopping sweep")
+            break
+
+    knee = find_knee(levels)
+    # Throughput still growing at the last level run: the knee lies beyond what was measured
+    knee_at_limit = knee is not None and knee == levels[-1]['concurrency']
+
+    print("\n" + "=" * 80)
+    print("SWEEP RESULTS (latency = API response time in seconds)")
+    print("=" * 80)
+    print_sweep_table(levels, None if knee_at_limit else knee)
+    print("-" * 80)
+    if knee_at_limit:
+        print(f"No knee found up to --max-concurrency {args.max_concurrency}: throughput still grew "
+              f"by {KNEE_MIN_GAIN:.0%} or more at concurrency {knee}, the highest level tested")
+        print(f"Rerun with a larger value, e.g. --sweep --max-concurrency {knee * 2}")
+    elif knee:
+        print(f"Knee point: concurrency {knee} (more adds < {KNEE_MIN_GAIN:.0%} throughput)")
+        print(f"Suggested batch setting: python batch_transcribe_v2.py --concurrency {knee}")
+    else:
+        print(f"No level stayed under {SWEEP_MAX_ERROR_RATE:.0%} errors")
+
+    report = {
+        'url': args.url,
+        'audio_dir': str(args.audio_dir),
+        'sample_size': len(files),
+        'knee_concurrency': knee,
+        'knee_at_max_concurrency': knee_at_limit,
+        'timestamp': datetime.now().isoformat(),
+        'levels': levels
+    }
+    with open(f"{args.report}.json", 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    with open(f"{args.report}.csv", 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(levels[0].keys()))
+        writer.writeheader()
+        writer.writerows(levels)
+
+    print(f"\nReport saved to: {args.report}.json, {args.report}.csv")
+    print("=" * 80)
+
+
+def run_latency_test():
     print("=" * 80)
     print("STT API LATENCY TEST")
     print("=" * 80)
@@ -156,7 +265,7 @@ def main():
     # Get file info
     file_size = os.path.getsize(TEST_AUDIO_FILE)
     file_size_mb = file_size / 1024 / 1024
-    estimated_duration = get_audio_duration_mp3(TEST_AUDIO_FILE)
+    estimated_duration = get_audio_duration(TEST_AUDIO_FILE)
     
     print(f"File Information:")
     print(f"  Size: {file_size_mb:.2f} MB")
@@ -166,7 +275,16 @@ def main():
     
     # Run transcription test
     print("Starting transcription test...\n")
-    result = transcribe_audio_with_timing(TEST_AUDIO_FILE)
+    client = STTClient(url=SOCKET_URL, timeout=API_TIMEOUT)
+    result = transcribe_audio_with_timing(TEST_AUDIO_FILE, client)
+    
+    # Repeat on the warm connection: the difference is the handshake cost
+    warm_results = []
+    if result['success']:
+        for run in range(WARM_RUNS):
+            print(f"\nWarm run {run + 1}/{WARM_RUNS}...")
+            warm_results.append(transcribe_audio_with_timing(TEST_AUDIO_FILE, client))
+    client.close()
     
     print("\n" + "=" * 80)
     print("TEST RESULTS")
@@ -207,6 +325,16 @@ def main():
                 else:
                     print(f"  → Slower than real-time")
         
+        # Connection reuse
+        warm_totals = [r['timings']['total_time'] for r in warm_results if r['success']]
+        if warm_totals:
+            warm_avg = sum(warm_totals) / len(warm_totals)
+            print()
+            print(f"Warm total time:    {warm_avg:.2f}s (avg of {len(warm_totals)} reused-connection runs)")
+            avg_handshake, saved = client.handshake_savings()
+            print(f"Handshake cost:     {avg_handshake:.2f}s per new connection")
+            print(f"Handshake saved:    {saved:.2f}s over {len(warm_totals)} warm runs")
+        
         # Save test result
         test_result = {
             'test_file': TEST_AUDIO_FILE,
@@ -230,6 +358,24 @@ def main():
     print("=" * 80)
 
 
+def main():
+    parser = argparse.ArgumentParser(description="STT API latency test and concurrency sweep")
+    parser.add_argument('--sweep', action='store_true', help="Run the concurrency sweep load test")
+    parser.add_argument('--max-concurrency', type=int, default=SWEEP_MAX_CONCURRENCY,
+                        help=f"Highest concurrency level in the sweep (default: {SWEEP_MAX_CONCURRENCY})")
+    parser.add_argument('--sample', type=int, default=SWEEP_SAMPLE_SIZE,
+                        help=f"Number of corpus files sent per level (default: {SWEEP_SAMPLE_SIZE})")
+    parser.add_argument('--audio-dir', default=AUDIO_BASE_DIR, help="Corpus to sample from")
+    parser.add_argument('--url', default=SOCKET_URL, help="Socket.IO endpoint")
+    parser.add_argument('--report', default='sweep_report', help="Report path prefix (.json and .csv)")
+    args = parser.parse_args()
+
+    if args.sweep:
+        run_sweep(args)
+    else:
+        run_latency_test()
+
+
 if __name__ == "__main__":
     try:
         main()
@@ -3,17 +3,17 @@ Test script with enhanced debugging for API latency testing
 Helps diagnose connection and processing issues
 """
 
-import base64
 import json
-import socketio
-import time
 import os
 from pathlib import Path
 from datetime import datetime
 
+from stt_client import STTClient
+
 # Configuration
 SOCKET_URL = "https://voice.bangla.gov.bd:9394"
 TEST_AUDIO_FILE = "./common_voice_bn_30704510.mp3"  # Your test file
+API_TIMEOUT = 180  # 3 minutes timeout for large files
 
 # Try with smaller file size limit (in MB) - API might have size limits
 MAX_FILE_SIZE_MB = 10
@@ -32,155 +32,29 @@ def get_file_info(audio_path):
 
 def transcribe_audio_debug(audio_path):
     """Transcribe audio with detailed debugging"""
-    result = {
-        'success': False,
-        'data': None,
-        'error': None,
-        'timings': {
-            'start_time': None,
-            'connect_time': None,
-            'send_time': None,
-            'response_time': None,
-            'total_time': None
-        },
-        'events': []
-    }
-    
-    # Create Socket.IO client with more verbose logging
-    sio = socketio.Client(
-        ssl_verify=False,
-        logger=False,  # Set to True for even more debugging
-        engineio_logger=False
-    )
+    events = []
     
-    # Event handlers with detailed logging
-    @sio.on('connect')
-    def on_connect():
-        result['timings']['connect_time'] = time.time()
-        elapsed = result['timings']['connect_time'] - result['timings']['start_time']
-        msg = f"✓ Connected to server (took {elapsed:.2f}s)"
-        print(f"  {msg}")
-        result['events'].append(msg)
+    def record_event(event, message):
+        events.append(message)
     
-    @sio.on('disconnect')
-    def on_disconnect():
-        msg = "✓ Disconnected from server"
-        print(f"  {msg}")
-        result['events'].append(msg)
+    file_size_mb = os.path.getsize(audio_path) / 1024 / 1024
+    print(f"  File size: {file_size_mb:.2f} MB")
     
-    @sio.on('result_upload')
-    def on_result_upload(data):
-        result['timings']['response_time'] = time.time()
-        elapsed = result['timings']['response_time'] - result['timings']['send_time']
-        msg = f"✓ Received response (took {elapsed:.2f}s)"
-        print(f"  {msg}")
-        result['events'].append(msg)
-        result['success'] = True
-        result['data'] = data
-        sio.disconnect()
+    if file_size_mb > MAX_FILE_SIZE_MB:
+        print(f"  ⚠️  WARNING: File is larger than {MAX_FILE_SIZE_MB}MB - API might reject it")
     
-    @sio.on('result')
-    def on_result(data):
-        msg = "✓ Received streaming result"
-        print(f"  {msg}")
-        result['events'].append(msg)
-        # Note: This is for streaming, not upload
+    print(f"  Connecting to API: {SOCKET_URL}")
     
-    @sio.on('connect_error')
-    def on_connect_error(error):
-        msg = f"✗ Connection error: {error}"
-        print(f"  {msg}")
-        result['events'].append(msg)
-        result['error'] = f"Connection error: {error}"
-        result['success'] = False
+    # No retries: a debug run should surface the first failure as-is
+    with STTClient(url=SOCKET_URL, timeout=API_TIMEOUT, max_retries=0,
+                   event_hook=record_event) as client:
+        result = client.transcribe(audio_path)
     
-    @sio.on('error')
-    def on_error(error):
-        msg = f"✗ Socket error: {error}"
-        print(f"  {msg}")
-        result['events'].append(msg)
-        result['error'] = f"Socket error: {error}"
+    result['events'] = events
+    if result['error']:
+        events.append(f"Error: {result['error']}")
     
-    try:
-        result['timings']['start_time'] = time.time()
-        
-        # Read audio file
-        print(f"  Reading audio file...")
-        with open(audio_path, 'rb') as f:
-            audio_data = f.read()
-        
-        file_size_mb = len(audio_data) / 1024 / 1024
-        print(f"  File size: {file_size_mb:.2f} MB")
-        
-        if file_size_mb > MAX_FILE_SIZE_MB:
-            print(f"  ⚠️  WARNING: File is larger than {MAX_FILE_SIZE_MB}MB - API might reject it")
-        
-        # Encode audio
-        print(f"  Encoding audio to base64...")
-        encode_start = time.time()
-        encoded_audio = base64.b64encode(audio_data).decode('utf-8')
-        encode_time = time.time() - encode_start
-        print(f"  Encoding took {encode_time:.2f}s")
-        print(f"  Encoded size: {len(encoded_audio) / 1024 / 1024:.2f} MB")
-        
-        # Connect to API
-        print(f"  Connecting to API: {SOCKET_URL}")
-        connect_start = time.time()
-        sio.connect(SOCKET_URL, transports=["websocket"])
-        
-        # Wait a bit for connection to establish
-        time.sleep(0.5)
-        
-        if not sio.connected:
-            result['error'] = "Failed to connect to server"
-            return result
-        
-        # Prepare payload
-        payload = {
-            "index": 0,
-            "audio": encoded_audio,
-            "endOfStream": True
-        }
-        
-        print(f"  Sending audio data...")
-        result['timings']['send_time'] = time.time()
-        
-        # Emit the event
-        sio.emit("audio_transmit_upload", payload)
-        print(f"  Audio data sent, waiting for response...")
-        
-        # Wait for response with timeout
-        timeout = 180  # 3 minutes timeout for large files
-        start_wait = time.time()
-        
-        while not result['success'] and not result['error']:
-            time.sleep(0.5)
-            elapsed = time.time() - start_wait
-            
-            # Show progress every 5 seconds
-            if int(elapsed) % 5 == 0 and elapsed > 0:
-                print(f"  Still waiting... ({elapsed:.0f}s elapsed)")
-            
-            if elapsed > timeout:
-                result['error'] = f"Timeout after {timeout}s waiting for response"
-                break
-        
-        # Calculate total time
-        if result['timings']['response_time']:
-            result['timings']['total_time'] = result['timings']['response_time'] - result['timings']['start_time']
-        
-        # Ensure disconnection
-        if sio.connected:
-            sio.disconnect()
-        
-        return result
-        
-    except Exception as e:
-        result['error'] = str(e)
-        result['events'].append(f"Exception: {str(e)}")
-        if sio.connected:
-            sio.disconnect()
-        return result
+    return result
 
 
 def main():
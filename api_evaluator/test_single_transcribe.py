@@ -3,14 +3,13 @@ Test script to transcribe a single audio file
 Usage: python3 test_single_transcribe.py <path_to_wav_file>
 """
 
-import base64
 import json
-import socketio
-import time
 import sys
 import os
 from pathlib import Path
 
+from stt_client import STTClient
+
 # Import configuration
 try:
     from config_local import SOCKET_URL, API_TIMEOUT
@@ -21,6 +20,11 @@ except ImportError:
         SOCKET_URL = "https://voice.bangla.gov.bd:9394"
         API_TIMEOUT = 120
 
+try:
+    from config import TIMESTAMP_RATE
+except ImportError:
+    TIMESTAMP_RATE = 16000
+
 
 def transcribe_audio(audio_path):
     """Transcribe a single audio file using the STT API"""
@@ -31,39 +35,6 @@ def transcribe_audio(audio_path):
     print(f"API endpoint: {SOCKET_URL}")
     print(f"{'='*80}\n")
     
-    result = {
-        'success': False,
-        'data': None,
-        'error': None,
-        'api_response_time': None
-    }
-    
-    # Create Socket.IO client
-    sio = socketio.Client(ssl_verify=False)
-    
-    # Event handlers
-    @sio.on('connect')
-    def on_connect():
-        print("✓ Connected to STT server")
-    
-    @sio.on('disconnect')
-    def on_disconnect():
-        print("✓ Disconnected from server")
-    
-    @sio.on('result_upload')
-    def on_result_upload(data):
-        result['api_response_time'] = time.time() - result['send_time']
-        print(f"✓ Received transcription result (API took {result['api_response_time']:.2f}s)")
-        result['success'] = True
-        result['data'] = data
-        sio.disconnect()
-    
-    @sio.on('connect_error')
-    def on_connect_error(error):
-        print(f"✗ Connection error: {error}")
-        result['error'] = f"Connection error: {error}"
-        result['success'] = False
-    
     try:
         # Check if file exists
         if not os.path.exists(audio_path):
@@ -74,42 +45,15 @@ def transcribe_audio(audio_path):
         file_size = os.path.getsize(audio_path)
         print(f"File size: {file_size / 1024:.2f} KB")
         
-        # Read and encode audio file
-        print("Reading audio file...")
-        with open(audio_path, 'rb') as f:
-            audio_data = f.read()
-        
-        encoded_audio = base64.b64encode(audio_data).decode('utf-8')
-        print(f"✓ Audio encoded (base64 length: {len(encoded_audio)})")
-        
-        # Connect to API
-        print(f"\nConnecting to API...")
-        sio.connect(SOCKET_URL, transports=["websocket"])
-        
-        # Send audio for transcription
-        payload = {
-            "index": 0,
-            "audio": encoded_audio,
-            "endOfStream": True
-        }
-        
-        print(f"Sending audio data...")
-        result['send_time'] = time.time()
-        sio.emit("audio_transmit_upload", payload)
-        
-        # Wait for response (with timeout)
-        start_time = time.time()
-        
-        while not result['success'] and not result['error']:
-            time.sleep(0.1)
-            if time.time() - start_time > API_TIMEOUT:
-                result['error'] = "Timeout waiting for response"
-                print(f"✗ Timeout after {API_TIMEOUT}s")
-                break
+        # Read, encode and send through the shared STT client
+        print("Reading audio file and connecting to API...")
+        with STTClient(url=SOCKET_URL, timeout=API_TIMEOUT) as client:
+            result = client.transcribe(audio_path)
+            print()
+            client.print_stats()
         
-        # Ensure disconnection
-        if sio.connected:
-            sio.disconnect()
+        if result['error'] and result['error'].startswith('Timeout'):
+            print(f"✗ Timeout after {API_TIMEOUT}s")
         
         if result['success'] and result['data']:
             print(f"\n{'='*80}")
@@ -124,7 +68,7 @@ def transcribe_audio(audio_path):
                 
                 # Get duration
                 if words and 'timestamp' in words[-1]:
-                    duration = words[-1]['timestamp'][1] / 1000.0
+                    duration = words[-1]['timestamp'][1] / float(TIMESTAMP_RATE)
                     print(f"Audio duration: {duration:.2f}s")
             
             # Save JSON response
@@ -148,8 +92,6 @@ def transcribe_audio(audio_path):
         print(f"\n✗ Exception: {e}")
         import traceback
         traceback.print_exc()
-        if sio.connected:
-            sio.disconnect()
         return None
 
 
@@ -0,0 +1,123 @@
+"""
+Text normalization before scoring
+
+References (the .txt files, webapp_reference.csv) and hypotheses (the
+joined predicted_words) used to be compared exactly as written, so a danda,
+a ZWNJ, a decomposed য় or ২০২৩ against 2023 all counted as errors. These
+rules are applied to both sides before CER/WER, in this order:
+
+    unicode      NFC, so composed and decomposed forms of a letter are equal
+    zero_width   remove ZWJ, ZWNJ, zero-width space, word joiner, BOM, soft hyphen
+    digits       Bengali digits ০-৯ -> 0-9
+    punctuation  every Unicode punctuation character (। , - " ' ? ‘ ’ ...) -> space
+    case         lowercase (Latin words in transcripts)
+    whitespace   collapse runs of whitespace to one space, strip
+
+NORMALIZATION_RULES in config.py picks the rules. The character tables are
+built once per normalizer; normalize() keeps a bounded LRU cache of
+NORMALIZATION_CACHE_SIZE texts (keyed by the text, whose hash Python keeps on
+the string), since the same reference is scored against every model. There
+is no cache on disk: a text takes ~40us to normalize, a tenth of the cost
+of scoring it, so a lookup would save little and would go stale whenever
+the rules change. Run batch_scoring.py --rule-report to see how much each
+rule changes CER/WER on a corpus.
+
+Usage:
+    from text_normalization import normalize_text
+    normalize_text("সাহিত্য-জীবনের শুরু।")   # -> 'সাহিত্য জীবনের শুরু'
+"""
+
+import re
+import sys
+import unicodedata
+from functools import lru_cache
+
+# Every available rule, in the order they are applied
+RULES = ['unicode', 'zero_width', 'digits', 'punctuation', 'case', 'whitespace']
+
+try:
+    from config import NORMALIZATION_RULES
+except ImportError:
+    NORMALIZATION_RULES = list(RULES)
+
+try:
+    from config import NORMALIZATION_CACHE_SIZE
+except ImportError:
+    NORMALIZATION_CACHE_SIZE = 100000
+
+ZERO_WIDTH = '\u200b\u200c\u200d\u2060\ufeff\u00ad'
+BENGALI_DIGITS = '০১২৩৪৫৬৭৮৯'
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=1)
+def _punctuation_table():
+    """Every punctuation character (Unicode category P*) -> space; built on first use"""
+    return {code: ' ' for code in range(sys.maxunicode + 1) if unicodedata.category(chr(code)).startswith('P')}
+
+
+def _unicode_step():
+    def step(text):
+        return text if unicodedata.is_normalized('NFC', text) else unicodedata.normalize('NFC', text)
+    return step
+
+
+def _translate_step(table):
+    def step(text):
+        return text.translate(table)
+    return step
+
+
+def _whitespace_step():
+    def step(text):
+        return _WHITESPACE.sub(' ', text).strip()
+    return step
+
+
+_STEP_BUILDERS = {
+    'unicode': _unicode_step,
+    'zero_width': lambda: _translate_step(str.maketrans('', '', ZERO_WIDTH)),
+    'digits': lambda: _translate_step(str.maketrans(BENGALI_DIGITS, '0123456789')),
+    'punctuation': lambda: _translate_step(_punctuation_table()),
+    'case': lambda: str.lower,
+    'whitespace': _whitespace_step,
+}
+
+
+class TextNormalizer:
+    """Configured normalization rules with an LRU cache
+
+    Args:
+        rules: Rule names from RULES (default NORMALIZATION_RULES); always applied in RULES order
+        cache_size: Texts kept in the LRU cache (0 = no cache)
+    """
+
+    def __init__(self, rules=None, cache_size=NORMALIZATION_CACHE_SIZE):
+        rules = NORMALIZATION_RULES if rules is None else rules
+        unknown = set(rules) - set(RULES)
+        if unknown:
+            raise ValueError(f"Unknown normalization rules: {', '.join(sorted(unknown))} "
+                             f"(available: {', '.join(RULES)})")
+        self.rules = [name for name in RULES if name in rules]
+        self.steps = [(name, _STEP_BUILDERS[name]()) for name in self.rules]
+        self.normalize = lru_cache(maxsize=cache_size)(self._normalize) if cache_size else self._normalize
+
+    def _normalize(self, text):
+        for _, step in self.steps:
+            text = step(text)
+        return text
+
+    def cache_info(self):
+        return self.normalize.cache_info() if hasattr(self.normalize, 'cache_info') else None
+
+
+@lru_cache(maxsize=1)
+def default_normalizer():
+    """The normalizer configured in config.py, built once per process"""
+    return TextNormalizer()
+
+
+def normalize_text(text):
+    """text with the configured rules applied"""
+    return default_normalizer().normalize(text)